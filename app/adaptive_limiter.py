@@ -0,0 +1,161 @@
+# app/adaptive_limiter.py
+"""
+Адаптивный лимит параллельности для массовых операций по аккаунтам (AIMD).
+
+    limiter = get_limiter("twofa", initial=5, max_limit=20)
+    results = await asyncio.gather(*(limiter.run(handle_one, acc) for acc in accounts))
+
+- успех, уложившийся в latency_target_sec (если он задан), — additive increase:
+  +1 к лимиту примерно за каждые `limit` успешных операций;
+- перегрузка (FloodWait, таймаут, ошибка прокси/соединения) — multiplicative decrease:
+  лимит умножается на decrease_factor, но не чаще раза на «поколение» — операции,
+  начатые до последнего снижения, его уже не снижают;
+- прочие ошибки (бан, неверный пароль, …) лимит не трогают.
+
+Операции, которые сами ловят исключения, сообщают о перегрузке через
+report_overload(exc) — он находит текущий слот через contextvar. FloodWait,
+прошедший через FloodScheduler, отмечается автоматически.
+
+Текущий лимит виден в limiter.limit / stats(), изменения пишутся в лог.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import time
+from typing import Awaitable, Callable
+
+from telethon.errors import FloodWaitError
+
+_CURRENT_SLOT: contextvars.ContextVar["_Slot | None"] = contextvars.ContextVar("adaptive_limiter_slot", default=None)
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """Ошибки, которые говорят «слишком много параллельно»: FloodWait, таймауты, прокси/соединение."""
+    if isinstance(exc, (FloodWaitError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    name = type(exc).__name__
+    return "Proxy" in name or "Timeout" in name
+
+
+def report_overload(reason: BaseException | str | None = None) -> None:
+    """Отметить текущую операцию (внутри limiter.slot()/run()) как перегрузку. Вне слота — no-op."""
+    slot = _CURRENT_SLOT.get()
+    if slot is not None:
+        slot.overloaded(reason)
+
+
+class _Slot:
+    __slots__ = ("limiter", "started", "overload", "token")
+
+    def __init__(self, limiter: "AdaptiveLimiter"):
+        self.limiter = limiter
+        self.started = 0.0
+        self.overload: str | None = None
+        self.token = None
+
+    def overloaded(self, reason: BaseException | str | None = None) -> None:
+        if self.overload is None:
+            self.overload = type(reason).__name__ if isinstance(reason, BaseException) else (reason or "overload")
+
+    async def __aenter__(self) -> "_Slot":
+        await self.limiter._acquire()
+        self.started = time.monotonic()
+        self.token = _CURRENT_SLOT.set(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        _CURRENT_SLOT.reset(self.token)
+        if exc is not None and is_overload_error(exc):
+            self.overloaded(exc)
+        await self.limiter._release(self, failed=exc is not None)
+        return False
+
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, initial: int = 5, min_limit: int = 1, max_limit: int = 20,
+                 decrease_factor: float = 0.5, latency_target_sec: float | None = None):
+        self.name = name
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.decrease_factor = min(0.95, max(0.1, float(decrease_factor)))
+        self.latency_target_sec = latency_target_sec
+        self._limit = float(min(self.max_limit, max(self.min_limit, int(initial))))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+        self.completed = 0
+        self.overloads = 0
+        self.errors = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def slot(self) -> _Slot:
+        return _Slot(self)
+
+    async def run(self, fn: Callable[..., Awaitable], *args, **kwargs):
+        async with self.slot():
+            return await fn(*args, **kwargs)
+
+    async def _acquire(self) -> None:
+        async with self._cond:
+            while self._in_flight >= self.limit:
+                await self._cond.wait()
+            self._in_flight += 1
+
+    async def _release(self, slot: _Slot, failed: bool) -> None:
+        async with self._cond:
+            self._in_flight -= 1
+            before = self.limit
+            latency = time.monotonic() - slot.started
+            if slot.overload is not None:
+                self.overloads += 1
+                if slot.started >= self._last_decrease:
+                    self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+                    self._last_decrease = time.monotonic()
+            elif failed:
+                self.errors += 1
+            else:
+                self.completed += 1
+                if self.latency_target_sec is None or latency <= self.latency_target_sec:
+                    self._limit = min(float(self.max_limit), self._limit + 1.0 / max(1.0, self._limit))
+            if self.limit != before:
+                why = slot.overload or f"{latency:.1f}s ok"
+                print(f"[LIMITER] {self.name}: {before} → {self.limit} ({why})", flush=True)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "completed": self.completed,
+            "overloads": self.overloads,
+            "errors": self.errors,
+        }
+
+
+_LIMITERS: dict[str, AdaptiveLimiter] = {}
+
+
+def get_limiter(name: str, initial: int = 5, max_limit: int = 20, **kwargs) -> AdaptiveLimiter:
+    """Один лимитер на операцию на процесс: выученный лимит переживает между запусками задачи.
+
+    initial/max_limit можно переопределить в ADAPTIVE_LIMITS ({"twofa": [5, 20]}).
+    """
+    limiter = _LIMITERS.get(name)
+    if limiter is None:
+        from config import ADAPTIVE_LIMITS
+        initial, max_limit = ADAPTIVE_LIMITS.get(name, (initial, max_limit))
+        limiter = _LIMITERS[name] = AdaptiveLimiter(name, initial=initial, max_limit=max_limit, **kwargs)
+    return limiter
+
+
+def limiters_stats() -> dict[str, dict]:
+    return {name: limiter.stats() for name, limiter in _LIMITERS.items()}
@@ -1,12 +1,16 @@
-import psycopg2, json, os
+import psycopg2, json, os, threading, time
 from psycopg2.extras import RealDictCursor, Json
 from datetime import datetime, timezone
 from contextlib import contextmanager
+from collections import OrderedDict
 from dotenv import load_dotenv
 load_dotenv()
 from typing import List, Dict, Any
 
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from app.db_pool import init_pool, get_pool, close_pool
+from psycopg2 import sql
+from psycopg2.extras import execute_values
 
 
 def _req(name: str) -> str:
@@ -40,11 +44,103 @@ def _build_db_config() -> dict:
 DB_CONFIG = _build_db_config()
 
 
+def init_db_pool():
+    """
+    Поднимает пул соединений (вызывается один раз на старте bot.main()).
+    После этого все хелперы ниже берут соединения из пула, а conn.close() возвращает их обратно.
+    """
+    from config import DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_MAX_IDLE, DB_CONNECT_TIMEOUT
+    return init_pool(
+        DB_CONFIG,
+        minconn=DB_POOL_MIN,
+        maxconn=DB_POOL_MAX,
+        timeout=DB_POOL_TIMEOUT,
+        max_idle=DB_POOL_MAX_IDLE,
+        connect_timeout=DB_CONNECT_TIMEOUT,
+    )
+
+def close_db_pool():
+    close_pool()
+
+def get_direct_connection():
+    """Отдельное соединение мимо пула (для session-level advisory locks и т.п.)."""
+    return psycopg2.connect(**DB_CONFIG)
+
+# буфер логов задач (app/log_sink.py); None — пишем построчно, как раньше
+_LOG_SINK = None
+
+def set_log_sink(sink):
+    global _LOG_SINK
+    _LOG_SINK = sink
+
+def _buffered_log(table: str, row: tuple) -> bool:
+    """True — строка ушла в буфер sink'а и будет записана пачкой."""
+    sink = _LOG_SINK
+    if sink is not None and sink.accepts():
+        sink.put(table, row)
+        return True
+    return False
+
+def insert_log_rows(table: str, columns: tuple, rows: list[tuple], page_size: int = 500):
+    """Многострочный INSERT ... VALUES для пачки логов (используется log_sink)."""
+    if not rows:
+        return
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+                sql.Identifier(table),
+                sql.SQL(", ").join(map(sql.Identifier, columns)),
+            )
+            execute_values(cur, query.as_string(cur), rows, page_size=page_size)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def insert_log_rows_each(table: str, columns: tuple, rows: list[tuple]) -> list[tuple[tuple, str]]:
+    """
+    Построчная вставка пачки, которую отверг multi-row INSERT: каждая строка под своим
+    SAVEPOINT, битые (FK/CHECK/тип) не валят остальные. Возвращает [(строка, ошибка)].
+    """
+    rejected = []
+    if not rows:
+        return rejected
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            query = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+                sql.Identifier(table),
+                sql.SQL(", ").join(map(sql.Identifier, columns)),
+                sql.SQL(", ").join(sql.Placeholder() * len(columns)),
+            )
+            for row in rows:
+                cur.execute("SAVEPOINT log_row")
+                try:
+                    cur.execute(query, row)
+                except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT log_row")
+                    rejected.append((row, str(e).strip()))
+                else:
+                    cur.execute("RELEASE SAVEPOINT log_row")
+        conn.commit()
+        return rejected
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
 def get_connection(): 
-    return psycopg2.connect(**DB_CONFIG) 
+    pool = get_pool()
+    if pool is None:
+        # пул не поднят (скрипты/миграции вне bot.main) — старое поведение
+        return get_direct_connection()
+    return pool.getconn()
 def get_db_connection(): 
-    return psycopg2.connect(**DB_CONFIG) 
+    return get_connection()
 def get_conn(): 
     # алиас для совместимости со вставками twofa 
     return get_connection()
@@ -58,6 +154,105 @@ def get_all_accounts():
     conn.close()
     return result
 
+ACCOUNT_LIST_COLUMNS = "id, phone, username, status"
+
+# Проекции accounts под конкретные экраны — без многокилобайтного session_string там, где он не нужен
+ACCOUNT_PICKER_COLUMNS = ("id", "phone", "username", "status", "group_id")
+ACCOUNT_CONNECT_COLUMNS = (
+    "id", "phone", "username", "status", "group_id", "api_key_id", "session_string",
+    "proxy_type", "proxy_host", "proxy_port", "proxy_username", "proxy_password",
+)
+# мета-колонки устройства добавляются ensure_accounts_metadata_columns() и могут отсутствовать
+ACCOUNT_DEVICE_COLUMNS = ("device_model", "system_version", "app_version", "lang_code", "system_lang_code")
+
+_ACCOUNT_COLUMNS_CACHE: set[str] | None = None
+
+def _existing_account_columns(cur) -> set[str]:
+    global _ACCOUNT_COLUMNS_CACHE
+    if _ACCOUNT_COLUMNS_CACHE is None or not set(ACCOUNT_DEVICE_COLUMNS) <= _ACCOUNT_COLUMNS_CACHE:
+        cur.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = 'accounts'
+        """)
+        _ACCOUNT_COLUMNS_CACHE = {r[0] for r in cur.fetchall()}
+    return _ACCOUNT_COLUMNS_CACHE
+
+def get_accounts_for_picker(status: str | None = None):
+    """Лёгкая проекция для клавиатур выбора аккаунтов: id/phone/username/status/group_id."""
+    cols = sql.SQL(", ").join(map(sql.Identifier, ACCOUNT_PICKER_COLUMNS))
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if status:
+                cur.execute(sql.SQL("SELECT {} FROM accounts WHERE status = %s ORDER BY id").format(cols), (status,))
+            else:
+                cur.execute(sql.SQL("SELECT {} FROM accounts ORDER BY id").format(cols))
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+def get_accounts_connect_view(account_ids: list[int]):
+    """
+    Всё, что нужно для подключения Telethon-клиента: session + прокси + мета устройства.
+    Порядок результата — как в account_ids.
+    """
+    ids = [int(i) for i in account_ids]
+    if not ids:
+        return []
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            existing = _existing_account_columns(cur)
+            names = list(ACCOUNT_CONNECT_COLUMNS) + [c for c in ACCOUNT_DEVICE_COLUMNS if c in existing]
+            cur.execute(
+                sql.SQL("SELECT {} FROM accounts WHERE id = ANY(%s)").format(
+                    sql.SQL(", ").join(map(sql.Identifier, names))
+                ),
+                (ids,),
+            )
+            by_id = {r["id"]: r for r in cur.fetchall()}
+        return [by_id[i] for i in ids if i in by_id]
+    finally:
+        conn.close()
+
+def count_accounts() -> int:
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM accounts;")
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+def get_accounts_page(limit: int = 20, after_id: int | None = None,
+                      before_id: int | None = None, last: bool = False):
+    """
+    Keyset-пагинация списка аккаунтов по PK (только колонки для отображения):
+      after_id  — следующая страница: id > after_id;
+      before_id — предыдущая страница: id < before_id;
+      last=True — последняя страница.
+    Строки всегда возвращаются по возрастанию id.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if before_id is not None:
+                cur.execute(
+                    f"SELECT {ACCOUNT_LIST_COLUMNS} FROM accounts WHERE id < %s ORDER BY id DESC LIMIT %s;",
+                    (before_id, limit),
+                )
+                return list(reversed(cur.fetchall()))
+            if last:
+                cur.execute(f"SELECT {ACCOUNT_LIST_COLUMNS} FROM accounts ORDER BY id DESC LIMIT %s;", (limit,))
+                return list(reversed(cur.fetchall()))
+            cur.execute(
+                f"SELECT {ACCOUNT_LIST_COLUMNS} FROM accounts WHERE id > %s ORDER BY id LIMIT %s;",
+                (after_id or 0, limit),
+            )
+            return cur.fetchall()
+    finally:
+        conn.close()
+
 def get_account_by_id(account_id):
     conn = get_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
@@ -81,6 +276,15 @@ def get_available_api_key():
     conn.close()
     return result
 
+def get_api_key_by_id(api_key_id: int):
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT * FROM api_keys WHERE id = %s", (api_key_id,))
+            return cur.fetchone()
+    finally:
+        conn.close()
+
 def increment_api_key_usage(api_key_id):
     conn = get_connection()
     cur = conn.cursor()
@@ -644,9 +848,11 @@ def get_available_accounts():
 
 def get_tasks_by_parent(parent_id):
     conn = get_connection()
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute("SELECT * FROM tasks WHERE parent_id = %s ORDER BY id", (parent_id,))
-        return cur.fetchall()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT * FROM tasks WHERE parent_id = %s ORDER BY id", (parent_id,))
+            return cur.fetchall()
+    finally:
         conn.close()
 
     
@@ -842,6 +1048,110 @@ def update_proxy_status_by_id(proxy_id, status):
     cur.close()
     conn.close()
 
+def update_proxy_statuses_bulk(statuses: list[tuple[int, str]]):
+    """Один UPDATE ... FROM (VALUES ...) вместо update_proxy_status_by_id на каждый прокси."""
+    if not statuses:
+        return 0
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                UPDATE proxies AS p
+                SET status = v.status
+                FROM (VALUES %s) AS v(id, status)
+                WHERE p.id = v.id
+            """, [(int(pid), status) for pid, status in statuses], template="(%s::integer, %s::varchar)")
+            updated = cur.rowcount
+        conn.commit()
+        return updated
+    finally:
+        conn.close()
+
+# Колонки статистики проверок прокси (задержки по EWMA, счётчики успехов) — миграция 2 в app/migrations.py.
+PROXY_STATS_SCHEMA = [
+    """
+    ALTER TABLE public.proxies
+        ADD COLUMN IF NOT EXISTS last_connect_ms   REAL,
+        ADD COLUMN IF NOT EXISTS last_handshake_ms REAL,
+        ADD COLUMN IF NOT EXISTS avg_connect_ms    REAL,
+        ADD COLUMN IF NOT EXISTS avg_handshake_ms  REAL,
+        ADD COLUMN IF NOT EXISTS checks_total      INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS checks_ok         INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS last_checked_at   TIMESTAMPTZ
+    """,
+]
+
+def record_proxy_checks_bulk(results: list[tuple], alpha: float = 0.3):
+    """
+    Записывает результаты проверок одним UPDATE ... FROM (VALUES ...).
+    results: [(proxy_id, ok, connect_ms | None, handshake_ms | None), ...]
+    Статус -> working/bad, счётчики += 1, средние задержки — EWMA с весом alpha
+    (обновляются только по успешным пробам, у которых есть замер).
+    """
+    if not results:
+        return 0
+    rows = [
+        (int(pid), bool(ok), None if c is None else float(c), None if h is None else float(h))
+        for pid, ok, c, h in results
+    ]
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            query = sql.SQL("""
+                UPDATE proxies AS p
+                SET status            = CASE WHEN v.ok THEN 'working' ELSE 'bad' END,
+                    checks_total      = p.checks_total + 1,
+                    checks_ok         = p.checks_ok + v.ok::int,
+                    last_checked_at   = NOW(),
+                    last_connect_ms   = v.connect_ms,
+                    last_handshake_ms = v.handshake_ms,
+                    avg_connect_ms    = CASE
+                        WHEN NOT v.ok OR v.connect_ms IS NULL THEN p.avg_connect_ms
+                        WHEN p.avg_connect_ms IS NULL THEN v.connect_ms
+                        ELSE p.avg_connect_ms * (1 - {alpha}) + v.connect_ms * {alpha}
+                    END,
+                    avg_handshake_ms  = CASE
+                        WHEN NOT v.ok OR v.handshake_ms IS NULL THEN p.avg_handshake_ms
+                        WHEN p.avg_handshake_ms IS NULL THEN v.handshake_ms
+                        ELSE p.avg_handshake_ms * (1 - {alpha}) + v.handshake_ms * {alpha}
+                    END
+                FROM (VALUES %s) AS v(id, ok, connect_ms, handshake_ms)
+                WHERE p.id = v.id
+            """).format(alpha=sql.Literal(float(alpha)))
+            execute_values(cur, query, rows, template="(%s::integer, %s::boolean, %s::real, %s::real)")
+            updated = cur.rowcount
+        conn.commit()
+        return updated
+    finally:
+        conn.close()
+
+def get_ranked_proxies(min_success_ratio: float = 0.8):
+    """
+    Рабочие прокси от самого быстрого к самому медленному.
+    score = (avg_connect_ms + avg_handshake_ms) / success_ratio;
+    прокси без замеров задержки — в конце списка.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT s.*,
+                       (COALESCE(avg_connect_ms, 0) + COALESCE(avg_handshake_ms, 0))
+                           / GREATEST(ratio, 0.01) AS score
+                FROM (
+                    SELECT p.*,
+                           CASE WHEN p.checks_total > 0
+                                THEN p.checks_ok::float / p.checks_total ELSE 1.0 END AS ratio
+                    FROM proxies p
+                    WHERE p.status = 'working'
+                ) s
+                WHERE ratio >= %s
+                ORDER BY (avg_connect_ms IS NULL), score, id;
+            """, (float(min_success_ratio),))
+            return cur.fetchall()
+    finally:
+        conn.close()
+
 def delete_proxy_by_id(proxy_id):
     conn = get_connection()
     cur = conn.cursor()
@@ -875,6 +1185,21 @@ def count_accounts_using_proxy(host, port, username=None, password=None):
     conn.close()
     return count
 
+def count_accounts_per_proxy() -> dict[tuple, int]:
+    """(host, port, username, password) -> число аккаунтов на прокси; один запрос на все прокси."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT proxy_host, proxy_port, proxy_username, proxy_password, COUNT(*)
+                  FROM accounts
+                 WHERE proxy_host IS NOT NULL
+                 GROUP BY proxy_host, proxy_port, proxy_username, proxy_password
+            """)
+            return {(h, p, u, pw): n for h, p, u, pw, n in cur.fetchall()}
+    finally:
+        conn.close()
+
 def proxy_exists(host, port, username=None, password=None):
     conn = get_connection()
     cur = conn.cursor()
@@ -993,6 +1318,8 @@ def get_task_del_logs_by_task_id(task_id: int):
     return rows
 
 def insert_task_create_log(task_id: int, account_id: int, log_text: str):
+    if _buffered_log("task_create", (task_id, account_id, log_text)):
+        return
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
@@ -1026,6 +1353,17 @@ def delete_task_create_logs_by_task_id(task_id):
 def log_check_group(task_id, account, group_link, result, members=None, error=None):
     if task_id is None:
         return  # Просто не пишем лог если нет task_id
+    row = (
+        task_id,
+        account.get("id"),
+        account.get("username") or account.get("phone"),
+        group_link,
+        result,   # "ok", "small", "bad", "error"
+        members,
+        error
+    )
+    if _buffered_log("check_groups_log", row):
+        return
     conn = get_connection()
     cur = conn.cursor()
     cur.execute(
@@ -1034,15 +1372,7 @@ def log_check_group(task_id, account, group_link, result, members=None, error=No
             (task_id, account_id, account_username, checked_group, result, members, error_message)
         VALUES (%s, %s, %s, %s, %s, %s, %s)
         """,
-        (
-            task_id,
-            account.get("id"),
-            account.get("username") or account.get("phone"),
-            group_link,
-            result,   # "ok", "small", "bad", "error"
-            members,
-            error
-        )
+        row
     )
     conn.commit()
     cur.close()
@@ -1052,7 +1382,7 @@ def log_check_group(task_id, account, group_link, result, members=None, error=No
 def log_spambot_message(account_id, from_who, message):
     from_who = from_who[:16]
     now = datetime.now()
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 "INSERT INTO spambot_logs (account_id, timestamp, from_who, message) VALUES (%s, %s, %s, %s)",
@@ -1061,7 +1391,7 @@ def log_spambot_message(account_id, from_who, message):
         conn.commit()
 
 def has_spambot_log(account_id):
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 "SELECT COUNT(*) FROM spambot_logs WHERE account_id = %s", (account_id,)
@@ -1070,7 +1400,7 @@ def has_spambot_log(account_id):
             return count > 0
 
 def get_spambot_log(account_id):
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 "SELECT timestamp, from_who, message FROM spambot_logs WHERE account_id = %s ORDER BY timestamp",
@@ -1083,7 +1413,7 @@ def get_spambot_log(account_id):
             
 #Функция для получения лога из базы
 def get_spambot_logs_for_account(account_id):
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 "SELECT timestamp, from_who, message FROM spambot_logs WHERE account_id=%s ORDER BY timestamp",
@@ -1096,7 +1426,7 @@ def get_spambot_logs_for_account(account_id):
             ]
             
 def create_account_group(name, emoji):
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 "INSERT INTO account_groups (name, emoji) VALUES (%s, %s) RETURNING id",
@@ -1105,13 +1435,13 @@ def create_account_group(name, emoji):
             return cur.fetchone()[0]
 
 def get_account_groups():
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT id, name, emoji FROM account_groups ORDER BY id")
             return [{"id": row[0], "name": row[1], "emoji": row[2]} for row in cur.fetchall()]
 
 def get_account_groups_with_count():
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT g.id, g.name, g.emoji, COUNT(a.id) as count
@@ -1233,6 +1563,8 @@ def update_task_progress(task_id, processed_keywords, total_keywords, groups_fou
     conn.close()
 
 def insert_join_groups_log(task_id, account_id, group_link, status, message=None):
+    if _buffered_log("join_groups_log", (task_id, account_id, group_link, status, message)):
+        return
     conn = get_connection()
     cur = conn.cursor()
     cur.execute(
@@ -1243,6 +1575,40 @@ def insert_join_groups_log(task_id, account_id, group_link, status, message=None
     cur.close()
     conn.close()
 
+def update_join_groups_log_status(task_id, account_id, group_link, from_status, to_status, message=None):
+    """Переклассифицировать уже записанную строку лога (напр., капча пришла после вступления). True — строка нашлась."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE join_groups_log SET status = %s, message = COALESCE(%s, message)
+         WHERE id = (
+            SELECT id FROM join_groups_log
+             WHERE task_id = %s AND account_id = %s AND group_link = %s AND status = %s
+             ORDER BY id DESC LIMIT 1
+         )
+        """,
+        (to_status, message, task_id, account_id, group_link, from_status)
+    )
+    updated = cur.rowcount > 0
+    conn.commit()
+    cur.close()
+    conn.close()
+    return updated
+
+def get_join_groups_progress(task_id: int) -> list[tuple]:
+    """(account_id, group_link, status, message) уже обработанных ссылок задачи — для продолжения после рестарта."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT account_id, group_link, status, message FROM join_groups_log WHERE task_id = %s ORDER BY id",
+                (task_id,),
+            )
+            return cur.fetchall()
+    finally:
+        conn.close()
+
 def get_join_groups_logs(task_id):
     conn = get_connection()
     cur = conn.cursor()
@@ -1317,6 +1683,29 @@ def update_task_payload(task_id, payload: dict):
     cur.close()
     conn.close()
     
+def merge_task_progress(task_id: int, fields: dict, column: str = "payload") -> None:
+    """
+    Частичное обновление прогресса (app/progress.py): в JSON колонки дописываются только
+    переданные ключи (jsonb ||), остальное содержимое payload/progress не переписывается.
+    column: "payload" (jsonb) или "progress" (text с JSON).
+    """
+    if not fields:
+        return
+    if column == "payload":
+        q = "UPDATE tasks SET payload = COALESCE(payload, '{}'::jsonb) || %s::jsonb WHERE id = %s"
+    elif column == "progress":
+        q = ("UPDATE tasks SET progress = (COALESCE(NULLIF(progress, '')::jsonb, '{}'::jsonb) || %s::jsonb)::text"
+             " WHERE id = %s")
+    else:
+        raise ValueError(f"unknown progress column: {column}")
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(q, (json.dumps(fields, ensure_ascii=False, default=str), task_id))
+        conn.commit()
+    finally:
+        conn.close()
+
 def get_task_progress_and_status(task_id):
     conn = get_connection()
     cur = conn.cursor()
@@ -1357,6 +1746,8 @@ def create_like_comments_task(created_by: int, payload: dict = None) -> int:
     return task_id
 
 def insert_like_log(task_id: int, account_id: int, channel: str, post_id: int, comment_id: int, reaction: str, status: str, message: str = None):
+    if _buffered_log("like_comments_log", (task_id, account_id, channel, post_id, comment_id, reaction, status, message)):
+        return
     conn = get_connection()
     cur = conn.cursor()
     cur.execute(
@@ -1418,14 +1809,47 @@ def upsert_like_watch_state(task_id:int, account_id:int, channel:str, last_post_
     """, (task_id, account_id, channel, last_post_id))
     conn.commit(); cur.close(); conn.close()
 
-def reacted_already(task_id:int, account_id:int, channel:str, post_id:int, comment_id:int) -> bool:
+# ---------- Индекс «уже отреагировали» для like-comments ----------
+# Вместо SELECT на каждый комментарий: при первом обращении к (task, account, channel)
+# одним запросом грузим все его (post_id, comment_id) в set, дальше проверка — в памяти,
+# insert_like_reaction дописывает и в БД, и в set. Пара id упакована в одно int
+# (id сообщений в Telegram 32-битные). Аналогично like_liked_posts по (task, channel).
+
+_LIKE_INDEX_MAX_KEYS = 5000  # сколько (task, account, channel) держим; старые вытесняются
+_LIKE_INDEX_LOCK = threading.Lock()
+_LIKE_REACTED: "OrderedDict[tuple, set[int]]" = OrderedDict()
+_LIKED_POSTS: "OrderedDict[tuple, set[int]]" = OrderedDict()
+
+def _pack_ids(post_id: int, comment_id: int) -> int:
+    return (int(post_id) << 32) | (int(comment_id) & 0xFFFFFFFF)
+
+def _like_index_get(index: OrderedDict, key: tuple, load) -> set[int]:
+    with _LIKE_INDEX_LOCK:
+        ids = index.get(key)
+        if ids is not None:
+            index.move_to_end(key)
+            return ids
+    ids = load()  # запрос — вне лока; при гонке выиграет первый загруженный set
+    with _LIKE_INDEX_LOCK:
+        ids = index.setdefault(key, ids)
+        index.move_to_end(key)
+        while len(index) > _LIKE_INDEX_MAX_KEYS:
+            index.popitem(last=False)
+        return ids
+
+def _load_reacted(task_id: int, account_id: int, channel: str) -> set[int]:
     conn = get_connection(); cur = conn.cursor()
-    cur.execute("""SELECT 1 FROM like_reactions
-                   WHERE task_id=%s AND account_id=%s AND channel_username=%s AND post_id=%s AND comment_id=%s""",
-                (task_id, account_id, channel, post_id, comment_id))
-    ok = cur.fetchone() is not None
+    cur.execute("""SELECT post_id, comment_id FROM like_reactions
+                   WHERE task_id=%s AND account_id=%s AND channel_username=%s""",
+                (task_id, account_id, channel))
+    ids = {_pack_ids(p, c) for p, c in cur.fetchall()}
     cur.close(); conn.close()
-    return ok
+    return ids
+
+def reacted_already(task_id:int, account_id:int, channel:str, post_id:int, comment_id:int) -> bool:
+    ids = _like_index_get(_LIKE_REACTED, (task_id, account_id, channel),
+                          lambda: _load_reacted(task_id, account_id, channel))
+    return _pack_ids(post_id, comment_id) in ids
 
 def insert_like_reaction(task_id:int, account_id:int, channel:str, post_id:int, comment_id:int):
     conn = get_connection(); cur = conn.cursor()
@@ -1434,6 +1858,17 @@ def insert_like_reaction(task_id:int, account_id:int, channel:str, post_id:int,
                    ON CONFLICT DO NOTHING""",
                 (task_id, account_id, channel, post_id, comment_id))
     conn.commit(); cur.close(); conn.close()
+    with _LIKE_INDEX_LOCK:
+        ids = _LIKE_REACTED.get((task_id, account_id, channel))
+        if ids is not None:
+            ids.add(_pack_ids(post_id, comment_id))
+
+def forget_like_index(task_id: int) -> None:
+    """Выгрузить индекс задачи из памяти (задача завершена/остановлена)."""
+    with _LIKE_INDEX_LOCK:
+        for index in (_LIKE_REACTED, _LIKED_POSTS):
+            for key in [k for k in index if k[0] == task_id]:
+                del index[key]
 
 # (опционально, для «докидывания» каналов в задачу прямо в payload JSONB)
 def append_channels_to_like_task(task_id:int, new_channels:list[str]):
@@ -1463,13 +1898,15 @@ def append_channels_to_like_task(task_id:int, new_channels:list[str]):
 
 LOCK_SCOPE_LIKE = 1001  # любое число; можешь сделать по типам задач: like=1001, join=1002 и т.д.
 
+# advisory lock живёт в рамках сессии — поэтому отдельное соединение мимо пула,
+# иначе блокировка «прилипнет» к соединению, которое потом получит другой хелпер
 def try_lock_account(account_id: int, scope: int = LOCK_SCOPE_LIKE) -> bool:
-    with get_conn().cursor() as cur:  # используй ваш способ получить conn
+    with get_direct_connection().cursor() as cur:
         cur.execute("SELECT pg_try_advisory_lock(%s::bigint, %s::bigint);", (scope, account_id))
         return bool(cur.fetchone()[0])
 
 def unlock_account(account_id: int, scope: int = LOCK_SCOPE_LIKE) -> bool:
-    with get_conn().cursor() as cur:
+    with get_direct_connection().cursor() as cur:
         cur.execute("SELECT pg_advisory_unlock(%s::bigint, %s::bigint);", (scope, account_id))
         return bool(cur.fetchone()[0])
 
@@ -1580,6 +2017,8 @@ def set_twofa_task_status(task_id: int, status: str, started: bool = False, fini
 
 def add_twofa_log(task_id: int, account_id: int | None, username: str | None,
                   ok: bool, removed_other: bool, message: str) -> None:
+    if _buffered_log("twofa_logs", (task_id, account_id, username, ok, removed_other, message or "")):
+        return
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("""
@@ -1793,6 +2232,8 @@ def create_comment_check_task(created_by: int, channels: list[str], accounts: li
 
 def insert_comment_check_log(task_id: int, account_id: int | None, channel: str,
                              can_comment: bool | None, mode: str | None, message: str | None):
+    if _buffered_log("comment_check_log", (task_id, account_id, channel, can_comment, mode, message)):
+        return
     conn = get_connection(); cur = conn.cursor()
     cur.execute("""
         INSERT INTO comment_check_log (task_id, account_id, channel, can_comment, mode, message)
@@ -1982,6 +2423,112 @@ def create_account_with_metadata(
         cur.close()
         conn.close()
 
+def get_existing_session_strings(session_strings: list[str]) -> set[str]:
+    """Какие из переданных session_string уже есть в accounts (один запрос на пачку)."""
+    if not session_strings:
+        return set()
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT session_string FROM accounts WHERE session_string = ANY(%s)",
+                (list(session_strings),),
+            )
+            return {r[0] for r in cur.fetchall()}
+    finally:
+        conn.close()
+
+
+_BULK_ACCOUNT_COLUMNS = (
+    "session_string", "proxy_type", "proxy_host", "proxy_port", "proxy_username", "proxy_password",
+    "phone", "username",
+    "device_model", "system_version", "app_version",
+    "lang_code", "system_lang_code", "is_premium", "register_time",
+)
+
+def create_accounts_bulk(rows: list[dict]) -> dict[str, tuple[str, int | None]]:
+    """
+    Пачка аккаунтов (ключи как у create_account_with_metadata) в ОДНОЙ транзакции:
+      - недостающие прокси добавляются в proxies (status='unknown');
+      - аккаунты, чей phone/username уже есть в БД (или повторяется в пачке), пропускаются;
+      - остальные вставляются одним multi-row INSERT.
+    Возвращает {session_string: ("created", id) | ("exists", None)}.
+    """
+    if not rows:
+        return {}
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            # 1) прокси
+            seen_proxies = set()
+            for r in rows:
+                key = (r["proxy_host"], r["proxy_port"], r.get("proxy_username"), r.get("proxy_password"))
+                if not key[0] or not key[1] or key in seen_proxies:
+                    continue
+                seen_proxies.add(key)
+                cur.execute("""
+                    INSERT INTO proxies (host, port, username, password, status)
+                    SELECT %s, %s, %s, %s, 'unknown'
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM proxies
+                        WHERE host = %s AND port = %s
+                          AND (username = %s OR (username IS NULL AND %s IS NULL))
+                          AND (password = %s OR (password IS NULL AND %s IS NULL))
+                    )
+                """, (*key, key[0], key[1], key[2], key[2], key[3], key[3]))
+
+            # 2) дубли по phone/username
+            phones = [r["phone"] for r in rows if r.get("phone")]
+            usernames = [r["username"] for r in rows if r.get("username")]
+            cur.execute(
+                "SELECT phone, username FROM accounts WHERE phone = ANY(%s) OR username = ANY(%s)",
+                (phones, usernames),
+            )
+            taken_phones, taken_usernames = set(), set()
+            for phone, username in cur.fetchall():
+                if phone:
+                    taken_phones.add(phone)
+                if username:
+                    taken_usernames.add(username)
+
+            result: dict[str, tuple[str, int | None]] = {}
+            to_insert = []
+            for r in rows:
+                phone, username = r.get("phone"), r.get("username")
+                if (phone and phone in taken_phones) or (username and username in taken_usernames):
+                    result[r["session_string"]] = ("exists", None)
+                    continue
+                if phone:
+                    taken_phones.add(phone)
+                if username:
+                    taken_usernames.add(username)
+                to_insert.append(tuple(
+                    bool(r.get("is_premium", False)) if c == "is_premium" else r.get(c)
+                    for c in _BULK_ACCOUNT_COLUMNS
+                ))
+
+            # 3) аккаунты одним INSERT
+            if to_insert:
+                inserted = execute_values(
+                    cur,
+                    f"INSERT INTO accounts ({', '.join(_BULK_ACCOUNT_COLUMNS)}, status, created_at) "
+                    f"VALUES %s RETURNING session_string, id",
+                    to_insert,
+                    template="(" + ", ".join(["%s"] * len(_BULK_ACCOUNT_COLUMNS)) + ", 'new', NOW())",
+                    page_size=len(to_insert),
+                    fetch=True,
+                )
+                for session_string, new_id in inserted:
+                    result[session_string] = ("created", new_id)
+        conn.commit()
+        return result
+    except Exception as e:
+        conn.rollback()
+        print(f"[DB] create_accounts_bulk error: {e}", flush=True)
+        raise
+    finally:
+        conn.close()
+
 def merge_account_metadata_by_session(session_string: str, meta: dict) -> int:
     """
     Заполняет ТОЛЬКО пустые (NULL/пустая строка) поля метаданных у аккаунта с данным session_string.
@@ -2134,21 +2681,25 @@ def insert_liked_post(task_id: int, channel: str, post_id: int):
     finally:
         cur.close()
         conn.close()
+    with _LIKE_INDEX_LOCK:
+        ids = _LIKED_POSTS.get((task_id, channel))
+        if ids is not None:
+            ids.add(int(post_id))
 
-def liked_post_already(task_id: int, channel: str, post_id: int) -> bool:
+def _load_liked_posts(task_id: int, channel: str) -> set[int]:
     conn = get_connection()
     try:
         cur = conn.cursor()
-        cur.execute(
-            "SELECT 1 FROM like_liked_posts WHERE task_id = %s AND channel = %s AND post_id = %s LIMIT 1",
-            (task_id, channel, post_id)
-        )
-        row = cur.fetchone()
-        return bool(row)
+        cur.execute("SELECT post_id FROM like_liked_posts WHERE task_id = %s AND channel = %s", (task_id, channel))
+        return {int(r[0]) for r in cur.fetchall()}
     finally:
         cur.close()
         conn.close()
 
+def liked_post_already(task_id: int, channel: str, post_id: int) -> bool:
+    ids = _like_index_get(_LIKED_POSTS, (task_id, channel), lambda: _load_liked_posts(task_id, channel))
+    return int(post_id) in ids
+
 def bootstrap_like_tables_once():
     """
     Создаёт таблицы для like-задач, если они не существуют.
@@ -2266,18 +2817,71 @@ def bootstrap_blacklist_posts_table(grantee: str = "tguser"):
         conn.close()
 
 
-def is_post_blacklisted(channel: str, post_id: int) -> bool:
+# ---------- Кеш ЧС постов по каналу ----------
+# Канал грузится в память одним запросом (все post_id + high-water mark = max post_id),
+# дальше is_post_blacklisted — без БД: всё выше high-water заведомо чистое, остальное —
+# проверка по set. Раз в _BLACKLIST_REFRESH_SEC дочитываются только строки, добавленные
+# после прошлой загрузки (другими процессами); свои blacklist_post*/bulk пишут в кеш сразу.
+
+_BLACKLIST_REFRESH_SEC = 60.0
+_BLACKLIST_LOCK = threading.Lock()
+_BLACKLIST: dict[str, dict] = {}   # channel -> {"ids": set, "highwater": int, "db_ts": datetime, "checked": monotonic}
+
+def _blacklist_fetch(channel: str, since=None) -> tuple[set[int], "datetime"]:
     conn = get_connection()
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                "SELECT 1 FROM like_blacklisted_posts WHERE channel=%s AND post_id=%s LIMIT 1",
-                (channel, int(post_id)),
-            )
-            return cur.fetchone() is not None
+            if since is None:
+                cur.execute("SELECT post_id, NOW() FROM like_blacklisted_posts WHERE channel=%s", (channel,))
+            else:
+                cur.execute(
+                    # запас на транзакции, начатые до прошлого чтения и закоммиченные после
+                    "SELECT post_id, NOW() FROM like_blacklisted_posts"
+                    " WHERE channel=%s AND created_at >= %s - INTERVAL '5 minutes'",
+                    (channel, since),
+                )
+            rows = cur.fetchall()
+            if rows:
+                return {int(r[0]) for r in rows}, rows[0][1]
+            cur.execute("SELECT NOW()")
+            return set(), cur.fetchone()[0]
     finally:
         conn.close()
 
+def _blacklist_entry(channel: str) -> dict:
+    now = time.monotonic()
+    with _BLACKLIST_LOCK:
+        entry = _BLACKLIST.get(channel)
+        if entry is not None and now - entry["checked"] < _BLACKLIST_REFRESH_SEC:
+            return entry
+        since = entry["db_ts"] if entry is not None else None
+    ids, db_ts = _blacklist_fetch(channel, since)
+    with _BLACKLIST_LOCK:
+        entry = _BLACKLIST.get(channel)
+        if entry is None:
+            entry = _BLACKLIST[channel] = {"ids": set(), "highwater": 0, "db_ts": db_ts, "checked": now}
+        entry["ids"] |= ids
+        if ids:
+            entry["highwater"] = max(entry["highwater"], max(ids))
+        entry["db_ts"], entry["checked"] = db_ts, now
+        return entry
+
+def _blacklist_remember(channel: str, post_ids) -> None:
+    with _BLACKLIST_LOCK:
+        entry = _BLACKLIST.get(channel)
+        if entry is None:
+            return  # канал ещё не грузили — при первой проверке подтянется из БД
+        ids = [int(p) for p in post_ids]
+        entry["ids"].update(ids)
+        entry["highwater"] = max([entry["highwater"]] + ids)
+
+def is_post_blacklisted(channel: str, post_id: int) -> bool:
+    entry = _blacklist_entry(channel)
+    post_id = int(post_id)
+    if post_id > entry["highwater"]:
+        return False
+    return post_id in entry["ids"]
+
 
 def blacklist_posts_bulk(channel: str, post_ids: list[int]) -> int:
     """Идемпотентная массовая вставка постов в ЧС. Возвращает сколько ПЫТАЛИСЬ вставить (rowcount может быть None)."""
@@ -2295,9 +2899,11 @@ def blacklist_posts_bulk(channel: str, post_ids: list[int]) -> int:
             execute_values(cur, q, rows, template="(%s, %s)")
             # rowcount у execute_values указывает на количество ЗАПРОШЕННЫХ вставок, не фактически добавленных.
             # Для идемпотентности это ок — нам важна сама фиксация в ЧС.
-            return cur.rowcount or 0
+            inserted = cur.rowcount or 0
     finally:
         conn.close()
+    _blacklist_remember(channel, post_ids)
+    return inserted
 
 
 
@@ -2309,14 +2915,606 @@ def blacklist_post(channel: str, post_id: int):
         ON CONFLICT (channel, post_id) DO NOTHING
     """, (channel, post_id))
     conn.commit(); cur.close(); conn.close()
+    _blacklist_remember(channel, [post_id])
 
 def get_blacklist_highwater_for_channel(channel: str) -> int:
-    conn = get_connection(); cur = conn.cursor()
+    return int(_blacklist_entry(channel)["highwater"])
+
+
+# ===================== Очередь фоновых задач (app/task_queue.py) =====================
+# Состояние очереди хранится в отдельных колонках tasks (job_*/lease_*), чтобы не
+# вмешиваться в status, который задачи сами выставляют и показывают в карточках.
+#   job_state: queued -> leased -> done | failed   (leased -> queued при падении/рестарте)
+# Колонки добавляет миграция 3 в app/migrations.py (до старта очереди в bot.py / worker.py).
+TASK_QUEUE_SCHEMA = [
+    """
+    ALTER TABLE public.tasks
+        ADD COLUMN IF NOT EXISTS job_kind         TEXT,
+        ADD COLUMN IF NOT EXISTS job_args         JSONB,
+        ADD COLUMN IF NOT EXISTS job_state        TEXT,
+        ADD COLUMN IF NOT EXISTS job_not_before   TIMESTAMPTZ,
+        ADD COLUMN IF NOT EXISTS lease_owner      TEXT,
+        ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ,
+        ADD COLUMN IF NOT EXISTS attempts         INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS max_attempts     INTEGER NOT NULL DEFAULT 1,
+        ADD COLUMN IF NOT EXISTS last_error       TEXT,
+        ADD COLUMN IF NOT EXISTS job_shard        BIGINT
+    """,
+    # колонку могли создать раньше с DEFAULT 3 — job'ы по умолчанию однократные
+    "ALTER TABLE public.tasks ALTER COLUMN max_attempts SET DEFAULT 1",
+    # частичные индексы по пустым до этого колонкам — строятся мгновенно
+    """
+    CREATE INDEX IF NOT EXISTS idx_tasks_job_queued
+        ON public.tasks (job_kind, job_not_before, id) WHERE job_state = 'queued'
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_tasks_job_leased
+        ON public.tasks (lease_expires_at) WHERE job_state = 'leased'
+    """,
+]
+
+# Миграция 8: секреты не хранятся в job_args — reauthorize_accounts раньше клал туда api_hash.
+TASK_QUEUE_SCRUB_SECRETS = [
+    "UPDATE public.tasks SET job_args = job_args - 'api_hash' - 'api_id' WHERE job_args ? 'api_hash'",
+]
+
+def enqueue_job(task_id: int, kind: str, args: dict | None = None,
+                max_attempts: int = 1, delay_sec: float = 0, shard_key: int | None = None) -> None:
+    """
+    Ставит уже созданную строку tasks в очередь на исполнение воркером типа kind.
+    shard_key — id аккаунта, по которому задача попадает в шард воркера
+    (по умолчанию tasks.account_id, иначе id самой задачи).
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE tasks
+                   SET job_kind = %s, job_args = %s, job_state = 'queued',
+                       job_not_before = NOW() + %s * INTERVAL '1 second',
+                       lease_owner = NULL, lease_expires_at = NULL,
+                       attempts = 0, max_attempts = %s, last_error = NULL,
+                       job_shard = COALESCE(%s, account_id, id)
+                 WHERE id = %s
+            """, (kind, Json(args or {}), float(delay_sec), int(max_attempts), shard_key, int(task_id)))
+        conn.commit()
+    finally:
+        conn.close()
+
+def claim_jobs(kind: str, limit: int, owner: str, lease_sec: float,
+               shard_index: int = 0, shard_count: int = 1):
+    """
+    Забирает до limit готовых задач типа kind (FOR UPDATE SKIP LOCKED — параллельные
+    воркеры не получат одну и ту же строку) и выдаёт им аренду на lease_sec.
+    При shard_count > 1 — только задачи своего шарда: job_shard % shard_count = shard_index.
+    """
+    if limit <= 0:
+        return []
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                WITH picked AS (
+                    SELECT id FROM tasks
+                     WHERE job_state = 'queued' AND job_kind = %s AND job_not_before <= NOW()
+                       AND (%s <= 1 OR MOD(COALESCE(job_shard, id), %s) = %s)
+                     ORDER BY job_not_before, id
+                     FOR UPDATE SKIP LOCKED
+                     LIMIT %s
+                )
+                UPDATE tasks t
+                   SET job_state = 'leased', lease_owner = %s,
+                       lease_expires_at = NOW() + %s * INTERVAL '1 second',
+                       attempts = t.attempts + 1
+                  FROM picked
+                 WHERE t.id = picked.id
+             RETURNING t.*
+            """, (kind, int(shard_count), max(1, int(shard_count)), int(shard_index),
+                  int(limit), owner, float(lease_sec)))
+            rows = cur.fetchall()
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+def extend_job_lease(task_id: int, owner: str, lease_sec: float) -> bool:
+    """Heartbeat. False — аренду уже забрали (истекла и задача переотдана)."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE tasks SET lease_expires_at = NOW() + %s * INTERVAL '1 second'
+                 WHERE id = %s AND lease_owner = %s AND job_state = 'leased'
+            """, (float(lease_sec), int(task_id), owner))
+            ok = cur.rowcount == 1
+        conn.commit()
+        return ok
+    finally:
+        conn.close()
+
+def finish_job(task_id: int, owner: str, error: str | None = None,
+               retry_delay_sec: float = 30, release: bool = False) -> str | None:
+    """
+    Завершение аренды:
+      error is None          -> done;
+      release=True           -> назад в queued без траты попытки (остановка бота, только max_attempts > 1);
+      error и попытки есть   -> queued с задержкой retry_delay_sec * attempts;
+      иначе                  -> failed.
+    При failed задача, оставшаяся в pending/running, получает status='error' — карточка
+    не висит «в работе» после прерванного запуска.
+    Возвращает новый job_state (None — аренда уже не наша).
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE tasks
+                   SET job_state = CASE
+                           WHEN %(release)s THEN 'queued'
+                           WHEN %(error)s IS NULL THEN 'done'
+                           WHEN attempts < max_attempts THEN 'queued'
+                           ELSE 'failed' END,
+                       attempts = CASE WHEN %(release)s THEN GREATEST(attempts - 1, 0) ELSE attempts END,
+                       job_not_before = CASE
+                           WHEN %(release)s THEN NOW()
+                           WHEN %(error)s IS NOT NULL THEN NOW() + %(delay)s * attempts * INTERVAL '1 second'
+                           ELSE job_not_before END,
+                       last_error = COALESCE(%(error)s, last_error),
+                       lease_owner = NULL, lease_expires_at = NULL
+                 WHERE id = %(id)s AND lease_owner = %(owner)s
+             RETURNING job_state
+            """, {"release": bool(release), "error": error, "delay": float(retry_delay_sec),
+                  "id": int(task_id), "owner": owner})
+            row = cur.fetchone()
+            if row and row[0] == "failed":
+                _mark_failed_tasks_error(cur, [int(task_id)])
+        conn.commit()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+def _mark_failed_tasks_error(cur, task_ids: list[int]) -> None:
+    if not task_ids:
+        return
     cur.execute("""
-        SELECT COALESCE(MAX(post_id), 0)
-        FROM like_blacklisted_posts
-        WHERE channel = %s
-    """, (channel,))
-    row = cur.fetchone()
-    cur.close(); conn.close()
-    return int(row[0] or 0)
+        UPDATE tasks
+           SET status = 'error', result = COALESCE(result, 'Прервано: ' || COALESCE(last_error, '')),
+               updated_at = now()
+         WHERE id = ANY(%s) AND status IN ('pending', 'running', 'in_progress')
+    """, (task_ids,))
+
+def recover_expired_jobs() -> list[int]:
+    """Аренды, которые никто не продлевает (процесс упал), возвращаются в очередь."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE tasks
+                   SET job_state = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                       job_not_before = NOW(),
+                       last_error = COALESCE(last_error, 'lease expired'),
+                       lease_owner = NULL, lease_expires_at = NULL
+                 WHERE job_state = 'leased' AND lease_expires_at < NOW()
+             RETURNING id, job_state
+            """)
+            rows = cur.fetchall()
+            _mark_failed_tasks_error(cur, [r[0] for r in rows if r[1] == "failed"])
+        conn.commit()
+        return [r[0] for r in rows]
+    finally:
+        conn.close()
+
+def get_job_queue_stats() -> list[dict]:
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT job_kind, job_state, COUNT(*) AS n
+                  FROM tasks
+                 WHERE job_kind IS NOT NULL AND job_state IN ('queued', 'leased')
+                 GROUP BY job_kind, job_state
+                 ORDER BY job_kind, job_state
+            """)
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+
+# ---------- Межпроцессная блокировка сессий аккаунтов (пул клиентов, app/telegram_client.py) ----------
+# Пока клиент аккаунта подключён в пуле, процесс держит session-level advisory lock
+# (LOCK_SCOPE_SESSION, account_id) на своём выделенном соединении: бот и шарды worker.py
+# не откроют одну сессию одновременно, какой бы шард ни достался задаче.
+# Ждущий процесс держит shared-lock (LOCK_SCOPE_SESSION_WANT, account_id) — по нему
+# владелец видит, что аккаунт нужен другому, и отпускает простаивающий клиент.
+
+LOCK_SCOPE_SESSION = 1100
+LOCK_SCOPE_SESSION_WANT = 1101
+
+_SESSION_LOCK_CONN = None
+_SESSION_LOCK_MUTEX = threading.Lock()
+_SESSION_LOCKS_HELD: set[int] = set()
+
+def _session_lock_conn():
+    """Под _SESSION_LOCK_MUTEX. После обрыва соединения заново берёт удерживаемые блокировки."""
+    global _SESSION_LOCK_CONN
+    conn = _SESSION_LOCK_CONN
+    if conn is not None and not conn.closed:
+        return conn
+    conn = get_direct_connection()
+    conn.autocommit = True
+    _SESSION_LOCK_CONN = conn
+    with conn.cursor() as cur:
+        for account_id in sorted(_SESSION_LOCKS_HELD):
+            cur.execute("SELECT pg_try_advisory_lock(%s, %s)", (LOCK_SCOPE_SESSION, int(account_id)))
+            if not cur.fetchone()[0]:
+                _SESSION_LOCKS_HELD.discard(account_id)
+                print(f"[DB] ⚠️ session lock for account {account_id} lost on reconnect", flush=True)
+    return conn
+
+def try_lock_account_session(account_id: int) -> bool:
+    with _SESSION_LOCK_MUTEX:
+        if account_id in _SESSION_LOCKS_HELD:
+            return True
+        with _session_lock_conn().cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s, %s)", (LOCK_SCOPE_SESSION, int(account_id)))
+            ok = bool(cur.fetchone()[0])
+        if ok:
+            _SESSION_LOCKS_HELD.add(account_id)
+        return ok
+
+def unlock_account_session(account_id: int) -> None:
+    with _SESSION_LOCK_MUTEX:
+        if account_id not in _SESSION_LOCKS_HELD:
+            return
+        _SESSION_LOCKS_HELD.discard(account_id)
+        with _session_lock_conn().cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s, %s)", (LOCK_SCOPE_SESSION, int(account_id)))
+
+def want_account_session(account_id: int, wanted: bool = True) -> None:
+    """Отметить (или снять отметку), что этот процесс ждёт сессию аккаунта."""
+    fn = "pg_try_advisory_lock_shared" if wanted else "pg_advisory_unlock_shared"
+    with _SESSION_LOCK_MUTEX:
+        with _session_lock_conn().cursor() as cur:
+            cur.execute(f"SELECT {fn}(%s, %s)", (LOCK_SCOPE_SESSION_WANT, int(account_id)))
+
+def get_wanted_account_sessions() -> list[int]:
+    """Аккаунты из удерживаемых этим процессом, которые ждёт другой процесс."""
+    with _SESSION_LOCK_MUTEX:
+        held = sorted(_SESSION_LOCKS_HELD)
+        if not held:
+            return []
+        with _session_lock_conn().cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT objid::int FROM pg_locks
+                 WHERE locktype = 'advisory' AND classid = %s AND objsubid = 2
+                   AND pid <> pg_backend_pid() AND objid::int = ANY(%s)
+            """, (LOCK_SCOPE_SESSION_WANT, held))
+            return [r[0] for r in cur.fetchall()]
+
+
+# ---------- Кеш резолва @username / t.me ссылок (app/entity_cache.py) ----------
+# entity_cache — что за сущность стоит за нормализованной ссылкой (общие данные),
+# entity_access_hash — её access_hash для конкретного аккаунта (без него InputPeer не собрать).
+# Таблицы — миграция 4 в app/migrations.py.
+ENTITY_CACHE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS public.entity_cache (
+        link_key           TEXT PRIMARY KEY,
+        peer_id            BIGINT NOT NULL,
+        peer_type          TEXT NOT NULL,
+        username           TEXT,
+        title              TEXT,
+        participants_count INTEGER,
+        is_broadcast       BOOLEAN,
+        resolved_at        TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.entity_access_hash (
+        account_id  INTEGER NOT NULL,
+        peer_id     BIGINT NOT NULL,
+        access_hash BIGINT NOT NULL,
+        updated_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (account_id, peer_id)
+    )
+    """,
+]
+
+def get_cached_entity(link_key: str, account_id: int | None, ttl_sec: float):
+    """Свежая (моложе ttl_sec) запись кеша + access_hash аккаунта (None, если его ещё нет)."""
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT e.link_key, e.peer_id, e.peer_type, e.username, e.title,
+                       e.participants_count, e.is_broadcast, e.resolved_at, h.access_hash
+                  FROM entity_cache e
+                  LEFT JOIN entity_access_hash h
+                         ON h.peer_id = e.peer_id AND h.account_id = %s
+                 WHERE e.link_key = %s
+                   AND e.resolved_at > NOW() - %s * INTERVAL '1 second'
+            """, (account_id, link_key, float(ttl_sec)))
+            return cur.fetchone()
+    finally:
+        conn.close()
+
+def save_cached_entity(link_key: str, meta: dict, account_id: int | None = None,
+                       access_hash: int | None = None) -> None:
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO entity_cache (link_key, peer_id, peer_type, username, title,
+                                          participants_count, is_broadcast, resolved_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+                ON CONFLICT (link_key) DO UPDATE SET
+                    peer_id = EXCLUDED.peer_id,
+                    peer_type = EXCLUDED.peer_type,
+                    username = EXCLUDED.username,
+                    title = EXCLUDED.title,
+                    participants_count = COALESCE(EXCLUDED.participants_count, entity_cache.participants_count),
+                    is_broadcast = EXCLUDED.is_broadcast,
+                    resolved_at = NOW()
+            """, (link_key, meta["peer_id"], meta["peer_type"], meta.get("username"), meta.get("title"),
+                  meta.get("participants_count"), meta.get("is_broadcast")))
+            if account_id is not None and access_hash is not None:
+                cur.execute("""
+                    INSERT INTO entity_access_hash (account_id, peer_id, access_hash, updated_at)
+                    VALUES (%s, %s, %s, NOW())
+                    ON CONFLICT (account_id, peer_id) DO UPDATE
+                        SET access_hash = EXCLUDED.access_hash, updated_at = NOW()
+                """, (account_id, meta["peer_id"], access_hash))
+        conn.commit()
+    finally:
+        conn.close()
+
+def forget_entity_access_hash(account_id: int, peer_id: int) -> None:
+    """access_hash оказался невалидным (CHANNEL_INVALID и т.п.) — следующий резолв пойдёт в RPC."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM entity_access_hash WHERE account_id = %s AND peer_id = %s",
+                        (account_id, peer_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# ---------- Метаданные групп: участники / тип / открытость (app/group_metadata.py) ----------
+# Таблица — миграция 5 в app/migrations.py.
+GROUP_METADATA_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS public.group_metadata (
+        link_key           TEXT PRIMARY KEY,
+        link               TEXT NOT NULL,
+        peer_id            BIGINT,
+        peer_type          TEXT,
+        title              TEXT,
+        participants_count INTEGER,
+        is_open            BOOLEAN,
+        last_result        TEXT,
+        last_checked_at    TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+    """,
+]
+
+def get_fresh_group_metadata(link_keys: list[str], max_age_hours: float) -> dict[str, dict]:
+    """
+    link_key -> запись, проверенная не раньше max_age_hours назад, с известным числом
+    участников и не помеченная закрытой/недоступной при последней проверке.
+    """
+    if not link_keys or max_age_hours <= 0:
+        return {}
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT * FROM group_metadata
+                 WHERE link_key = ANY(%s)
+                   AND participants_count IS NOT NULL
+                   AND is_open IS NOT FALSE
+                   AND last_checked_at > NOW() - %s * INTERVAL '1 hour'
+            """, (list(link_keys), float(max_age_hours)))
+            return {r["link_key"]: r for r in cur.fetchall()}
+    finally:
+        conn.close()
+
+def upsert_group_metadata(rows: list[dict]) -> int:
+    """
+    rows: dict(link_key, link, peer_id, peer_type, title, participants_count, is_open, last_result).
+    Пустые (None) поля не затирают уже известные значения.
+    """
+    if not rows:
+        return 0
+    # в одном INSERT ... ON CONFLICT ключ не должен повторяться — оставляем последнюю запись
+    by_key = {r["link_key"]: r for r in rows}
+    values = [
+        (r["link_key"], r["link"], r.get("peer_id"), r.get("peer_type"), r.get("title"),
+         r.get("participants_count"), r.get("is_open"), r.get("last_result"))
+        for r in by_key.values()
+    ]
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO group_metadata
+                    (link_key, link, peer_id, peer_type, title, participants_count, is_open, last_result)
+                VALUES %s
+                ON CONFLICT (link_key) DO UPDATE SET
+                    link               = EXCLUDED.link,
+                    peer_id            = COALESCE(EXCLUDED.peer_id, group_metadata.peer_id),
+                    peer_type          = COALESCE(EXCLUDED.peer_type, group_metadata.peer_type),
+                    title              = COALESCE(EXCLUDED.title, group_metadata.title),
+                    participants_count = COALESCE(EXCLUDED.participants_count, group_metadata.participants_count),
+                    is_open            = COALESCE(EXCLUDED.is_open, group_metadata.is_open),
+                    last_result        = COALESCE(EXCLUDED.last_result, group_metadata.last_result),
+                    last_checked_at    = NOW()
+            """, values)
+        conn.commit()
+        return len(values)
+    finally:
+        conn.close()
+
+def get_check_groups_results(task_id: int) -> list[tuple]:
+    """(checked_group, result, members) из check_groups_log задачи — только реальные проверки аккаунтами."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT checked_group, result, members
+                  FROM check_groups_log
+                 WHERE task_id = %s AND account_id IS NOT NULL
+                 ORDER BY id
+            """, (task_id,))
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+
+# ---------- Кеш результатов поиска групп по ключам (mass search) ----------
+# Таблица — миграция 6 в app/migrations.py.
+SEARCH_CACHE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS public.search_keyword_cache (
+        keyword_key TEXT PRIMARY KEY,
+        keyword     TEXT NOT NULL,
+        groups      JSONB NOT NULL DEFAULT '[]'::jsonb,
+        searched_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+    """,
+]
+
+def get_cached_searches(keyword_keys: list[str], ttl_sec: float) -> dict[str, list[dict]]:
+    """keyword_key -> список групп ({"id", "title", "username", "members"}) из поиска не старше ttl_sec."""
+    if not keyword_keys or ttl_sec <= 0:
+        return {}
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT keyword_key, groups
+                  FROM search_keyword_cache
+                 WHERE keyword_key = ANY(%s)
+                   AND searched_at > NOW() - %s * INTERVAL '1 second'
+            """, (list(keyword_keys), float(ttl_sec)))
+            return {key: groups or [] for key, groups in cur.fetchall()}
+    finally:
+        conn.close()
+
+def save_search_cache(keyword_key: str, keyword: str, groups: list[dict]) -> None:
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO search_keyword_cache (keyword_key, keyword, groups, searched_at)
+                VALUES (%s, %s, %s, NOW())
+                ON CONFLICT (keyword_key) DO UPDATE SET
+                    keyword     = EXCLUDED.keyword,
+                    groups      = EXCLUDED.groups,
+                    searched_at = NOW()
+            """, (keyword_key, keyword, Json(groups)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+
+# ---------- Счётчики по задачам (task_counters): карточки читают их вместо SUM(CASE) по логам ----------
+# Счётчики ведут statement-триггеры на like_comments_log / check_groups_log / comment_check_log,
+# поэтому учитываются все пути записи: батчи log_sink, скомпилированные модули, UPDATE статусов.
+#   like:<status>   check:<result>, check:cached   cchk:yes / cchk:no / cchk:unknown
+# Таблицу, триггеры и пересчёт по накопленным логам накатывает миграция 7 в app/migrations.py;
+# логи на время миграции блокируются от записи — между пересчётом и триггерами ничего не теряется.
+TASK_COUNTERS_SCHEMA = [
+    "LOCK TABLE public.like_comments_log, public.check_groups_log, public.comment_check_log"
+    " IN SHARE ROW EXCLUSIVE MODE",
+    r"""
+    CREATE TABLE IF NOT EXISTS task_counters (
+        task_id BIGINT NOT NULL,
+        counter TEXT   NOT NULL,
+        value   BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (task_id, counter)
+    );
+
+    -- Аргументы триггера — SQL-выражения имени счётчика по строке лога (NULL — не считать).
+    -- Один INSERT на statement, строки отсортированы — конкурентные батчи не дедлочатся.
+    CREATE OR REPLACE FUNCTION task_counters_apply() RETURNS trigger LANGUAGE plpgsql AS $$
+    DECLARE
+        parts TEXT[] := '{}';
+    BEGIN
+        FOR i IN 0 .. TG_NARGS - 1 LOOP
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                parts := parts || format('SELECT task_id, %s AS c, -1 AS d FROM old_rows', TG_ARGV[i]);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                parts := parts || format('SELECT task_id, %s AS c, 1 AS d FROM new_rows', TG_ARGV[i]);
+            END IF;
+        END LOOP;
+        EXECUTE format(
+            'INSERT INTO task_counters (task_id, counter, value)
+             SELECT task_id, c, SUM(d) FROM (%s) s
+              WHERE c IS NOT NULL
+              GROUP BY task_id, c HAVING SUM(d) <> 0
+              ORDER BY task_id, c
+             ON CONFLICT (task_id, counter) DO UPDATE SET value = task_counters.value + EXCLUDED.value',
+            array_to_string(parts, ' UNION ALL '));
+        RETURN NULL;
+    END $$;
+
+    -- триггер с transition tables допускает одно событие — по три на таблицу
+    CREATE OR REPLACE TRIGGER task_counters_ins AFTER INSERT ON like_comments_log
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+        EXECUTE FUNCTION task_counters_apply('''like:'' || status');
+    CREATE OR REPLACE TRIGGER task_counters_upd AFTER UPDATE ON like_comments_log
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT
+        EXECUTE FUNCTION task_counters_apply('''like:'' || status');
+    CREATE OR REPLACE TRIGGER task_counters_del AFTER DELETE ON like_comments_log
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+        EXECUTE FUNCTION task_counters_apply('''like:'' || status');
+
+    CREATE OR REPLACE TRIGGER task_counters_ins AFTER INSERT ON check_groups_log
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+        EXECUTE FUNCTION task_counters_apply('''check:'' || COALESCE(result, '''')', 'CASE WHEN account_id IS NULL THEN ''check:cached'' END');
+    CREATE OR REPLACE TRIGGER task_counters_upd AFTER UPDATE ON check_groups_log
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT
+        EXECUTE FUNCTION task_counters_apply('''check:'' || COALESCE(result, '''')', 'CASE WHEN account_id IS NULL THEN ''check:cached'' END');
+    CREATE OR REPLACE TRIGGER task_counters_del AFTER DELETE ON check_groups_log
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+        EXECUTE FUNCTION task_counters_apply('''check:'' || COALESCE(result, '''')', 'CASE WHEN account_id IS NULL THEN ''check:cached'' END');
+
+    CREATE OR REPLACE TRIGGER task_counters_ins AFTER INSERT ON comment_check_log
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+        EXECUTE FUNCTION task_counters_apply('CASE can_comment WHEN TRUE THEN ''cchk:yes'' WHEN FALSE THEN ''cchk:no'' ELSE ''cchk:unknown'' END');
+    CREATE OR REPLACE TRIGGER task_counters_upd AFTER UPDATE ON comment_check_log
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT
+        EXECUTE FUNCTION task_counters_apply('CASE can_comment WHEN TRUE THEN ''cchk:yes'' WHEN FALSE THEN ''cchk:no'' ELSE ''cchk:unknown'' END');
+    CREATE OR REPLACE TRIGGER task_counters_del AFTER DELETE ON comment_check_log
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+        EXECUTE FUNCTION task_counters_apply('CASE can_comment WHEN TRUE THEN ''cchk:yes'' WHEN FALSE THEN ''cchk:no'' ELSE ''cchk:unknown'' END');
+    """,
+    """
+    DELETE FROM task_counters WHERE counter LIKE 'like:%' OR counter LIKE 'check:%' OR counter LIKE 'cchk:%';
+    INSERT INTO task_counters (task_id, counter, value)
+    SELECT task_id, 'like:' || status, COUNT(*) FROM like_comments_log GROUP BY 1, 2
+    UNION ALL
+    SELECT task_id, 'check:' || COALESCE(result, ''), COUNT(*) FROM check_groups_log GROUP BY 1, 2
+    UNION ALL
+    SELECT task_id, 'check:cached', COUNT(*) FROM check_groups_log WHERE account_id IS NULL GROUP BY 1
+    UNION ALL
+    SELECT task_id, CASE can_comment WHEN TRUE THEN 'cchk:yes' WHEN FALSE THEN 'cchk:no' ELSE 'cchk:unknown' END, COUNT(*)
+      FROM comment_check_log GROUP BY 1, 2;
+    """,
+]
+
+def get_task_counters(task_id: int, prefix: str) -> dict[str, int]:
+    """{"ok": 10, "fail": 2, ...} — счётчики задачи с префиксом ("like", "check", "cchk")."""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT counter, value FROM task_counters WHERE task_id = %s AND counter LIKE %s",
+                (task_id, prefix + ":%"),
+            )
+            return {counter.split(":", 1)[1]: int(value) for counter, value in cur.fetchall()}
+    finally:
+        conn.close()
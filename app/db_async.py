@@ -0,0 +1,75 @@
+# app/db_async.py
+"""
+Awaitable-варианты хелперов app/db.py.
+
+Те же имена и сигнатуры, но вызов уходит в отдельный пул потоков
+(размером с пул соединений), поэтому event loop aiogram/Telethon не замирает на SQL:
+
+    from app import db_async as adb
+    acc = await adb.get_account_by_id(acc_id)
+    await adb.insert_join_groups_log(task_id, acc_id, link, "fail", msg)
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+from app import db
+
+# не DAO: сырые соединения/служебное — асинхронные обёртки для них не делаем
+_EXCLUDED = {
+    "get_connection", "get_db_connection", "get_conn", "get_direct_connection",
+    "init_db_pool", "close_db_pool",
+}
+
+_EXECUTOR: ThreadPoolExecutor | None = None
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        pool = db.get_pool()
+        if pool is not None:
+            workers = pool.maxconn
+        else:
+            from config import DB_POOL_MAX
+            workers = DB_POOL_MAX
+        _EXECUTOR = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="db")
+    return _EXECUTOR
+
+
+async def run(fn, *args, **kwargs):
+    """Выполнить любую синхронную DB-функцию в DB-потоке."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def _make_async(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+    return wrapper
+
+
+def __getattr__(name: str):
+    fn = getattr(db, name, None)
+    if (
+        name.startswith("_")
+        or name in _EXCLUDED
+        or not inspect.isfunction(fn)
+        or fn.__module__ != db.__name__
+    ):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    wrapper = _make_async(fn)
+    globals()[name] = wrapper  # кэшируем, чтобы не оборачивать повторно
+    return wrapper
+
+
+def shutdown() -> None:
+    """Останавливает DB-потоки (вызывается при остановке бота)."""
+    global _EXECUTOR
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=True)
+        _EXECUTOR = None
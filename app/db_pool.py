@@ -0,0 +1,191 @@
+# app/db_pool.py
+"""
+Пул соединений PostgreSQL для всех хелперов app/db.py.
+
+Хелперы по-прежнему делают `conn = get_connection() ... conn.close()`,
+но close() теперь возвращает соединение в пул, а не рвёт TCP.
+Соединение, которое забыли закрыть, вернётся в пул само при сборке мусора.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions as _ext
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Не дождались свободного соединения за DB_POOL_TIMEOUT секунд."""
+
+
+class PooledConnection:
+    """
+    Тонкая обёртка над psycopg2-соединением.
+    Всё, кроме close()/__enter__/__exit__, проксируется в настоящее соединение.
+    """
+
+    __slots__ = ("_pool", "_raw")
+
+    def __init__(self, pool: "DBPool", raw):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_raw", raw)
+
+    def __getattr__(self, name):
+        raw = object.__getattribute__(self, "_raw")
+        if raw is None:
+            raise psycopg2.InterfaceError("connection already returned to pool")
+        return getattr(raw, name)
+
+    def __setattr__(self, name, value):
+        # conn.autocommit = True и т.п. должны попадать в настоящее соединение
+        setattr(self._raw, name, value)
+
+    # `with conn:` — как у psycopg2: commit/rollback, соединение остаётся открытым
+    def __enter__(self):
+        self._raw.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._raw.__exit__(exc_type, exc, tb)
+
+    @property
+    def closed(self) -> int:
+        raw = object.__getattribute__(self, "_raw")
+        return 1 if raw is None else raw.closed
+
+    def close(self):
+        raw = object.__getattribute__(self, "_raw")
+        if raw is None:
+            return  # повторный close() — ничего не делаем
+        object.__setattr__(self, "_raw", None)
+        self._pool.putconn(raw)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class DBPool:
+    """
+    Потокобезопасный пул: не более maxconn выданных соединений,
+    ожидание свободного — до timeout секунд, простаивающие дольше max_idle — закрываются.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float, max_idle: float, **conn_kwargs):
+        self.minconn = max(0, int(minconn))
+        self.maxconn = max(1, int(maxconn), self.minconn)
+        self.timeout = float(timeout)
+        self.max_idle = float(max_idle)
+        self._conn_kwargs = conn_kwargs
+        self._idle: deque[tuple[object, float]] = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._in_use = 0
+        self.closed = False
+
+        for _ in range(self.minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(**self._conn_kwargs)
+
+    def _take_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                raw, since = self._idle.pop()
+                if raw.closed or now - since > self.max_idle:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+                    continue
+                return raw
+        return None
+
+    def getconn(self) -> PooledConnection:
+        if self.closed:
+            raise psycopg2.InterfaceError("connection pool is closed")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"no free DB connection in {self.timeout:.0f}s (DB_POOL_MAX={self.maxconn})")
+        try:
+            raw = self._take_idle() or self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+        return PooledConnection(self, raw)
+
+    def putconn(self, raw) -> None:
+        try:
+            keep = not self.closed and not raw.closed
+            if keep:
+                status = raw.info.transaction_status
+                if status == _ext.TRANSACTION_STATUS_UNKNOWN:
+                    keep = False  # соединение с сервером потеряно
+                elif status != _ext.TRANSACTION_STATUS_IDLE:
+                    raw.rollback()  # незакоммиченное — откатываем, как при закрытии
+                if keep and raw.autocommit:
+                    raw.autocommit = False
+            if keep:
+                with self._lock:
+                    self._idle.append((raw, time.monotonic()))
+            elif not raw.closed:
+                raw.close()
+        except Exception:
+            try:
+                raw.close()
+            except Exception:
+                pass
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def closeall(self) -> None:
+        self.closed = True
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for raw, _ in idle:
+            try:
+                raw.close()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_use": self._in_use, "idle": len(self._idle), "max": self.maxconn}
+
+
+_POOL: DBPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def init_pool(conn_kwargs: dict, *, minconn: int, maxconn: int, timeout: float,
+              max_idle: float, connect_timeout: int | None = None) -> DBPool:
+    """Создаёт глобальный пул (повторный вызов возвращает уже созданный)."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None or _POOL.closed:
+            kwargs = dict(conn_kwargs)
+            if connect_timeout:
+                kwargs.setdefault("connect_timeout", int(connect_timeout))
+            _POOL = DBPool(minconn, maxconn, timeout, max_idle, **kwargs)
+        return _POOL
+
+
+def get_pool() -> DBPool | None:
+    return _POOL
+
+
+def close_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.closeall()
@@ -0,0 +1,184 @@
+# app/entity_cache.py
+"""
+Кеш резолва @username / t.me-ссылок, общий для всех задач и процессов.
+
+    entity = await resolve_entity(client, "https://t.me/some_group")
+
+Ссылка нормализуется (@name, t.me/name, t.me/s/name/123 → "u:name"). В Postgres
+хранится, что за ней стоит (peer_id, тип, title, участники — entity_cache, TTL
+ENTITY_CACHE_TTL_SEC), и access_hash для каждого аккаунта, который её уже
+резолвил (entity_access_hash). Если для аккаунта есть свежая запись — RPC
+(ResolveUsername) не делается, возвращается готовый InputPeer. Поверх БД —
+небольшой in-memory LRU, чтобы не ходить в базу на каждую ссылку.
+
+Инвайт-ссылки (t.me/+hash, joinchat/...) не кешируются — они резолвятся как раньше.
+"""
+from __future__ import annotations
+
+import re
+import time
+from collections import OrderedDict
+
+from telethon import utils as tl_utils
+from telethon.tl import types as tl_types
+
+from app import db
+from app.db_async import run as run_db
+
+_USERNAME_RE = re.compile(r"^[A-Za-z][A-Za-z0-9_]{3,31}$")
+_TME_RE = re.compile(
+    r"^(?:https?://)?(?:www\.)?(?:t\.me|telegram\.me|telegram\.dog)/(?:s/)?([^/?#]+)",
+    re.IGNORECASE,
+)
+_RESERVED = {"joinchat", "addstickers", "addemoji", "share", "proxy", "socks", "c"}
+
+
+def normalize_link(link) -> str | None:
+    """Ключ кеша для публичной ссылки/username или None (инвайт, id, непонятный формат)."""
+    if not isinstance(link, str):
+        return None
+    s = link.strip()
+    m = _TME_RE.match(s)
+    if m:
+        s = m.group(1)
+        if s.startswith("+") or s.lower() in _RESERVED:
+            return None
+    s = s.lstrip("@")
+    if not _USERNAME_RE.match(s):
+        return None
+    return "u:" + s.lower()
+
+
+def _entity_meta(entity) -> dict:
+    if isinstance(entity, tl_types.Channel):
+        peer_type = "channel"
+    elif isinstance(entity, tl_types.Chat):
+        peer_type = "chat"
+    else:
+        peer_type = "user"
+    title = getattr(entity, "title", None)
+    if title is None and peer_type == "user":
+        title = " ".join(filter(None, [getattr(entity, "first_name", None), getattr(entity, "last_name", None)])) or None
+    return {
+        "peer_id": int(entity.id),
+        "peer_type": peer_type,
+        "username": getattr(entity, "username", None),
+        "title": title,
+        "participants_count": getattr(entity, "participants_count", None),
+        "is_broadcast": bool(getattr(entity, "broadcast", False)) if peer_type == "channel" else None,
+    }
+
+
+def _input_peer(row: dict):
+    peer_id = int(row["peer_id"])
+    if row["peer_type"] == "channel":
+        return tl_types.InputPeerChannel(peer_id, int(row["access_hash"]))
+    if row["peer_type"] == "chat":
+        return tl_types.InputPeerChat(peer_id)
+    return tl_types.InputPeerUser(peer_id, int(row["access_hash"]))
+
+
+class EntityCache:
+    def __init__(self, ttl_sec: float, memory_size: int = 10_000):
+        self.ttl_sec = float(ttl_sec)
+        self.memory_size = max(100, int(memory_size))
+        # (link_key, account_id) -> (row, expires_at)
+        self._memory: "OrderedDict[tuple, tuple[dict, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _remember(self, key: tuple, row: dict) -> None:
+        self._memory[key] = (row, time.monotonic() + self.ttl_sec)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    async def lookup(self, link_key: str, account_id: int | None) -> dict | None:
+        key = (link_key, account_id)
+        cached = self._memory.get(key)
+        if cached is not None:
+            row, expires_at = cached
+            if expires_at > time.monotonic():
+                self._memory.move_to_end(key)
+                return row
+            self._memory.pop(key, None)
+        try:
+            row = await run_db(db.get_cached_entity, link_key, account_id, self.ttl_sec)
+        except Exception as e:
+            self.errors += 1
+            print(f"[ENTITY_CACHE] lookup {link_key} failed: {e}", flush=True)
+            return None
+        if row is not None:
+            row = dict(row)
+            self._remember(key, row)
+        return row
+
+    async def store(self, link_key: str, entity, account_id: int | None) -> None:
+        meta = _entity_meta(entity)
+        access_hash = getattr(entity, "access_hash", None)
+        try:
+            await run_db(db.save_cached_entity, link_key, meta, account_id, access_hash)
+        except Exception as e:
+            self.errors += 1
+            print(f"[ENTITY_CACHE] save {link_key} failed: {e}", flush=True)
+        self._remember((link_key, account_id), {**meta, "link_key": link_key, "access_hash": access_hash})
+
+    async def forget(self, account_id: int, entity) -> None:
+        """Сбросить access_hash аккаунта для сущности (напр., после CHANNEL_INVALID)."""
+        peer_id = tl_utils.get_peer_id(entity, add_mark=False)
+        for key in [k for k, (row, _) in self._memory.items() if k[1] == account_id and int(row["peer_id"]) == peer_id]:
+            self._memory.pop(key, None)
+        try:
+            await run_db(db.forget_entity_access_hash, account_id, peer_id)
+        except Exception as e:
+            self.errors += 1
+            print(f"[ENTITY_CACHE] forget {account_id}/{peer_id} failed: {e}", flush=True)
+
+    async def resolve(self, client, link, account_id: int | None = None):
+        if account_id is None:
+            account_id = getattr(client, "account_id", None)
+        link_key = normalize_link(link)
+        if link_key is None or account_id is None:
+            return await client.get_entity(link)
+
+        row = await self.lookup(link_key, account_id)
+        if row is not None and (row.get("access_hash") is not None or row["peer_type"] == "chat"):
+            self.hits += 1
+            return _input_peer(row)
+
+        self.misses += 1
+        entity = await client.get_entity(link)
+        await self.store(link_key, entity, account_id)
+        return entity
+
+    async def meta(self, link) -> dict | None:
+        """Что известно о ссылке без RPC (title, участники, тип) — или None."""
+        link_key = normalize_link(link)
+        return await self.lookup(link_key, None) if link_key else None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "memory_entries": len(self._memory),
+            "errors": self.errors,
+        }
+
+
+_CACHE: EntityCache | None = None
+
+
+def get_entity_cache() -> EntityCache:
+    global _CACHE
+    if _CACHE is None:
+        from config import ENTITY_CACHE_TTL_SEC, ENTITY_CACHE_MEMORY_SIZE
+        _CACHE = EntityCache(ENTITY_CACHE_TTL_SEC, ENTITY_CACHE_MEMORY_SIZE)
+    return _CACHE
+
+
+async def resolve_entity(client, link, account_id: int | None = None):
+    """client.get_entity(link) через кеш; account_id по умолчанию берётся у ScheduledTelegramClient."""
+    return await get_entity_cache().resolve(client, link, account_id)
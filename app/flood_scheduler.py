@@ -0,0 +1,188 @@
+# app/flood_scheduler.py
+"""
+Единый планировщик RPC с учётом FloodWait для всех аккаунтов процесса.
+
+Клиенты из make_client_with_metadata() и пула (app/telegram_client.py) — это
+ScheduledTelegramClient: каждый их запрос идёт через FloodScheduler.call():
+
+- token bucket на аккаунт (FLOOD_ACCOUNT_RATE / FLOOD_ACCOUNT_BURST) и,
+  если метод есть в FLOOD_METHOD_RATES, отдельный bucket на (аккаунт, метод);
+- FloodWait записывается как дедлайн (аккаунт, метод): следующие вызовы этого
+  метода не дёргают Telegram — короткий дедлайн отлёживают, на длинном сразу
+  получают FloodWaitError с оставшимися секундами;
+- короткие FloodWait (до FLOOD_SLEEP_THRESHOLD) планировщик отлёживает и
+  повторяет сам (как делал Telethon), длинные — пробрасывает FloodWaitError,
+  чтобы задача отдала работу другому аккаунту;
+- is_throttled()/throttled()/available() — для диспетчеризации и отчётов:
+  аккаунт с активным дедлайном не стоит нагружать новой работой. Ждать дедлайн
+  в цикле задачи нельзя: поток с аккаунтом под длинным FloodWait выходит, а его
+  работу разбирают остальные.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from typing import Awaitable, Callable, Iterable
+
+from telethon.errors import FloodWaitError
+
+from app.adaptive_limiter import report_overload
+
+# служебные запросы, которые не должны вставать в очередь за FloodWait (keepalive пула)
+EXEMPT_METHODS = frozenset({"PingRequest", "PingDelayDisconnectRequest"})
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(1e-6, float(rate))
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def wait_time(self) -> float:
+        """0 — токен взят; иначе сколько подождать до следующего."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+def method_name(request) -> str:
+    return type(request).__name__
+
+
+class FloodScheduler:
+    def __init__(self, account_rate: float = 5.0, account_burst: float = 10.0,
+                 method_rates: dict[str, tuple[float, float]] | None = None,
+                 sleep_threshold: float = 60.0):
+        self.account_rate = float(account_rate)
+        self.account_burst = float(account_burst)
+        self.method_rates = dict(method_rates or {})
+        self.sleep_threshold = float(sleep_threshold)
+
+        self._account_buckets: dict[int, _TokenBucket] = {}
+        self._method_buckets: dict[tuple[int, str], _TokenBucket] = {}
+        self._deadlines: dict[tuple[int, str], float] = {}   # (account, method) -> monotonic
+
+        self.calls = 0
+        self.floods = 0
+        self.throttle_wait_sec = 0.0
+
+    # ---------- дедлайны ----------
+    def record_flood(self, account_id: int, seconds: float, method: str = "*") -> None:
+        deadline = time.monotonic() + max(0.0, float(seconds))
+        key = (int(account_id), method)
+        if deadline > self._deadlines.get(key, 0.0):
+            self._deadlines[key] = deadline
+        self.floods += 1
+        report_overload(f"FloodWait {int(seconds)}s")  # адаптивный лимит массовой операции, если вызов внутри неё
+        print(f"[FLOOD] account {account_id}: {method} FloodWait {int(seconds)}s", flush=True)
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, d in self._deadlines.items() if d <= now]:
+            del self._deadlines[key]
+
+    def remaining(self, account_id: int, method: str | None = None) -> float:
+        """Сколько секунд аккаунт ещё под FloodWait (по методу или по любому методу)."""
+        now = time.monotonic()
+        acc = int(account_id)
+        left = [
+            d - now for (a, m), d in self._deadlines.items()
+            if a == acc and (method is None or m == method)
+        ]
+        return max([0.0] + left)
+
+    def is_throttled(self, account_id: int) -> bool:
+        return self.remaining(account_id) > 0
+
+    def throttled(self) -> dict[int, dict[str, int]]:
+        """{account_id: {method: секунд осталось}} — для отчётов и карточек."""
+        self._prune()
+        now = time.monotonic()
+        out: dict[int, dict[str, int]] = {}
+        for (acc, method), deadline in self._deadlines.items():
+            out.setdefault(acc, {})[method] = int(deadline - now) + 1
+        return out
+
+    def available(self, account_ids: Iterable[int]) -> list[int]:
+        """Аккаунты без активного FloodWait (порядок сохраняется)."""
+        return [a for a in account_ids if not self.is_throttled(a)]
+
+    # ---------- bucket'ы ----------
+    def _bucket_for(self, account_id: int, method: str) -> list[_TokenBucket]:
+        buckets = []
+        acc = self._account_buckets.get(account_id)
+        if acc is None:
+            acc = self._account_buckets[account_id] = _TokenBucket(self.account_rate, self.account_burst)
+        buckets.append(acc)
+        if method in self.method_rates:
+            key = (account_id, method)
+            mb = self._method_buckets.get(key)
+            if mb is None:
+                rate, burst = self.method_rates[method]
+                mb = self._method_buckets[key] = _TokenBucket(rate, burst)
+            buckets.append(mb)
+        return buckets
+
+    async def acquire(self, account_id: int, method: str, request=None) -> None:
+        started = time.monotonic()
+        left = self.remaining(account_id, method)
+        if left > self.sleep_threshold:
+            raise FloodWaitError(request, capture=math.ceil(left))
+        if left > 0:
+            await asyncio.sleep(left)
+        for bucket in self._bucket_for(account_id, method):
+            while True:
+                delay = bucket.wait_time()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+        self.throttle_wait_sec += time.monotonic() - started
+
+    # ---------- вызов ----------
+    async def call(self, account_id: int, request, invoke: Callable[[], Awaitable]):
+        method = method_name(request)
+        if method in EXEMPT_METHODS:
+            return await invoke()
+        retried = False
+        while True:
+            await self.acquire(account_id, method, request)
+            self.calls += 1
+            try:
+                return await invoke()
+            except FloodWaitError as e:
+                self.record_flood(account_id, e.seconds, method)
+                if retried or e.seconds > self.sleep_threshold:
+                    raise
+                retried = True  # короткий FloodWait: acquire() отлежит дедлайн, повторим один раз
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "floods": self.floods,
+            "throttled_accounts": len(self.throttled()),
+            "throttle_wait_sec": round(self.throttle_wait_sec, 1),
+        }
+
+
+_SCHEDULER: FloodScheduler | None = None
+
+
+def get_flood_scheduler() -> FloodScheduler:
+    global _SCHEDULER
+    if _SCHEDULER is None:
+        from config import FLOOD_ACCOUNT_RATE, FLOOD_ACCOUNT_BURST, FLOOD_METHOD_RATES, FLOOD_SLEEP_THRESHOLD
+        _SCHEDULER = FloodScheduler(
+            account_rate=FLOOD_ACCOUNT_RATE,
+            account_burst=FLOOD_ACCOUNT_BURST,
+            method_rates=FLOOD_METHOD_RATES,
+            sleep_threshold=FLOOD_SLEEP_THRESHOLD,
+        )
+    return _SCHEDULER
@@ -0,0 +1,72 @@
+# app/group_metadata.py
+"""
+Хранилище метаданных групп (group_metadata): участники, тип, открыта ли, когда проверяли.
+
+- check-groups: перед запуском split_fresh() отделяет ссылки, проверенные не раньше
+  N часов назад, — на аккаунты уходят только устаревшие и неизвестные; после проверки
+  record_check_results() переносит результаты из check_groups_log одной пачкой;
+- mass search: record_search_results() сохраняет группы из выдачи SearchRequest.
+"""
+from __future__ import annotations
+
+from app import db
+from app.db_async import run as run_db
+from app.entity_cache import normalize_link
+
+
+def group_key(link: str) -> str:
+    """Публичные ссылки/username — как в entity_cache ("u:name"), остальное (инвайты) — как есть."""
+    return normalize_link(link) or (link or "").strip().lower()
+
+
+async def split_fresh(links: list[str], max_age_hours: float) -> tuple[dict[str, dict], list[str]]:
+    """({link: запись из кеша}, [ссылки, которые нужно проверить аккаунтами])."""
+    if max_age_hours <= 0:
+        return {}, list(links)
+    keys = {link: group_key(link) for link in links}
+    rows = await run_db(db.get_fresh_group_metadata, list(set(keys.values())), max_age_hours)
+    fresh, stale = {}, []
+    for link in links:
+        row = rows.get(keys[link])
+        if row is not None:
+            fresh[link] = row
+        else:
+            stale.append(link)
+    return fresh, stale
+
+
+async def record_check_results(task_id: int) -> int:
+    """check_groups_log задачи → group_metadata (ok/small — открыта, bad — недоступна)."""
+    results = await run_db(db.get_check_groups_results, task_id)
+    rows = []
+    for link, result, members in results:
+        if not link or result not in ("ok", "small", "bad"):
+            continue
+        rows.append({
+            "link_key": group_key(link),
+            "link": link,
+            "participants_count": members if result != "bad" else None,
+            "is_open": result != "bad",
+            "last_result": result,
+        })
+    return await run_db(db.upsert_group_metadata, rows)
+
+
+async def record_search_results(groups: list[dict]) -> int:
+    """Группы из выдачи поиска: {"id", "title", "username", "members"} — публичные мегагруппы."""
+    rows = []
+    for g in groups:
+        if not g.get("username"):
+            continue
+        link = f"https://t.me/{g['username']}"
+        rows.append({
+            "link_key": group_key(link),
+            "link": link,
+            "peer_id": g.get("id"),
+            "peer_type": "megagroup",
+            "title": g.get("title"),
+            "participants_count": g.get("members"),
+            "is_open": True,
+            "last_result": "search",
+        })
+    return await run_db(db.upsert_group_metadata, rows)
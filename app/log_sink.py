@@ -0,0 +1,239 @@
+# app/log_sink.py
+"""
+Буферизованная запись логов задач (join/like/check/2FA/comment-check/create).
+
+Пока sink запущен (bot.main), хелперы insert_join_groups_log, insert_like_log,
+log_check_group, add_twofa_log, insert_comment_check_log и insert_task_create_log,
+вызванные из event loop, не ходят в БД, а кладут строку в буфер таблицы.
+Фоновый флашер пишет буферы одним multi-row INSERT каждые LOG_SINK_FLUSH_MS
+или как только в таблице накопилось LOG_SINK_BATCH_SIZE строк.
+
+В конце задачи (перед чтением логов для отчёта) нужно вызвать `await log_sink.flush()`;
+False — БД была недоступна и часть строк ещё в буфере (допишутся следующим циклом).
+Пачку, отвергнутую из-за самих данных (FK на удалённую задачу, CHECK, тип), флашер
+дописывает построчно, а битые строки отбрасывает — иначе одна такая строка навсегда
+заблокировала бы запись всей таблицы.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import psycopg2
+
+from app import db
+from app.db_async import run as run_db
+
+# таблица -> колонки в порядке кортежа строки
+LOG_TABLES: dict[str, tuple[str, ...]] = {
+    "join_groups_log":   ("task_id", "account_id", "group_link", "status", "message"),
+    "like_comments_log": ("task_id", "account_id", "channel", "post_id", "comment_id", "reaction", "status", "message"),
+    "check_groups_log":  ("task_id", "account_id", "account_username", "checked_group", "result", "members", "error_message"),
+    "twofa_logs":        ("task_id", "account_id", "username", "ok", "removed_other", "message"),
+    "comment_check_log": ("task_id", "account_id", "channel", "can_comment", "mode", "message"),
+    "task_create":       ("task_id", "account_id", "log_text"),
+}
+
+
+class LogSink:
+    def __init__(self, batch_size: int = 500, flush_interval_ms: int = 1000, max_pending: int = 100_000):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(10, int(flush_interval_ms)) / 1000.0
+        self.max_pending = max(self.batch_size, int(max_pending))
+
+        self._buffers: dict[str, list[tuple]] = {t: [] for t in LOG_TABLES}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread_id: int | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._flusher: asyncio.Task | None = None
+        self._flush_lock: asyncio.Lock | None = None
+
+        # счётчики
+        self.rows_enqueued = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_rejected = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    # ---------- жизненный цикл ----------
+    def start(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher = asyncio.create_task(self._run(), name="log-sink-flusher")
+
+    async def stop(self) -> None:
+        """Останавливает флашер и дописывает всё, что осталось в буферах."""
+        task, self._flusher = self._flusher, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._flush_lock is not None:
+            await self.flush()
+        self._loop = None
+        self._thread_id = None
+
+    @property
+    def running(self) -> bool:
+        return self._flusher is not None and not self._flusher.done()
+
+    def accepts(self) -> bool:
+        """Буферизуем только вызовы из потока event loop, где живёт флашер."""
+        return self.running and threading.get_ident() == self._thread_id
+
+    # ---------- запись ----------
+    def put(self, table: str, row: tuple) -> None:
+        buf = self._buffers[table]
+        if len(buf) >= self.max_pending:
+            # БД недоступна слишком долго — теряем самое старое, а не память процесса
+            del buf[0]
+            self.rows_dropped += 1
+        buf.append(row)
+        self.rows_enqueued += 1
+        if len(buf) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """Записать все буферы прямо сейчас (вызывать по завершении задачи). False — что-то осталось в буфере."""
+        if self._flush_lock is None:
+            return True
+        complete = True
+        async with self._flush_lock:
+            for table, columns in LOG_TABLES.items():
+                rows = self._buffers[table]
+                if not rows:
+                    continue
+                self._buffers[table] = []
+                started = time.perf_counter()
+                written = len(rows)
+                try:
+                    try:
+                        await run_db(db.insert_log_rows, table, columns, rows, self.batch_size)
+                    except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+                        # пачку отвергли данные, а не БД — повтор упрётся в ту же строку
+                        print(f"[LOG_SINK] ⚠️ flush {table} ({len(rows)} rows) rejected: {e} — writing row by row", flush=True)
+                        rejected = await run_db(db.insert_log_rows_each, table, columns, rows)
+                        written -= len(rejected)
+                        self.rows_rejected += len(rejected)
+                        for row, error in rejected:
+                            print(f"[LOG_SINK] ❌ {table}: dropped row {row!r}: {error}", flush=True)
+                except Exception as e:
+                    self.errors += 1
+                    complete = False
+                    print(f"[LOG_SINK] ❌ flush {table} ({len(rows)} rows) failed: {e}", flush=True)
+                    # БД недоступна — вернём строки в начало буфера, повторим на следующем цикле
+                    self._buffers[table] = rows + self._buffers[table]
+                    continue
+                elapsed_ms = (time.perf_counter() - started) * 1000.0
+                self.flushes += 1
+                self.rows_written += written
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self._total_flush_ms += elapsed_ms
+        return complete
+
+    async def amend(self, table: str, where: dict, **changes) -> bool:
+        """
+        Поправить последнюю ещё не записанную строку table, у которой колонки совпадают с where.
+        Ждёт идущий flush: после него строка либо снова в буфере (запись не удалась), либо в БД.
+        False — в буфере такой строки нет, править нужно в БД.
+        """
+        if self._flush_lock is None:
+            return False
+        columns = LOG_TABLES[table]
+        where_idx = [(columns.index(c), v) for c, v in where.items()]
+        change_idx = [(columns.index(c), v) for c, v in changes.items()]
+        async with self._flush_lock:
+            buf = self._buffers[table]
+            for i in range(len(buf) - 1, -1, -1):
+                row = buf[i]
+                if all(row[idx] == v for idx, v in where_idx):
+                    new_row = list(row)
+                    for idx, v in change_idx:
+                        new_row[idx] = v
+                    buf[i] = tuple(new_row)
+                    return True
+        return False
+
+    # ---------- метрики ----------
+    def queue_depth(self) -> int:
+        return sum(len(b) for b in self._buffers.values())
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth(),
+            "per_table": {t: len(b) for t, b in self._buffers.items() if b},
+            "rows_enqueued": self.rows_enqueued,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "rows_rejected": self.rows_rejected,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 1) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 1),
+        }
+
+
+_SINK: LogSink | None = None
+
+
+def get_sink() -> LogSink | None:
+    return _SINK
+
+
+async def start() -> LogSink:
+    """Запускает глобальный sink и включает буферизацию в хелперах app/db.py."""
+    global _SINK
+    from config import LOG_SINK_BATCH_SIZE, LOG_SINK_FLUSH_MS
+    if _SINK is None:
+        _SINK = LogSink(batch_size=LOG_SINK_BATCH_SIZE, flush_interval_ms=LOG_SINK_FLUSH_MS)
+    _SINK.start()
+    db.set_log_sink(_SINK)
+    return _SINK
+
+
+async def stop() -> None:
+    global _SINK
+    sink, _SINK = _SINK, None
+    db.set_log_sink(None)
+    if sink is not None:
+        await sink.stop()
+
+
+async def amend(table: str, where: dict, **changes) -> bool:
+    """См. LogSink.amend; без sink'а строки пишутся сразу — в буфере их нет."""
+    if _SINK is not None:
+        return await _SINK.amend(table, where, **changes)
+    return False
+
+
+async def flush() -> bool:
+    """False — часть строк не записана (БД недоступна), они остались в буфере."""
+    if _SINK is not None:
+        return await _SINK.flush()
+    return True
+
+
+def stats() -> dict:
+    return _SINK.stats() if _SINK is not None else {}
@@ -0,0 +1,284 @@
+# app/migrations.py
+"""
+Версионированные миграции схемы — единственное место, где приложение меняет свою схему.
+
+    apply_migrations(indexes=False)  — bot.py / worker.py до старта очереди: таблицы и колонки
+    apply_migrations()               — bot.py в фоне после старта: плюс индексы горячих путей
+    python -m app.migrations         — шаг деплоя: накатить всё сразу
+    python -m app.migrations --check — EXPLAIN горячих запросов; код выхода 1, если где-то Seq Scan
+
+Версия — либо SQL-шаги (ADD COLUMN / CREATE TABLE / триггеры: выполняются одной
+транзакцией вместе с записью в schema_migrations), либо индексы. Индексы строятся
+CREATE INDEX CONCURRENTLY (без блокировки записи в логи) и старт не держат; индекс
+пропускается, если у таблицы уже есть валидный индекс с теми же ведущими колонками
+(UNIQUE/PK из bd.sql или bootstrap_*), а недостроенный (INVALID) после прерванной
+сборки — пересоздаётся.
+
+Применённые версии пишутся в schema_migrations. Параллельный старт нескольких процессов
+разводится advisory lock'ами: схему накатывает один процесс (остальные ждут его),
+индексы строит один (остальные их пропускают).
+"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+
+from psycopg2 import sql
+
+from app import db
+from app.db import get_direct_connection
+
+_LOCK_KEY = 7_310_025        # pg_advisory_lock: один мигратор схемы на базу
+_INDEX_LOCK_KEY = 7_310_026  # pg_try_advisory_lock: индексы строит один процесс
+
+
+def _grant_app_owner(*tables: str):
+    """SQL-шаг: права PG_APP_OWNER на новые таблицы, если миграции катит другая роль."""
+    def step(cur) -> None:
+        owner = os.getenv("PG_APP_OWNER", "tguser")
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = %s) AND %s <> current_user",
+                    (owner, owner))
+        if not cur.fetchone()[0]:
+            return
+        for table in tables:
+            cur.execute(
+                sql.SQL("GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE {} TO {}")
+                   .format(sql.Identifier("public", table), sql.Identifier(owner))
+            )
+    return step
+
+
+# (table, name, columns, method)
+_HOT_INDEXES_V1 = [
+    ("like_reactions", "idx_like_reactions_lookup",
+     ["task_id", "account_id", "channel_username", "post_id", "comment_id"], "btree"),
+    ("like_comments_log", "idx_like_comments_log_task_status", ["task_id", "status"], "btree"),
+    ("join_groups_log", "idx_join_groups_log_task", ["task_id"], "btree"),
+    ("search_groups_results", "idx_search_groups_results_task_user", ["task_id", "user_id"], "btree"),
+    ("like_blacklisted_posts", "idx_like_blacklisted_posts_channel_post", ["channel", "post_id"], "btree"),
+    ("tasks", "idx_tasks_type_created", ["type", "created_at"], "btree"),
+    # session_string — длинная строка, ищется только на равенство: hash-индекс хранит 4 байта на строку
+    ("accounts", "idx_accounts_session_hash", ["session_string"], "hash"),
+]
+
+# version -> (описание, шаги): шаги-кортежи — индексы (table, name, columns, method),
+# строки и callable(cur) — SQL-шаги схемы. В одной версии шаги одного рода.
+# DDL таблиц лежит в app/db.py рядом с DAO, которые ими пользуются (*_SCHEMA); здесь — только порядок.
+MIGRATIONS: dict[int, tuple[str, list]] = {
+    1: ("hot lookup indexes", _HOT_INDEXES_V1),
+    2: ("proxy check stats", db.PROXY_STATS_SCHEMA),
+    3: ("task queue columns", db.TASK_QUEUE_SCHEMA),
+    4: ("entity cache", [*db.ENTITY_CACHE_SCHEMA, _grant_app_owner("entity_cache", "entity_access_hash")]),
+    5: ("group metadata", [*db.GROUP_METADATA_SCHEMA, _grant_app_owner("group_metadata")]),
+    6: ("search keyword cache", [*db.SEARCH_CACHE_SCHEMA, _grant_app_owner("search_keyword_cache")]),
+    # триггеры пишут в task_counters от имени приложения — без прав упадёт любая вставка в логи
+    7: ("task counters", [*db.TASK_COUNTERS_SCHEMA, _grant_app_owner("task_counters")]),
+    8: ("scrub secrets from job args", db.TASK_QUEUE_SCRUB_SECRETS),
+}
+
+# запросы, которые не должны уходить в Seq Scan (параметры — только для планировщика)
+HOT_QUERIES = [
+    ("like_reactions by task/account/channel",
+     "SELECT post_id, comment_id FROM like_reactions WHERE task_id=%s AND account_id=%s AND channel_username=%s",
+     (1, 1, "x")),
+    ("like_comments_log by task/status",
+     "SELECT count(*) FROM like_comments_log WHERE task_id=%s AND status=%s", (1, "ok")),
+    ("join_groups_log by task",
+     "SELECT * FROM join_groups_log WHERE task_id = %s ORDER BY account_id, id", (1,)),
+    ("search_groups_results by task/user",
+     "SELECT keyword, title, username, members FROM search_groups_results WHERE task_id=%s AND user_id=%s", (1, 1)),
+    ("like_blacklisted_posts by channel/post",
+     "SELECT 1 FROM like_blacklisted_posts WHERE channel=%s AND post_id=%s LIMIT 1", ("x", 1)),
+    ("tasks by type, newest first",
+     "SELECT * FROM tasks WHERE type = %s ORDER BY created_at DESC LIMIT %s OFFSET %s", ("x", 10, 0)),
+    ("accounts by session_string",
+     "SELECT * FROM public.accounts WHERE session_string = %s LIMIT 1", ("x",)),
+]
+
+
+def _is_index_version(steps: list) -> bool:
+    return all(isinstance(step, tuple) for step in steps)
+
+
+def _table_exists(cur, table: str) -> bool:
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (f"public.{table}",))
+    return cur.fetchone()[0]
+
+
+def _covering_index(cur, table: str, columns: list[str], method: str) -> str | None:
+    """Имя валидного индекса того же типа, чьи ведущие колонки — columns, или None."""
+    cur.execute("""
+        SELECT ic.relname, am.amname, i.indisvalid,
+               ARRAY(SELECT a.attname FROM unnest(i.indkey) WITH ORDINALITY k(attnum, n)
+                       JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                      ORDER BY k.n)
+          FROM pg_index i
+          JOIN pg_class ic ON ic.oid = i.indexrelid
+          JOIN pg_am am ON am.oid = ic.relam
+         WHERE i.indrelid = %s::regclass
+    """, (f"public.{table}",))
+    for name, amname, valid, cols in cur.fetchall():
+        if valid and amname == method and list(cols[:len(columns)]) == columns:
+            return name
+    return None
+
+
+def _ensure_index(cur, table: str, name: str, columns: list[str], method: str) -> tuple[bool, str]:
+    """(создан ли индекс, строка для лога)."""
+    if not _table_exists(cur, table):
+        return False, f"skip {name}: no table {table}"
+    existing = _covering_index(cur, table, columns, method)
+    if existing:
+        return False, f"skip {name}: covered by {existing}"
+    # прерванный CONCURRENTLY оставляет INVALID-индекс — IF NOT EXISTS его не пересоздаст
+    cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS public."{name}"')
+    cols = ", ".join(f'"{c}"' for c in columns)
+    cur.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON public."{table}" USING {method} ({cols})')
+    return True, f"created {name}"
+
+
+def _applied_versions(cur) -> set[int]:
+    cur.execute("SELECT version FROM schema_migrations")
+    return {r[0] for r in cur.fetchall()}
+
+
+def _record(cur, version: int, name: str) -> None:
+    cur.execute(
+        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+        (version, name),
+    )
+
+
+def _apply_schema_versions(cur) -> list[str]:
+    done: list[str] = []
+    applied = _applied_versions(cur)
+    for version in sorted(MIGRATIONS):
+        name, steps = MIGRATIONS[version]
+        if version in applied or _is_index_version(steps):
+            continue
+        cur.execute("BEGIN")
+        try:
+            for step in steps:
+                if callable(step):
+                    step(cur)
+                else:
+                    cur.execute(step)
+            _record(cur, version, name)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        done.append(f"migration {version} ({name}) applied")
+    return done
+
+
+def _apply_index_versions(cur) -> list[str]:
+    cur.execute("SELECT pg_try_advisory_lock(%s)", (_INDEX_LOCK_KEY,))
+    if not cur.fetchone()[0]:
+        return ["skip indexes: another process is building them"]
+    done: list[str] = []
+    try:
+        applied = _applied_versions(cur)
+        for version in sorted(MIGRATIONS):
+            name, steps = MIGRATIONS[version]
+            if version in applied or not _is_index_version(steps):
+                continue
+            touched: set[str] = set()
+            for table, index_name, columns, method in steps:
+                created, line = _ensure_index(cur, table, index_name, columns, method)
+                done.append(line)
+                if created:
+                    touched.add(table)
+            for table in sorted(touched):
+                # свежая статистика, чтобы планировщик увидел новые индексы
+                cur.execute(f'ANALYZE public."{table}"')
+            _record(cur, version, name)
+            done.append(f"migration {version} ({name}) applied")
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (_INDEX_LOCK_KEY,))
+    return done
+
+
+def apply_migrations(indexes: bool = True) -> list[str]:
+    """
+    Накатить неприменённые версии; возвращает, что сделано (для лога).
+    indexes=False — только схема (быстро, до старта очереди), индексы — отдельным вызовом в фоне.
+    """
+    done: list[str] = []
+    conn = get_direct_connection()
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY не работает внутри транзакции
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (_LOCK_KEY,))
+            try:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version    INTEGER PRIMARY KEY,
+                        name       TEXT NOT NULL,
+                        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                    )
+                """)
+                done.extend(_apply_schema_versions(cur))
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (_LOCK_KEY,))
+            if indexes:
+                done.extend(_apply_index_versions(cur))
+    finally:
+        conn.close()
+    return done
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name", "?"))
+    for child in plan.get("Plans", []) or []:
+        found.extend(_seq_scans(child))
+    return found
+
+
+def check_query_plans() -> list[str]:
+    """
+    EXPLAIN каждого HOT_QUERIES с enable_seqscan=off: если планировщик всё равно
+    выбирает Seq Scan — подходящего индекса нет. Возвращает список проблем (пустой — всё ок).
+    """
+    problems: list[str] = []
+    conn = get_direct_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET enable_seqscan = off")
+            for title, query, params in HOT_QUERIES:
+                try:
+                    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                    plan = cur.fetchone()[0]
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    tables = _seq_scans(plan[0]["Plan"])
+                    if tables:
+                        problems.append(f"{title}: Seq Scan on {', '.join(tables)}")
+                except Exception as e:
+                    conn.rollback()
+                    cur.execute("SET enable_seqscan = off")
+                    problems.append(f"{title}: EXPLAIN failed: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+    return problems
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if "--check" not in argv:
+        for line in apply_migrations():
+            print(line)
+    problems = check_query_plans()
+    for line in problems:
+        print(f"❌ {line}")
+    if not problems:
+        print(f"✅ {len(HOT_QUERIES)} hot queries use indexes")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+# app/progress.py
+"""
+Прогресс задачи со сбросом в БД не чаще раза в N секунд.
+
+    progress = ProgressTracker(task_id, column="progress")
+    await progress.update(processed_keywords=3, groups_found=40)   # в памяти, в БД — по таймеру
+    ...
+    await progress.update(force=True, status="done")               # финал — сразу
+
+Счётчики живут в памяти; в БД уходят только изменившиеся с прошлого сброса ключи,
+частичным jsonb-merge (db.merge_task_progress) в tasks.payload или tasks.progress —
+payload целиком больше не переписывается на каждую ссылку/ключ.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+
+from app import db
+from app.db_async import run as run_db
+
+
+class ProgressTracker:
+    def __init__(self, task_id: int, column: str = "payload", interval: float | None = None):
+        if interval is None:
+            from config import TASK_PROGRESS_FLUSH_SEC
+            interval = TASK_PROGRESS_FLUSH_SEC
+        self.task_id = task_id
+        self.column = column
+        self.interval = max(0.0, float(interval))
+        self._values: dict = {}
+        self._dirty: set[str] = set()
+        self._last_flush = 0.0
+        self._lock = asyncio.Lock()
+        self.flushes = 0
+
+    def set(self, **fields) -> None:
+        for key, value in fields.items():
+            if key not in self._values or self._values[key] != value:
+                self._values[key] = value
+                self._dirty.add(key)
+
+    def get(self, key: str, default=None):
+        return self._values.get(key, default)
+
+    async def update(self, force: bool = False, **fields) -> None:
+        self.set(**fields)
+        if force or time.monotonic() - self._last_flush >= self.interval:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._dirty:
+                return
+            changed = {key: self._values[key] for key in self._dirty}
+            self._dirty.clear()
+            self._last_flush = time.monotonic()
+            try:
+                await run_db(db.merge_task_progress, self.task_id, changed, self.column)
+                self.flushes += 1
+            except Exception as e:
+                self._dirty.update(changed)  # не потеряем — уйдёт со следующим сбросом
+                print(f"[PROGRESS] task {self.task_id}: flush failed: {e}", flush=True)
@@ -0,0 +1,294 @@
+# app/task_queue.py
+"""
+Durable-очередь фоновых задач поверх таблицы tasks.
+
+Хендлер создаёт строку tasks как раньше, а вместо asyncio.create_task(...) ставит
+её в очередь:
+
+    await task_queue.submit(task_id, "join_groups", {"chat_id": ..., ...})
+
+Исполнители регистрируются по типу:
+
+    @task_queue.job("join_groups", concurrency=2)
+    async def _run_join_groups(ctx: task_queue.JobContext):
+        ...  # ctx.bot, ctx.task_id, ctx.args, ctx.task
+
+Воркеры (start/stop из bot.main) забирают задачи через FOR UPDATE SKIP LOCKED и
+продлевают аренду heartbeat'ом. Ограничения: общий TASK_QUEUE_MAX_WORKERS и per-type
+(concurrency в job() или TASK_TYPE_CONCURRENCY из .env).
+
+Исполнитель при повторе запускается заново, поэтому max_attempts > 1 объявляют только
+те, кто продолжает с сохранённого прогресса (join_groups: ссылки, уже записанные в
+join_groups_log, повторно не берутся). Их задачи после остановки процесса, истёкшей
+аренды упавшего процесса или ошибки возвращаются в очередь, пока есть попытки.
+Остальные однократны — повтор сделал бы работу дважды (boost_views накрутит просмотры
+ещё раз, reauthorize_accounts запросит новые коды, comment_check и like_comments —
+циклы скомпилированных модулей без точки продолжения): их прерванная задача уходит
+в failed, а карточка — в status='error'.
+
+При WORKER_SHARDS = N > 0 очередь крутится не в боте, а в N процессах worker.py:
+процесс i берёт только задачи с job_shard % N == i, где job_shard — аккаунт задачи
+(для задач на несколько аккаунтов — наименьший id из списка, см. shard_key_for).
+Шард — только распределение нагрузки: наборы аккаунтов у шардов пересекаются, и от
+двойного подключения аккаунта защищает межпроцессный lock в пуле клиентов.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import traceback
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from app import db
+from app.db_async import run as run_db
+
+
+@dataclass
+class JobContext:
+    bot: object
+    task_id: int
+    args: dict
+    task: dict
+    attempt: int
+
+
+@dataclass
+class JobSpec:
+    kind: str
+    fn: Callable[[JobContext], Awaitable[None]]
+    concurrency: int = 1
+    max_attempts: int = 1
+    lease_sec: float | None = None
+
+
+_REGISTRY: dict[str, JobSpec] = {}
+
+
+def job(kind: str, concurrency: int = 1, max_attempts: int = 1, lease_sec: float | None = None):
+    """Декоратор: регистрирует исполнителя задач типа kind (max_attempts > 1 — только идемпотентным)."""
+    def deco(fn):
+        _REGISTRY[kind] = JobSpec(kind, fn, max(1, int(concurrency)), max(1, int(max_attempts)), lease_sec)
+        return fn
+    return deco
+
+
+def shard_key_for(account_ids) -> int | None:
+    """Ключ шарда для задачи на несколько аккаунтов: наименьший id (стабилен для одного набора).
+
+    Эксклюзивности аккаунтов не даёт — её держит lease_client() через advisory lock в БД.
+    """
+    ids = [int(a) for a in (account_ids or [])]
+    return min(ids) if ids else None
+
+
+async def submit(task_id: int, kind: str, args: dict | None = None, delay_sec: float = 0,
+                 shard_key: int | None = None) -> None:
+    """Поставить существующую задачу в очередь и разбудить воркеров."""
+    spec = _REGISTRY.get(kind)
+    if spec is None:
+        raise KeyError(f"no job registered for kind {kind!r}")
+    await run_db(db.enqueue_job, task_id, kind, args or {}, spec.max_attempts, delay_sec, shard_key)
+    if _QUEUE is not None:
+        _QUEUE.wakeup()
+
+
+class TaskQueue:
+    def __init__(self, bot, max_workers: int = 8, lease_sec: float = 120.0,
+                 poll_interval: float = 2.0, type_limits: dict[str, int] | None = None,
+                 retry_delay_sec: float = 30.0, shard_index: int = 0, shard_count: int = 1):
+        self.bot = bot
+        self.shard_count = max(1, int(shard_count))
+        self.shard_index = int(shard_index) % self.shard_count
+        self.max_workers = max(1, int(max_workers))
+        self.lease_sec = max(10.0, float(lease_sec))
+        self.poll_interval = max(0.2, float(poll_interval))
+        self.type_limits = dict(type_limits or {})
+        self.retry_delay_sec = float(retry_delay_sec)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._running: dict[int, asyncio.Task] = {}
+        self._running_by_kind: dict[str, int] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._loop_task: asyncio.Task | None = None
+        self._stopping = False
+
+        self.claimed = 0
+        self.completed = 0
+        self.failed = 0
+        self.recovered = 0
+
+    # ---------- лимиты ----------
+    def limit_for(self, spec: JobSpec) -> int:
+        return max(1, int(self.type_limits.get(spec.kind, spec.concurrency)))
+
+    def free_slots(self, spec: JobSpec) -> int:
+        global_free = self.max_workers - len(self._running)
+        kind_free = self.limit_for(spec) - self._running_by_kind.get(spec.kind, 0)
+        return max(0, min(global_free, kind_free))
+
+    # ---------- жизненный цикл ----------
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._loop_task = asyncio.create_task(self._dispatch_loop(), name="task-queue-dispatcher")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Останавливает диспетчер; незавершённые задачи с повторами возвращаются в очередь, остальные — failed."""
+        self._stopping = True
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        running = list(self._running.values())
+        for t in running:
+            t.cancel()
+        if running:
+            await asyncio.wait(running, timeout=timeout)
+
+    def wakeup(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ---------- диспетчер ----------
+    async def _dispatch_loop(self) -> None:
+        while True:
+            try:
+                recovered = await run_db(db.recover_expired_jobs)
+                if recovered:
+                    self.recovered += len(recovered)
+                    print(f"[TASK_QUEUE] recovered expired leases: {recovered}", flush=True)
+                for spec in list(_REGISTRY.values()):
+                    slots = self.free_slots(spec)
+                    if not slots:
+                        continue
+                    rows = await run_db(db.claim_jobs, spec.kind, slots, self.owner, self._lease_for(spec),
+                                        self.shard_index, self.shard_count)
+                    for row in rows:
+                        self._spawn(spec, row)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[TASK_QUEUE] dispatcher error: {e}", flush=True)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _lease_for(self, spec: JobSpec) -> float:
+        return float(spec.lease_sec or self.lease_sec)
+
+    def _spawn(self, spec: JobSpec, row: dict) -> None:
+        task_id = int(row["id"])
+        self.claimed += 1
+        self._running_by_kind[spec.kind] = self._running_by_kind.get(spec.kind, 0) + 1
+        t = asyncio.create_task(self._run_one(spec, row), name=f"job-{spec.kind}-{task_id}")
+        self._running[task_id] = t
+
+        def _done(_):
+            self._running.pop(task_id, None)
+            self._running_by_kind[spec.kind] = max(0, self._running_by_kind.get(spec.kind, 1) - 1)
+            self.wakeup()  # освободился слот — пробуем забрать следующую
+        t.add_done_callback(_done)
+
+    async def _heartbeat(self, task_id: int, lease: float, job_task: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(lease / 3)
+            try:
+                alive = await run_db(db.extend_job_lease, task_id, self.owner, lease)
+            except Exception as e:
+                print(f"[TASK_QUEUE] heartbeat #{task_id} failed: {e}", flush=True)
+                continue
+            if not alive:
+                print(f"[TASK_QUEUE] lease for #{task_id} lost — cancelling", flush=True)
+                job_task.cancel()
+                return
+
+    async def _run_one(self, spec: JobSpec, row: dict) -> None:
+        task_id = int(row["id"])
+        lease = self._lease_for(spec)
+        ctx = JobContext(
+            bot=self.bot, task_id=task_id, args=dict(row.get("job_args") or {}),
+            task=row, attempt=int(row.get("attempts") or 1),
+        )
+        print(f"[TASK_QUEUE] ▶ #{task_id} {spec.kind} (attempt {ctx.attempt}/{row.get('max_attempts')})", flush=True)
+        job_task = asyncio.current_task()
+        hb = asyncio.create_task(self._heartbeat(task_id, lease, job_task))
+        error = None
+        release = False
+        try:
+            await spec.fn(ctx)
+        except asyncio.CancelledError:
+            # вернуть в очередь можно только то, что умеет продолжить, а не начать заново
+            release = self._stopping and spec.max_attempts > 1
+            if not release:
+                error = "interrupted by shutdown" if self._stopping else "cancelled (lease lost)"
+        except Exception as e:
+            error = f"{e.__class__.__name__}: {e}"
+            traceback.print_exc()
+        finally:
+            hb.cancel()
+        try:
+            state = await run_db(db.finish_job, task_id, self.owner, error, self.retry_delay_sec, release)
+        except Exception as e:
+            print(f"[TASK_QUEUE] finish #{task_id} failed: {e}", flush=True)
+            return
+        if state == "done":
+            self.completed += 1
+        elif state == "failed":
+            self.failed += 1
+        print(f"[TASK_QUEUE] ■ #{task_id} {spec.kind} -> {state}{f' ({error})' if error else ''}", flush=True)
+
+    def stats(self) -> dict:
+        return {
+            "owner": self.owner,
+            "shard": f"{self.shard_index}/{self.shard_count}",
+            "running": len(self._running),
+            "running_by_kind": {k: v for k, v in self._running_by_kind.items() if v},
+            "max_workers": self.max_workers,
+            "claimed": self.claimed,
+            "completed": self.completed,
+            "failed": self.failed,
+            "recovered": self.recovered,
+        }
+
+
+_QUEUE: TaskQueue | None = None
+
+
+def get_queue() -> TaskQueue | None:
+    return _QUEUE
+
+
+async def start(bot, shard_index: int = 0, shard_count: int = 1) -> TaskQueue:
+    global _QUEUE
+    from config import (
+        TASK_QUEUE_MAX_WORKERS, TASK_QUEUE_LEASE_SEC, TASK_QUEUE_POLL_SEC,
+        TASK_TYPE_CONCURRENCY, TASK_QUEUE_RETRY_DELAY_SEC,
+    )
+    if _QUEUE is None:
+        _QUEUE = TaskQueue(
+            bot,
+            max_workers=TASK_QUEUE_MAX_WORKERS,
+            lease_sec=TASK_QUEUE_LEASE_SEC,
+            poll_interval=TASK_QUEUE_POLL_SEC,
+            type_limits=TASK_TYPE_CONCURRENCY,
+            retry_delay_sec=TASK_QUEUE_RETRY_DELAY_SEC,
+            shard_index=shard_index,
+            shard_count=shard_count,
+        )
+        await _QUEUE.start()
+    return _QUEUE
+
+
+async def stop() -> None:
+    global _QUEUE
+    q, _QUEUE = _QUEUE, None
+    if q is not None:
+        await q.stop()
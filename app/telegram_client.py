@@ -2,56 +2,446 @@
 from __future__ import annotations
 
 import asyncio
+import random
 import re
 import socks
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 from typing import Optional, Tuple, Dict, Any
 
 from telethon import TelegramClient, errors, functions
 from telethon.sessions import StringSession, SQLiteSession
 
+from app.flood_scheduler import get_flood_scheduler
 from app.db import (
     get_account_by_id,
     get_account_by_phone,
     get_account_by_session_string,
     get_available_api_key,
+    get_wanted_account_sessions,
     increment_api_key_usage,
+    try_lock_account_session,
+    unlock_account_session,
     update_account_status_to_banned,
+    want_account_session,
 )
-_CLIENT_CACHE: dict[int, TelegramClient] = {}
-_ACCOUNT_LOCKS: dict[int, asyncio.Lock] = {}
 META_FIELDS = ("device_model", "system_version", "app_version", "lang_code", "system_lang_code")
 
+# ошибки, после которых клиент аккаунта в пуле больше не годится
+_FATAL_CLIENT_ERRORS = (
+    errors.AuthKeyUnregisteredError,
+    errors.AuthKeyDuplicatedError,
+    errors.SessionRevokedError,
+    errors.UserDeactivatedError,
+    errors.UserDeactivatedBanError,
+)
+
+class ScheduledTelegramClient(TelegramClient):
+    """
+    TelegramClient, все RPC которого идут через общий FloodScheduler:
+    bucket'ы на аккаунт/метод и дедлайны FloodWait (app/flood_scheduler.py).
+    Без account_id ведёт себя как обычный TelegramClient.
+    """
+
+    def __init__(self, *args, account_id: int | None = None, **kwargs):
+        if account_id is not None:
+            kwargs.setdefault("flood_sleep_threshold", 0)  # FloodWait отлёживает планировщик
+        super().__init__(*args, **kwargs)
+        self.account_id = account_id
+        self.last_request = time.monotonic()  # по нему пул видит простой «закреплённых» клиентов
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        self.last_request = time.monotonic()
+        invoke = super().__call__
+        if self.account_id is None:
+            return await invoke(request, ordered=ordered, flood_sleep_threshold=flood_sleep_threshold)
+        return await get_flood_scheduler().call(
+            self.account_id, request,
+            lambda: invoke(request, ordered=ordered, flood_sleep_threshold=flood_sleep_threshold),
+        )
+
+
 # -----------------------------
-# Вспомогательные билдеры/утилы
+# Пул клиентов по аккаунтам
 # -----------------------------
 
-# app/telegram_client.py
-async def get_or_create_account_client(account_id: int) -> TelegramClient:
+@dataclass
+class _PoolEntry:
+    client: TelegramClient
+    last_used: float = field(default_factory=time.monotonic)
+    leased: bool = False   # сейчас выдан через lease_client()
+    pinned: bool = False   # выдан «навсегда» через get_or_create_account_client()
+    stale: bool = False    # настройки аккаунта (прокси) сменились — пересоздать, как освободится
+
+    def idle_for(self, now: float) -> float:
+        """Простой с последней выдачи или RPC (закреплённым клиентом пользуются мимо пула)."""
+        return now - max(self.last_used, getattr(self.client, "last_request", 0.0))
+
+
+class TelegramClientPool:
     """
-    Вернёт подключённый (или переподключённый) клиент для аккаунта.
-    Единая точка reuse без дублирования соединений.
+    Один живой TelegramClient на аккаунт для всех типов задач.
+
+    - lease(account_id): эксклюзивная аренда; параллельные задачи на одном аккаунте
+      ждут друг друга, а не открывают вторую MTProto-сессию;
+    - не больше max_connected подключённых клиентов: при нехватке вытесняется
+      давно простаивающий (LRU), иначе ждём освобождения не дольше slot_wait секунд;
+    - фоновый keepalive: ping простаивающих, отключение тех, кто простоял дольше idle_ttl
+      (закреплённых через get() — тоже, если ими не пользовались дольше idle_ttl);
+    - межпроцессная эксклюзивность: пока клиент подключён, процесс держит advisory lock
+      аккаунта в БД (db.try_lock_account_session) — бот и шарды worker.py не подключат
+      одну сессию дважды. Чужой процесс ждёт до session_wait секунд, а владелец,
+      увидев ожидание, отпускает простаивающий клиент (проверка раз в yield_interval).
     """
-    lock = _ACCOUNT_LOCKS.setdefault(account_id, asyncio.Lock())
-    async with lock:
-        cli = _CLIENT_CACHE.get(account_id)
-        if cli is not None:
+
+    def __init__(self, max_connected: int, idle_ttl: float, keepalive_interval: float,
+                 slot_wait: float = 120.0, session_wait: float = 120.0, yield_interval: float = 3.0):
+        self.max_connected = max(1, int(max_connected))
+        self.idle_ttl = float(idle_ttl)
+        self.slot_wait = max(1.0, float(slot_wait))
+        self.session_wait = max(1.0, float(session_wait))
+        self.yield_interval = max(1.0, float(yield_interval))
+        self.keepalive_interval = max(5.0, float(keepalive_interval))
+        self._entries: "OrderedDict[int, _PoolEntry]" = OrderedDict()
+        self._reserved = 0  # слоты под клиенты, которые ещё подключаются (_new_client)
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._capacity = asyncio.Condition()
+        self._keepalive_task: asyncio.Task | None = None
+        self._yield_task: asyncio.Task | None = None
+        self.created = 0
+        self.evicted = 0
+        self.yielded = 0
+        self.health_failures = 0
+
+    def _lock(self, account_id: int) -> asyncio.Lock:
+        return self._locks.setdefault(account_id, asyncio.Lock())
+
+    def _ensure_keepalive(self):
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop(), name="tg-pool-keepalive")
+        if self._yield_task is None or self._yield_task.done():
+            self._yield_task = asyncio.create_task(self._yield_loop(), name="tg-pool-yield")
+
+    # ---------- межпроцессная блокировка сессии ----------
+    async def _claim_session(self, account_id: int):
+        from app.db_async import run as run_db
+
+        if await run_db(try_lock_account_session, account_id):
+            return
+        # сессию держит другой процесс — отмечаемся, чтобы он отпустил её, как освободится
+        await run_db(want_account_session, account_id, True)
+        try:
+            deadline = time.monotonic() + self.session_wait
+            while True:
+                await asyncio.sleep(1.0)
+                if await run_db(try_lock_account_session, account_id):
+                    return
+                if time.monotonic() >= deadline:
+                    raise RuntimeError(
+                        f"❌ Аккаунт {account_id} подключён в другом процессе, "
+                        f"не освободился за {self.session_wait:.0f} с"
+                    )
+        finally:
             try:
-                if not cli.is_connected():
-                    await cli.connect()
-                return cli
+                await run_db(want_account_session, account_id, False)
             except Exception:
+                pass
+
+    async def _release_session(self, account_id: int):
+        from app.db_async import run as run_db
+
+        try:
+            await run_db(unlock_account_session, account_id)
+        except Exception as e:
+            print(f"[TG_POOL] ⚠️ session unlock failed for account {account_id}: {e}")
+
+    # ---------- создание / вытеснение ----------
+    async def _new_client(self, account_id: int) -> TelegramClient:
+        from app.db_async import run as run_db
+
+        account = await run_db(get_account_by_id, account_id)
+        if not account or not account.get("session_string"):
+            raise RuntimeError(f"❌ Аккаунт {account_id} не найден или без session_string")
+        await self._claim_session(account_id)
+        try:
+            api_key = await run_db(_pick_api_key)
+            params = _build_client_params(
+                api_id=api_key["api_id"],
+                api_hash=api_key["api_hash"],
+                proxy=_build_proxy_from_account(account),
+                account=account,
+            )
+            client = ScheduledTelegramClient(StringSession(account["session_string"]), account_id=account_id, **params)
+            await client.connect()
+        except BaseException:
+            await self._release_session(account_id)
+            raise
+        await run_db(increment_api_key_usage, api_key["id"])
+        self.created += 1
+        return client
+
+    def _evictable(self) -> list[int]:
+        now = time.monotonic()
+        return [
+            acc_id for acc_id, e in self._entries.items()  # порядок LRU: старые первыми
+            if not e.leased and not self._lock(acc_id).locked()
+            and (not e.pinned or e.idle_for(now) > self.idle_ttl)
+        ]
+
+    async def _disconnect(self, account_id: int, entry: _PoolEntry):
+        try:
+            await entry.client.disconnect()
+        except Exception:
+            pass
+        await self._release_session(account_id)
+
+    async def _drop(self, account_id: int):
+        entry = self._entries.pop(account_id, None)
+        if entry is None:
+            return
+        await self._disconnect(account_id, entry)
+        async with self._capacity:
+            self._capacity.notify_all()
+
+    async def _reserve_slot(self):
+        """Занять слот под новый клиент; после _new_client — _entries[...] = entry или _release_slot()."""
+        deadline = time.monotonic() + self.slot_wait
+        async with self._capacity:
+            while len(self._entries) + self._reserved >= self.max_connected:
+                victims = self._evictable()
+                if victims:
+                    entry = self._entries.pop(victims[0])
+                    self.evicted += 1
+                    await self._disconnect(victims[0], entry)
+                    continue
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise RuntimeError(
+                        f"❌ Пул клиентов заполнен ({len(self._entries) + self._reserved}/{self.max_connected}), "
+                        f"свободного места не дождались за {self.slot_wait:.0f} с"
+                    )
                 try:
-                    await cli.disconnect()
-                except Exception:
+                    await asyncio.wait_for(self._capacity.wait(), timeout=left)
+                except asyncio.TimeoutError:
                     pass
-                _CLIENT_CACHE.pop(account_id, None)
-                cli = None
+            self._reserved += 1
+
+    async def _release_slot(self):
+        self._reserved -= 1
+        async with self._capacity:
+            self._capacity.notify_all()
+
+    async def _checkout(self, account_id: int) -> _PoolEntry:
+        """Вызывается под локом аккаунта: вернуть подключённый клиент (создать при необходимости)."""
+        self._ensure_keepalive()
+        entry = self._entries.get(account_id)
+        if entry is not None and entry.stale and not entry.pinned:
+            await self._drop(account_id)
+            entry = None
+        if entry is not None:
+            try:
+                if not entry.client.is_connected():
+                    await entry.client.connect()
+                self._entries.move_to_end(account_id)
+                entry.last_used = time.monotonic()
+                return entry
+            except Exception:
+                await self._drop(account_id)
 
-        # создаём новый
-        client = create_client_from_account(account_id)  # твоя фабрика
-        await client.connect()
-        _CLIENT_CACHE[account_id] = client
-        return client
+        # слот занят до подключения: параллельные checkout'ы других аккаунтов не превысят max_connected
+        await self._reserve_slot()
+        try:
+            client = await self._new_client(account_id)
+        except BaseException:
+            await self._release_slot()
+            raise
+        entry = _PoolEntry(client=client)
+        self._reserved -= 1
+        self._entries[account_id] = entry
+        return entry
+
+    # ---------- публичное API ----------
+    @asynccontextmanager
+    async def lease(self, account_id: int):
+        async with self._lock(account_id):
+            entry = await self._checkout(account_id)
+            entry.leased = True
+            broken = False
+            try:
+                yield entry.client
+            except _FATAL_CLIENT_ERRORS:
+                broken = True
+                raise
+            finally:
+                entry.leased = False
+                entry.last_used = time.monotonic()
+                if broken or entry.stale or not entry.client.is_connected():
+                    await self._drop(account_id)
+                else:
+                    async with self._capacity:
+                        self._capacity.notify_all()
+
+    async def get(self, account_id: int) -> TelegramClient:
+        """Общий (не эксклюзивный) клиент; вытесняется, только если не делал RPC дольше idle_ttl."""
+        async with self._lock(account_id):
+            entry = await self._checkout(account_id)
+            entry.pinned = True
+            return entry.client
+
+    async def dispose(self, account_id: int):
+        async with self._lock(account_id):
+            await self._drop(account_id)
+
+    async def retire(self, account_id: int):
+        """
+        Клиент подключён со старыми настройками: отключить сразу, если им никто не пользуется,
+        иначе — когда вернут аренду (закреплённый — когда простоит keepalive_interval).
+        """
+        entry = self._entries.get(account_id)
+        if entry is None:
+            return
+        entry.stale = True
+        lock = self._lock(account_id)
+        if entry.leased or entry.pinned or lock.locked():
+            return
+        async with lock:
+            if self._entries.get(account_id) is entry and not entry.leased:
+                await self._drop(account_id)
+
+    # ---------- health-check ----------
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            now = time.monotonic()
+            for acc_id, entry in list(self._entries.items()):
+                lock = self._lock(acc_id)
+                if entry.leased or lock.locked():
+                    continue
+                async with lock:
+                    if self._entries.get(acc_id) is not entry or entry.leased:
+                        continue
+                    idle = entry.idle_for(now)
+                    if idle > self.idle_ttl or (entry.stale and idle > self.keepalive_interval):
+                        self.evicted += 1
+                        await self._drop(acc_id)
+                        continue
+                    try:
+                        if not entry.client.is_connected():
+                            await entry.client.connect()
+                        # мимо ScheduledTelegramClient.__call__: ping — не активность,
+                        # иначе last_request не даст простою дойти до idle_ttl
+                        await asyncio.wait_for(
+                            TelegramClient.__call__(entry.client, functions.PingRequest(ping_id=random.getrandbits(63))),
+                            timeout=15,
+                        )
+                    except Exception as e:
+                        self.health_failures += 1
+                        print(f"[TG_POOL] ⚠️ health-check failed for account {acc_id}: {e.__class__.__name__}: {e}")
+                        await self._drop(acc_id)
+
+    async def _yield_loop(self):
+        """Отпускать простаивающие клиенты, сессию которых ждёт другой процесс."""
+        from app.db_async import run as run_db
+
+        while True:
+            await asyncio.sleep(self.yield_interval)
+            if not any(not e.leased for e in self._entries.values()):
+                continue
+            try:
+                wanted = await run_db(get_wanted_account_sessions)
+            except Exception as e:
+                print(f"[TG_POOL] ⚠️ session wait check failed: {e}")
+                continue
+            for acc_id in wanted:
+                entry = self._entries.get(acc_id)
+                lock = self._lock(acc_id)
+                # закреплённый клиент держит код мимо пула — его отпустит только вытеснение по простою
+                if entry is None or entry.leased or entry.pinned or lock.locked():
+                    continue
+                async with lock:
+                    if self._entries.get(acc_id) is entry and not entry.leased:
+                        self.yielded += 1
+                        await self._drop(acc_id)
+
+    async def close(self):
+        for attr in ("_keepalive_task", "_yield_task"):
+            task = getattr(self, attr)
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+            setattr(self, attr, None)
+        for acc_id in list(self._entries):
+            await self._drop(acc_id)
+
+    def stats(self) -> dict:
+        return {
+            "connected": len(self._entries),
+            "connecting": self._reserved,
+            "leased": sum(1 for e in self._entries.values() if e.leased),
+            "pinned": sum(1 for e in self._entries.values() if e.pinned),
+            "max_connected": self.max_connected,
+            "created": self.created,
+            "evicted": self.evicted,
+            "yielded": self.yielded,
+            "health_failures": self.health_failures,
+            "throttled": len(get_flood_scheduler().throttled()),
+        }
+
+
+_POOL: TelegramClientPool | None = None
+
+
+def get_client_pool() -> TelegramClientPool:
+    global _POOL
+    if _POOL is None:
+        from config import (
+            TG_POOL_MAX_CONNECTED, TG_POOL_IDLE_TTL, TG_POOL_KEEPALIVE, TG_POOL_SLOT_WAIT, TG_POOL_SESSION_WAIT,
+        )
+        _POOL = TelegramClientPool(TG_POOL_MAX_CONNECTED, TG_POOL_IDLE_TTL, TG_POOL_KEEPALIVE,
+                                   TG_POOL_SLOT_WAIT, TG_POOL_SESSION_WAIT)
+    return _POOL
+
+
+async def close_client_pool():
+    global _POOL
+    pool, _POOL = _POOL, None
+    if pool is not None:
+        await pool.close()
+
+
+def lease_client(account_id: int):
+    """
+    Эксклюзивно арендовать подключённый клиент аккаунта на время блока:
+
+        async with lease_client(acc_id) as client:
+            await client(JoinChannelRequest(entity))
+
+    Не отключайте клиента внутри блока — он вернётся в пул.
+    """
+    return get_client_pool().lease(account_id)
+
+
+# app/telegram_client.py
+async def get_or_create_account_client(account_id: int) -> TelegramClient:
+    """
+    Вернёт подключённый (или переподключённый) клиент для аккаунта.
+    Единая точка reuse без дублирования соединений.
+    """
+    return await get_client_pool().get(account_id)
+
+
+async def retire_account_client(account_id: int):
+    """
+    Сменились прокси/сессия аккаунта: клиент из пула пересоздастся, но не посреди
+    чужой аренды — только когда его вернут (см. TelegramClientPool.retire).
+    """
+    await get_client_pool().retire(account_id)
 
 
 async def dispose_account_client(account_id: int):
@@ -59,14 +449,7 @@ async def dispose_account_client(account_id: int):
     Аккуратно убрать клиента из кеша (напр., при бане/фатале).
     В обычной работе лучше НЕ вызывать — reuse лучше.
     """
-    lock = _ACCOUNT_LOCKS.setdefault(account_id, asyncio.Lock())
-    async with lock:
-        cli = _CLIENT_CACHE.pop(account_id, None)
-        if cli:
-            try:
-                await cli.disconnect()
-            except Exception:
-                pass
+    await get_client_pool().dispose(account_id)
 
 
 
@@ -176,7 +559,7 @@ def make_client_with_metadata(
     if sequential_updates is not None:
         params["sequential_updates"] = sequential_updates
 
-    client = TelegramClient(sess, **params)
+    client = ScheduledTelegramClient(sess, account_id=(account or {}).get("id"), **params)
 
     if not increment_usage_after_connect:
         increment_api_key_usage(api_key["id"])
@@ -238,6 +621,7 @@ async def get_client(session_string: str, proxy: Optional[Dict[str, Any]] = None
     """
     Старый универсальный вход: получить клиента по session_string.
     Теперь тоже через фабрику, т.е. с метаданными, если аккаунт есть в БД.
+    Отдельный клиент мимо пула — остался для скомпилированных utils/*; в хендлерах — lease_client().
     """
     proxy_tuple = None
     if proxy:
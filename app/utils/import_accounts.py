@@ -5,19 +5,24 @@ import re
 import json
 import zipfile
 import asyncio
+import shutil
+import tempfile
 from aiogram.types import BufferedInputFile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from aiogram.exceptions import TelegramBadRequest
 from app.db import (
-    create_account_with_metadata,
-    is_account_exists,
+    create_accounts_bulk,
+    get_existing_session_strings,
     get_available_api_key,
     increment_api_key_usage,
-    proxy_exists,
-    save_proxy,
     ensure_accounts_metadata_columns,
-    account_exists_by_session,
     get_account_by_session_string, 
     merge_account_metadata_by_session,
 )
+from app.db_async import run as run_db
+from config import IMPORT_PARSE_WORKERS, IMPORT_CONNECT_CONCURRENCY, IMPORT_WRITE_BATCH, IMPORT_PROGRESS_INTERVAL
 from app.db_bootstrap import bootstrap_accounts_privileges  # <<< добавили
 from telethon import TelegramClient
 from telethon.sessions import SQLiteSession, StringSession
@@ -27,40 +32,57 @@ print("[IMPORT ACCOUNTS] loaded from:", __file__, flush=True)
 
 
 
-def _find_json_for_session(session_file: str, temp_dir: str) -> str | None:
+class _ZipIndex:
     """
-    Пытается сопоставить .session с .json:
+    Оглавление архива по namelist(): .session, .json и proxies.txt из корня
+    (как раньше после extractall + listdir). Ничего не распаковывает.
+    """
+
+    def __init__(self, names: list[str]):
+        self.sessions: list[str] = []
+        self.jsons: set[str] = set()
+        self.proxies: str | None = None
+        for name in names:
+            if name.endswith("/") or "/" in name.rstrip("/"):
+                continue  # каталоги и вложенные файлы не учитываем
+            if name.endswith(".session"):
+                self.sessions.append(name)
+            elif name.endswith(".json"):
+                self.jsons.add(name)
+            elif name == "proxies.txt":
+                self.proxies = name
+        self.sessions.sort()
+
+
+def _find_json_for_session(session_file: str, json_names: set[str]) -> str | None:
+    """
+    Пытается сопоставить .session с .json по оглавлению архива:
     - <stem>.json
     - <stem без суффиксов _telethon/_tdesktop/_td/_tdata>.json
     - <часть до первого _>.json
     - <числовой префикс>.json (если есть)
-    Возвращает первый найденный путь или None.
+    Возвращает имя первого найденного члена архива или None.
     """
     stem = session_file[:-8]  # убрать ".session"
-    candidates = [os.path.join(temp_dir, stem + ".json")]
+    candidates = [stem + ".json"]
 
     # убрать распространённые суффиксы
     for suf in ("_telethon", "_tdesktop", "_td", "_tdata"):
         if stem.endswith(suf):
-            candidates.append(os.path.join(temp_dir, stem[:-len(suf)] + ".json"))
+            candidates.append(stem[:-len(suf)] + ".json")
 
     # до первого подчёркивания
     if "_" in stem:
-        candidates.append(os.path.join(temp_dir, stem.split("_", 1)[0] + ".json"))
+        candidates.append(stem.split("_", 1)[0] + ".json")
 
     # числовой префикс
     m = re.match(r"(\d{6,})", stem)
     if m:
-        candidates.append(os.path.join(temp_dir, m.group(1) + ".json"))
-
-    # удалить дубликаты, вернуть первый существующий
-    seen = set()
-    for p in candidates:
-        if p in seen:
-            continue
-        seen.add(p)
-        if os.path.exists(p):
-            return p
+        candidates.append(m.group(1) + ".json")
+
+    for name in candidates:
+        if name in json_names:
+            return name
     return None
 
 
@@ -92,10 +114,9 @@ def _safe_str(v):
     s = str(v).strip()
     return s or None
 
-def _load_json_metadata(json_path: str) -> dict:
+def _load_json_metadata(raw: str) -> dict:
     try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            raw = f.read().strip()
+        raw = (raw or "").strip()
         if not raw:
             return {}
         data = json.loads(raw)
@@ -136,33 +157,111 @@ def _print_meta_loaded(index: int, meta: dict):
     print(f"[IMPORT] [{index}] meta: {', '.join(parts) if parts else 'none'}", flush=True)
 
 
-async def _extract_zip(zip_path: str, temp_dir: str):
-    def _extract():
-        with zipfile.ZipFile(zip_path, 'r') as z:
-            z.extractall(temp_dir)
-    await asyncio.to_thread(_extract)
+def _read_member_text(zf: zipfile.ZipFile, name: str) -> str:
+    return zf.read(name).decode("utf-8", errors="ignore")
 
-def _read_proxies_file(path: str) -> list[str]:
-    if not os.path.exists(path):
+def _read_proxies_member(zf: zipfile.ZipFile, name: str | None) -> list[str]:
+    if not name:
         return []
-    with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        return [line.strip() for line in f if line.strip()]
+    return [line.strip() for line in _read_member_text(zf, name).splitlines() if line.strip()]
 
-def _sqlite_file_to_string_session(session_path: str) -> str:
-    base = session_path[:-8] if session_path.endswith(".session") else session_path
-    sqlite_session = SQLiteSession(base)
-    return StringSession.save(sqlite_session)
+def _sqlite_member_to_string_session(zf: zipfile.ZipFile, name: str, temp_dir: str) -> str:
+    """
+    SQLiteSession умеет работать только с файлом, поэтому .session копируется
+    из архива во временный файл, конвертируется и сразу удаляется.
+    """
+    fd, tmp_path = tempfile.mkstemp(suffix=".session", dir=temp_dir)
+    try:
+        with os.fdopen(fd, "wb") as out, zf.open(name) as src:
+            shutil.copyfileobj(src, out)
+        base = tmp_path[:-8]
+        sqlite_session = SQLiteSession(base)
+        try:
+            return StringSession.save(sqlite_session)
+        finally:
+            try: sqlite_session.close()
+            except Exception: pass
+    finally:
+        for path in (tmp_path, tmp_path + "-journal"):
+            try: os.remove(path)
+            except FileNotFoundError: pass
 
 def _make_proxy_tuple(host, port, user, pwd):
     return (socks.SOCKS5, host, int(port), True, user or None, pwd or None)
 
 
-async def _import_one(index: int, session_file: str, proxy_line: str, temp_dir: str, log, counters):
-    session_path = os.path.join(temp_dir, session_file)
-    json_path = _find_json_for_session(session_file, temp_dir)
-    print(f"[IMPORT] [{index}] session={session_file}, json={'found: ' + os.path.basename(json_path) if json_path else 'none'}", flush=True)
+@dataclass
+class _ImportItem:
+    index: int
+    session_file: str
+    proxy_line: str
+    json_path: str | None = None
+    proxy: tuple | None = None          # (host, port, user, pwd)
+    string_sess: str | None = None
+    meta: dict = field(default_factory=dict)
+    phone: str | None = None
+    username: str | None = None
+    error: str | None = None            # готовое сообщение для лога, если элемент отвалился
+
+    @property
+    def who(self) -> str:
+        return self.phone or self.username or self.session_file
+
+
+class _ImportReport:
+    """Счётчики, лог (в порядке сессий в архиве) и троттлинг сообщения с прогрессом."""
+
+    def __init__(self, message, total: int):
+        self.message = message
+        self.total = total
+        self.counters = {"ok": 0, "updated": 0, "skipped": 0, "fail": 0}
+        self.entries: list[tuple[int, str]] = []
+        self.progress_msg = None
+        self._last_edit = 0.0
+
+    def add(self, index: int, counter: str, msg: str):
+        self.counters[counter] += 1
+        self.entries.append((index, msg))
+        print(f"[IMPORT] {msg}", flush=True)
+
+    @property
+    def done(self) -> int:
+        return sum(self.counters.values())
+
+    def text(self) -> str:
+        c = self.counters
+        return (
+            f"⏳ Импорт аккаунтов: {self.done}/{self.total}\n"
+            f"✅ {c['ok']}  ♻️ {c['updated']}  ⏭️ {c['skipped']}  ❌ {c['fail']}"
+        )
+
+    async def tick(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_edit < IMPORT_PROGRESS_INTERVAL:
+            return
+        self._last_edit = now
+        try:
+            if self.progress_msg is None:
+                self.progress_msg = await self.message.answer(self.text())
+            else:
+                await self.progress_msg.edit_text(self.text())
+        except TelegramBadRequest:
+            pass
+        except Exception as e:
+            print(f"[IMPORT] progress update failed: {e}", flush=True)
+
+    def log_lines(self) -> list[str]:
+        return [m for _, m in sorted(self.entries, key=lambda x: x[0])]
+
+
+# ---------- стадия 1: разбор .session/.json/прокси (в потоках) ----------
+
+def _prepare_item(index: int, session_file: str, proxy_line: str,
+                  zf: zipfile.ZipFile, zindex: _ZipIndex, temp_dir: str) -> _ImportItem:
+    item = _ImportItem(index, session_file, proxy_line)
+    item.json_path = _find_json_for_session(session_file, zindex.jsons)
+    print(f"[IMPORT] [{index}] session={session_file}, json={'found: ' + item.json_path if item.json_path else 'none'}", flush=True)
 
-    
     # 1) proxy
     try:
         parts = (proxy_line or "").split(":")
@@ -170,126 +269,183 @@ async def _import_one(index: int, session_file: str, proxy_line: str, temp_dir:
         pport = int(parts[1])
         puser = parts[2] if len(parts) > 2 and parts[2] else None
         ppwd  = parts[3] if len(parts) > 3 and parts[3] else None
+        item.proxy = (phost, pport, puser, ppwd)
     except Exception as e:
-        msg = f"[❌] {session_file} — неверный формат прокси '{proxy_line}': {e}"
-        print(f"[IMPORT] {msg}", flush=True); counters["fail"] += 1; log.append(msg); return
+        item.error = f"[❌] {session_file} — неверный формат прокси '{proxy_line}': {e}"
+        return item
 
-    # 2) api key
-    api_key = get_available_api_key()
-    if not api_key:
-        msg = f"[❌] {session_file} — нет свободных API-ключей"
-        print(f"[IMPORT] {msg}", flush=True); counters["fail"] += 1; log.append(msg); return
+    # 2) .session → StringSession
+    try:
+        item.string_sess = _sqlite_member_to_string_session(zf, session_file, temp_dir)
+        print(f"[IMPORT] [{index}] StringSession получен ({len(item.string_sess)} символов)", flush=True)
+    except Exception as e:
+        item.error = f"[❌] {session_file} — не удалось прочитать .session: {e}"
+        return item
 
-    # 3) .session → StringSession
+    # 3) meta from JSON
+    item.meta = _load_json_metadata(_read_member_text(zf, item.json_path)) if item.json_path else {}
+    _print_meta_loaded(index, item.meta)
+    return item
+
+
+def _merge_duplicate(item: _ImportItem) -> tuple[str, str]:
+    """Такой session уже есть — «доклеим» МЕТА из найденного JSON. Возвращает (counter, msg)."""
+    if not item.json_path:
+        return "skipped", "[ℹ️] найден дубликат по session_string, подходящий JSON не обнаружен — пропуск"
     try:
-        string_sess = _sqlite_file_to_string_session(session_path)
-        print(f"[IMPORT] [{index}] StringSession получен ({len(string_sess)} символов)", flush=True)
+        acc = get_account_by_session_string(item.string_sess) or {}
+        if not item.meta:
+            return "skipped", f"[ℹ️] аккаунт ID {acc.get('id','?')}: JSON найден, но метаданных нет — обновлять нечего"
+        affected = merge_account_metadata_by_session(item.string_sess, item.meta)
+        if affected:
+            return "updated", f"[ℹ️] метаданные для аккаунта ID {acc.get('id','?')} обновлены (только пустые поля)"
+        return "updated", f"[ℹ️] аккаунт ID {acc.get('id','?')} уже содержит все поля, обновлять нечего"
     except Exception as e:
-        msg = f"[❌] {session_file} — не удалось прочитать .session: {e}"
-        print(f"[IMPORT] {msg}", flush=True); counters["fail"] += 1; log.append(msg); return
-    
-
-    # === НОВОЕ: если такой session уже есть — «доклеим» МЕТА из найденного JSON и выйдем
-    if account_exists_by_session(string_sess):
-        if json_path:
-            meta = _load_json_metadata(json_path) or {}
-            try:
-                acc = get_account_by_session_string(string_sess) or {}
-                if not meta:
-                    msg = f"[ℹ️] аккаунт ID {acc.get('id','?')}: JSON найден, но метаданных нет — обновлять нечего"
-                    counters["skipped"] += 1
-                else:
-                    affected = merge_account_metadata_by_session(string_sess, meta)
-                    if affected:
-                        msg = f"[ℹ️] метаданные для аккаунта ID {acc.get('id','?')} обновлены (только пустые поля)"
-                    else:
-                        msg = f"[ℹ️] аккаунт ID {acc.get('id','?')} уже содержит все поля, обновлять нечего"
-                    counters["updated"] += 1   # ← а не fail
-            except Exception as e:
-                msg = f"[⚠️] не удалось обновить метаданные для дубликата: {e}"
-                counters["fail"] += 1         # ← это уже ошибка
-        else:
-            msg = f"[ℹ️] найден дубликат по session_string, подходящий JSON не обнаружен — пропуск"
-            counters["skipped"] += 1          # ← пропуск, не ошибка
+        return "fail", f"[⚠️] не удалось обновить метаданные для дубликата: {e}"
 
-        log.append(msg)
-        print(f"[IMPORT] {msg}", flush=True)
-        return
 
-    
-    
-    proxy_tuple = _make_proxy_tuple(phost, pport, puser, ppwd)
-    print(f"[IMPORT] [{index}] proxy={phost}:{pport} user={'yes' if puser else 'no'}", flush=True)
+# ---------- стадия 2: проверка подключения (async, ограниченная конкуррентность) ----------
+
+async def _verify_item(item: _ImportItem) -> bool:
+    api_key = await run_db(get_available_api_key)
+    if not api_key:
+        item.error = f"[❌] {item.session_file} — нет свободных API-ключей"
+        return False
+
+    phost, pport, puser, ppwd = item.proxy
+    print(f"[IMPORT] [{item.index}] proxy={phost}:{pport} user={'yes' if puser else 'no'}", flush=True)
 
-    # 4) connect & validate
     client = None
     try:
         client = TelegramClient(
-            StringSession(string_sess),
+            StringSession(item.string_sess),
             api_key["api_id"],
             api_key["api_hash"],
-            proxy=proxy_tuple,
+            proxy=_make_proxy_tuple(phost, pport, puser, ppwd),
             connection_retries=1,
             request_retries=1,
             timeout=20,
         )
         await client.connect()
-        print(f"[IMPORT] [{index}] connected", flush=True)
-        increment_api_key_usage(api_key["id"])
+        print(f"[IMPORT] [{item.index}] connected", flush=True)
+        await run_db(increment_api_key_usage, api_key["id"])
 
         me = await client.get_me()
         if not me:
             raise Exception("Сессия не авторизована (get_me вернул None)")
 
-        phone = getattr(me, "phone", None)
-        username = getattr(me, "username", None)
-        who = phone or username or session_file
-        print(f"[IMPORT] [{index}] me: phone={phone} username={username}", flush=True)
-
-        if is_account_exists(phone, username):
-            msg = f"[ℹ️] {who} — уже существует (по phone/username), пропуск"
-            counters["fail"] += 1; log.append(msg); print(f"[IMPORT] {msg}", flush=True); return
-
-        # 5) save proxy (if new)
-        if phost and pport and not proxy_exists(phost, pport, puser, ppwd):
-            save_proxy(phost, pport, puser, ppwd)
-
-        # 6) meta from JSON
-        meta = _load_json_metadata(json_path) if json_path else {}
-        _print_meta_loaded(index, meta)
-
-
-        # 7) save account
-        create_account_with_metadata(
-            session_string=string_sess,
-            proxy_type="socks5",
-            proxy_host=phost,
-            proxy_port=pport,
-            proxy_username=puser,
-            proxy_password=ppwd,
-            phone=phone,
-            username=username,
-            device_model=meta.get("device_model"),
-            system_version=meta.get("system_version"),
-            app_version=meta.get("app_version"),
-            lang_code=meta.get("lang_code"),
-            system_lang_code=meta.get("system_lang_code"),
-            is_premium=bool(meta.get("is_premium", False)),
-            register_time=meta.get("register_time"),
-        )
-
-        msg = f"[✅] {who} — импортирован"
-        counters["ok"] += 1; log.append(msg); print(f"[IMPORT] {msg}", flush=True)
-
+        item.phone = getattr(me, "phone", None)
+        item.username = getattr(me, "username", None)
+        print(f"[IMPORT] [{item.index}] me: phone={item.phone} username={item.username}", flush=True)
+        return True
     except Exception as e:
-        msg = f"[❌] {session_file} — ошибка: {e}"
-        counters["fail"] += 1; log.append(msg); print(f"[IMPORT] {msg}", flush=True)
+        item.error = f"[❌] {item.session_file} — ошибка: {e}"
+        return False
     finally:
         if client:
             try: await client.disconnect()
             except Exception: pass
 
 
+# ---------- стадия 3: запись пачками ----------
+
+async def _write_batch(batch: list[_ImportItem], report: _ImportReport):
+    rows = [
+        {
+            "session_string": it.string_sess,
+            "proxy_type": "socks5",
+            "proxy_host": it.proxy[0],
+            "proxy_port": it.proxy[1],
+            "proxy_username": it.proxy[2],
+            "proxy_password": it.proxy[3],
+            "phone": it.phone,
+            "username": it.username,
+            **{k: it.meta.get(k) for k in ("device_model", "system_version", "app_version",
+                                           "lang_code", "system_lang_code", "register_time")},
+            "is_premium": bool(it.meta.get("is_premium", False)),
+        }
+        for it in batch
+    ]
+    try:
+        outcome = await run_db(create_accounts_bulk, rows)
+    except Exception as e:
+        for it in batch:
+            report.add(it.index, "fail", f"[❌] {it.session_file} — ошибка записи в БД: {e}")
+        return
+    for it in batch:
+        status, _ = outcome.get(it.string_sess, ("exists", None))
+        if status == "created":
+            report.add(it.index, "ok", f"[✅] {it.who} — импортирован")
+        else:
+            report.add(it.index, "fail", f"[ℹ️] {it.who} — уже существует (по phone/username), пропуск")
+
+
+async def _writer(queue: asyncio.Queue, report: _ImportReport):
+    batch: list[_ImportItem] = []
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        batch.append(item)
+        if len(batch) >= IMPORT_WRITE_BATCH:
+            await _write_batch(batch, report)
+            batch = []
+            await report.tick()
+    if batch:
+        await _write_batch(batch, report)
+
+
+async def _run_pipeline(zf: zipfile.ZipFile, zindex: _ZipIndex, proxy_lines: list[str],
+                        temp_dir: str, report: _ImportReport):
+    loop = asyncio.get_running_loop()
+
+    # 1) разбор прямо из архива в пуле потоков (чтение членов ZipFile потокобезопасно)
+    with ThreadPoolExecutor(max_workers=max(1, IMPORT_PARSE_WORKERS), thread_name_prefix="import") as pool:
+        items = await asyncio.gather(*(
+            loop.run_in_executor(pool, _prepare_item, i, sess, proxy_lines[i - 1], zf, zindex, temp_dir)
+            for i, sess in enumerate(zindex.sessions, 1)
+        ))
+
+    ready = []
+    for it in items:
+        if it.error:
+            report.add(it.index, "fail", it.error)
+        else:
+            ready.append(it)
+
+    # дубликаты по session_string — одним запросом на весь архив
+    existing = await run_db(get_existing_session_strings, [it.string_sess for it in ready])
+    fresh = []
+    for it in ready:
+        if it.string_sess in existing:
+            counter, msg = await run_db(_merge_duplicate, it)
+            report.add(it.index, counter, msg)
+        else:
+            fresh.append(it)
+    await report.tick(force=True)
+
+    # 2) + 3) проверка подключения параллельно, запись пачками по мере готовности
+    queue: asyncio.Queue = asyncio.Queue()
+    writer = asyncio.create_task(_writer(queue, report))
+    sem = asyncio.Semaphore(max(1, IMPORT_CONNECT_CONCURRENCY))
+
+    async def verify(it: _ImportItem):
+        async with sem:
+            ok = await _verify_item(it)
+        if ok:
+            await queue.put(it)
+        else:
+            report.add(it.index, "fail", it.error)
+            await report.tick()
+
+    try:
+        await asyncio.gather(*(verify(it) for it in fresh))
+    finally:
+        await queue.put(None)
+        await writer
+    await report.tick(force=True)
+
+
 async def import_accounts_from_zip(message, zip_path, temp_dir):
     print(f"[IMPORT] start zip_path={zip_path} temp_dir={temp_dir}", flush=True)
 
@@ -310,30 +466,26 @@ async def import_accounts_from_zip(message, zip_path, temp_dir):
             await message.answer("❌ Ошибка при подготовке базы данных.")
             return
 
-    log, counters = [], {"ok": 0, "updated": 0, "skipped": 0, "fail": 0}
+    zf = None
     try:
-        # 1) unzip
-        await _extract_zip(zip_path, temp_dir)
-        print("[IMPORT] zip extracted", flush=True)
-
-        # 2) list .session only
-        sessions = [f for f in os.listdir(temp_dir) if f.endswith(".session")]
-        sessions.sort()
-        proxies_path = os.path.join(temp_dir, "proxies.txt")
-        proxy_lines = _read_proxies_file(proxies_path)
-        print(f"[IMPORT] found sessions: {len(sessions)}; proxies lines: {len(proxy_lines)} (json files not counted)", flush=True)
-
-        if len(proxy_lines) != len(sessions):
+        # 1) оглавление архива (без распаковки на диск)
+        zf = await asyncio.to_thread(zipfile.ZipFile, zip_path, "r")
+        zindex = _ZipIndex(zf.namelist())
+        proxy_lines = await asyncio.to_thread(_read_proxies_member, zf, zindex.proxies)
+        print(f"[IMPORT] found sessions: {len(zindex.sessions)}; json: {len(zindex.jsons)}; proxies lines: {len(proxy_lines)}", flush=True)
+
+        if len(proxy_lines) != len(zindex.sessions):
             await message.answer("❌ Количество прокси не совпадает с количеством сессий.")
             return
 
-        # 3) import
-        for i, sess in enumerate(sessions, 1):
-            await _import_one(i, sess, proxy_lines[i - 1], temp_dir, log, counters)
+        # 2) import: разбор → проверка → запись пачками
+        report = _ImportReport(message, len(zindex.sessions))
+        await _run_pipeline(zf, zindex, proxy_lines, temp_dir, report)
+        counters = report.counters
 
-        # 4) send log
+        # 3) send log
         log_text = (
-            "\n".join(log) +
+            "\n".join(report.log_lines()) +
             f"\n\nИтого:\n"
             f"✅ Импортировано: {counters['ok']}\n"
             f"♻️ Обновлено метаданных: {counters['updated']}\n"
@@ -355,6 +507,8 @@ async def import_accounts_from_zip(message, zip_path, temp_dir):
         import traceback; traceback.print_exc()
         await message.answer("❌ Произошла ошибка при обработке архива.")
     finally:
+        if zf is not None:
+            zf.close()
         # cleanup
         try:
             if os.path.exists(zip_path): os.remove(zip_path)
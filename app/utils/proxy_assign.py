@@ -0,0 +1,90 @@
+# app/utils/proxy_assign.py
+"""
+Автопривязка аккаунтов к самым быстрым здоровым прокси.
+
+Рейтинг берётся из статистики проверок (get_ranked_proxies: средние задержки
+connect/handshake по EWMA, поделённые на долю успешных проверок), загрузка —
+одним GROUP BY по accounts (count_accounts_per_proxy). Прокси, на котором уже
+PROXY_ACCOUNTS_CAP аккаунтов, пропускается.
+
+    assigner = await ProxyAssigner.create()
+    proxy = await assigner.assign(account)
+"""
+from __future__ import annotations
+
+from app import db_async as adb
+from config import PROXY_ACCOUNTS_CAP, PROXY_MIN_SUCCESS_RATIO
+
+
+def proxy_key(host, port, username=None, password=None) -> tuple:
+    return (host, int(port) if port is not None else None, username or None, password or None)
+
+
+def account_proxy_key(account: dict) -> tuple | None:
+    if not account.get("proxy_host"):
+        return None
+    return proxy_key(
+        account.get("proxy_host"), account.get("proxy_port"),
+        account.get("proxy_username"), account.get("proxy_password"),
+    )
+
+
+def format_latency(proxy: dict) -> str:
+    c = proxy.get("avg_connect_ms")
+    h = proxy.get("avg_handshake_ms")
+    if c is None and h is None:
+        return "—"
+    return f"{(c or 0) + (h or 0):.0f}ms"
+
+
+class ProxyAssigner:
+    """
+    Держит рейтинг прокси и текущую загрузку в памяти, чтобы при массовой
+    перепривязке не дёргать БД на каждый аккаунт.
+    """
+
+    def __init__(self, ranked: list[dict], load: dict[tuple, int], cap: int = PROXY_ACCOUNTS_CAP):
+        self.cap = max(1, int(cap))
+        self.ranked = ranked
+        self.load = load
+
+    @classmethod
+    async def create(cls, cap: int = PROXY_ACCOUNTS_CAP,
+                     min_success_ratio: float = PROXY_MIN_SUCCESS_RATIO) -> "ProxyAssigner":
+        """Рейтинг и загрузка всех прокси — два запроса в DB-потоке, event loop не ждёт."""
+        ranked = await adb.get_ranked_proxies(min_success_ratio)
+        load: dict[tuple, int] = {}
+        for (host, port, username, password), n in (await adb.count_accounts_per_proxy()).items():
+            key = proxy_key(host, port, username, password)
+            load[key] = load.get(key, 0) + n
+        return cls(ranked, load, cap)
+
+    def pick(self, current: tuple | None = None) -> dict | None:
+        """
+        Самый быстрый прокси с загрузкой ниже cap. Текущий прокси аккаунта
+        учитывается без самого аккаунта — он не «занимает» своё же место.
+        """
+        for p in self.ranked:
+            key = proxy_key(p["host"], p["port"], p.get("username"), p.get("password"))
+            used = self.load.get(key, 0) - (1 if key == current else 0)
+            if used < self.cap:
+                return p
+        return None
+
+    async def assign(self, account: dict) -> dict | None:
+        """
+        Привязывает аккаунт к лучшему доступному прокси.
+        Возвращает прокси, если привязка изменилась, иначе None.
+        """
+        current = account_proxy_key(account)
+        best = self.pick(current)
+        if best is None:
+            return None
+        best_key = proxy_key(best["host"], best["port"], best.get("username"), best.get("password"))
+        if best_key == current:
+            return None
+        await adb.update_account_proxy(account["id"], best["host"], best["port"], best.get("username"), best.get("password"))
+        if current in self.load:
+            self.load[current] -= 1
+        self.load[best_key] = self.load.get(best_key, 0) + 1
+        return best
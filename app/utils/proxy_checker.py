@@ -6,6 +6,7 @@ import asyncio
 import socks
 import socket
 import traceback
+from dataclasses import dataclass
 from telethon import TelegramClient, functions
 from telethon.sessions import StringSession
 
@@ -40,11 +41,162 @@ def raw_socks5_probe(host: str, port: int, username: str | None, password: str |
         return False, f"{e.__class__.__name__}: {e}"
 
 
+# ---------- асинхронный SOCKS5 (RFC 1928 / RFC 1929) без потоков ----------
 
-async def is_proxy_working(proxy: dict) -> bool:
+SOCKS5_REPLIES = {
+    0x00: "succeeded",
+    0x01: "general SOCKS server failure",
+    0x02: "connection not allowed by ruleset",
+    0x03: "network unreachable",
+    0x04: "host unreachable",
+    0x05: "connection refused",
+    0x06: "TTL expired",
+    0x07: "command not supported",
+    0x08: "address type not supported",
+}
+
+
+@dataclass
+class Socks5ProbeResult:
+    ok: bool
+    stage: str                       # "tcp" | "greeting" | "auth" | "connect" | "done"
+    info: str
+    reply_code: int | None = None    # REP из ответа на CONNECT (0x00..0x08)
+    connect_ms: float | None = None  # TCP до прокси
+    handshake_ms: float | None = None  # от установленного TCP до ответа на CONNECT
+
+
+class _Socks5Error(Exception):
+    def __init__(self, stage: str, info: str, reply_code: int | None = None):
+        super().__init__(info)
+        self.stage = stage
+        self.info = info
+        self.reply_code = reply_code
+
+
+async def _socks5_handshake(reader, writer, username, password, dst_ip, dst_port, progress: dict) -> int:
+    """progress["stage"] — текущий этап: по нему вызывающий подписывает таймаут/обрыв соединения."""
+    # RFC 1929: длины логина и пароля — по одному байту
+    u = (username or "").encode()
+    p = (password or "").encode()
+    if len(u) > 255 or len(p) > 255:
+        raise _Socks5Error("auth", "username/password longer than 255 bytes (RFC 1929)")
+
+    # 1) greeting: предлагаем no-auth и (если есть логин) user/pass
+    progress["stage"] = "greeting"
+    methods = b"\x00\x02" if username else b"\x00"
+    writer.write(b"\x05" + bytes([len(methods)]) + methods)
+    await writer.drain()
+    ver, method = await reader.readexactly(2)
+    if ver != 0x05:
+        raise _Socks5Error("greeting", f"not a SOCKS5 server (ver=0x{ver:02x})")
+    if method == 0xFF:
+        raise _Socks5Error("greeting", "no acceptable auth methods")
+
+    # 2) auth по RFC 1929
+    if method == 0x02:
+        progress["stage"] = "auth"
+        if not username:
+            raise _Socks5Error("auth", "proxy requires username/password")
+        writer.write(b"\x01" + bytes([len(u)]) + u + bytes([len(p)]) + p)
+        await writer.drain()
+        _, status = await reader.readexactly(2)
+        if status != 0x00:
+            raise _Socks5Error("auth", f"authentication failed (status=0x{status:02x})")
+    elif method != 0x00:
+        raise _Socks5Error("greeting", f"unsupported auth method 0x{method:02x}")
+
+    # 3) CONNECT к DC по IPv4
+    progress["stage"] = "connect"
+    writer.write(b"\x05\x01\x00\x01" + socket.inet_aton(dst_ip) + int(dst_port).to_bytes(2, "big"))
+    await writer.drain()
+    ver, rep, _, atyp = await reader.readexactly(4)
+    if ver != 0x05:
+        raise _Socks5Error("connect", f"bad reply version 0x{ver:02x}")
+    if rep != 0x00:
+        raise _Socks5Error("connect", f"SOCKS reply 0x{rep:02x}: {SOCKS5_REPLIES.get(rep, 'unknown')}", rep)
+    # дочитываем BND.ADDR + BND.PORT
+    if atyp == 0x01:
+        await reader.readexactly(4 + 2)
+    elif atyp == 0x04:
+        await reader.readexactly(16 + 2)
+    elif atyp == 0x03:
+        (n,) = await reader.readexactly(1)
+        await reader.readexactly(n + 2)
+    return rep
+
+
+async def socks5_probe(host: str, port: int, username: str | None, password: str | None,
+                       timeout: float = 5.0,
+                       dst_ip: str = TG_DC_IP, dst_port: int = TG_DC_PORT) -> Socks5ProbeResult:
     """
-    Проверка прокси: быстрый raw SOCKS5 CONNECT -> лёгкий RPC в Telegram.
-    API-ключ берём из БД через get_available_api_key().
+    Нативная asyncio-проверка: TCP до прокси + SOCKS5-рукопожатие + CONNECT к DC.
+    Не занимает поток, поэтому тысячи проб идут на одном event loop.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    writer = None
+    connect_ms = None
+    try:
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), timeout=timeout)
+        except asyncio.TimeoutError:
+            return Socks5ProbeResult(False, "tcp", f"TCP connect timeout {timeout:g}s")
+        except OSError as e:
+            return Socks5ProbeResult(False, "tcp", f"{e.__class__.__name__}: {e}")
+        connected = loop.time()
+        connect_ms = (connected - started) * 1000.0
+        left = max(0.1, timeout - (connected - started))
+        progress = {"stage": "greeting"}
+        try:
+            rep = await asyncio.wait_for(
+                _socks5_handshake(reader, writer, username, password, dst_ip, dst_port, progress), timeout=left
+            )
+        except asyncio.TimeoutError:
+            return Socks5ProbeResult(False, progress["stage"], f"SOCKS handshake timeout {timeout:g}s",
+                                     connect_ms=connect_ms)
+        except asyncio.IncompleteReadError:
+            return Socks5ProbeResult(False, progress["stage"], "proxy closed connection during handshake",
+                                     connect_ms=connect_ms)
+        except _Socks5Error as e:
+            return Socks5ProbeResult(False, e.stage, e.info, e.reply_code, connect_ms,
+                                     (loop.time() - connected) * 1000.0)
+        except OSError as e:
+            return Socks5ProbeResult(False, progress["stage"], f"{e.__class__.__name__}: {e}", connect_ms=connect_ms)
+        return Socks5ProbeResult(True, "done", "SOCKS CONNECT ok", rep, connect_ms,
+                                 (loop.time() - connected) * 1000.0)
+    finally:
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+
+async def check_proxy(proxy: dict,
+                      api_key: dict | None = None,
+                      raw_timeout: float = 5.0,
+                      rpc_timeout: float = 10.0) -> tuple[bool, str]:
+    """
+    Двухэтапная проверка прокси с отдельным таймаутом на каждый этап:
+      1) raw SOCKS5 CONNECT к DC (raw_timeout);
+      2) connect + GetNearestDcRequest через Telethon (rpc_timeout на весь этап).
+    Возвращает (ok, info). api_key можно передать заранее, чтобы при массовой
+    проверке не ходить за ним в БД на каждый прокси.
+    """
+    ok, info, _ = await check_proxy_detailed(proxy, api_key, raw_timeout, rpc_timeout)
+    return ok, info
+
+
+async def check_proxy_detailed(proxy: dict,
+                               api_key: dict | None = None,
+                               raw_timeout: float = 5.0,
+                               rpc_timeout: float = 10.0) -> tuple[bool, str, Socks5ProbeResult | None]:
+    """
+    То же, что check_proxy, но дополнительно отдаёт результат SOCKS5-пробы
+    (connect_ms / handshake_ms) — для статистики задержек в таблице proxies.
     """
     host = proxy.get('host')
     port = int(proxy.get('port'))
@@ -53,17 +205,19 @@ async def is_proxy_working(proxy: dict) -> bool:
 
     print(f"[PROXY TEST] tuple: SOCKS5 {host}:{port} rdns=True user={bool(user)}")
 
-    # 1) Быстрая проверка сырого соединения через PySocks к DC
-    ok_raw, raw_info = await asyncio.to_thread(raw_socks5_probe, host, port, user, pwd, 5.0)
-    print(f"[PROXY TEST] raw SOCKS CONNECT → {TG_DC_IP}:{TG_DC_PORT}: {raw_info}")
-    if not ok_raw:
-        return False
+    # 1) Быстрая проверка сырого соединения к DC (asyncio, без потоков)
+    probe = await socks5_probe(host, port, user, pwd, raw_timeout)
+    print(f"[PROXY TEST] raw SOCKS CONNECT → {TG_DC_IP}:{TG_DC_PORT}: {probe.info} "
+          f"(tcp={probe.connect_ms or 0:.0f}ms handshake={probe.handshake_ms or 0:.0f}ms)")
+    if not probe.ok:
+        return False, f"raw/{probe.stage}: {probe.info}", probe
 
-    # 2) Берём API-ключ из БД
-    api_key = get_available_api_key()
+    # 2) Берём API-ключ из БД (если не передали)
+    if api_key is None:
+        api_key = get_available_api_key()
     if not api_key:
         print("[PROXY TEST] no available api key in DB")
-        return False
+        return False, "no api key", probe
 
     proxy_settings = (socks.SOCKS5, host, port, True, user, pwd)
 
@@ -74,20 +228,26 @@ async def is_proxy_working(proxy: dict) -> bool:
         proxy=proxy_settings,
         connection_retries=1,
         request_retries=1,
-        timeout=10,
+        timeout=rpc_timeout,
         flood_sleep_threshold=0,
     )
 
-    try:
+    async def _rpc():
         await client.connect()
         # 3) Лёгкий RPC без авторизации → не триггерит «reuse awaited coroutine»
         await client(functions.help.GetNearestDcRequest())
+
+    try:
+        await asyncio.wait_for(_rpc(), timeout=rpc_timeout)
         print("[PROXY TEST] Telethon check OK")
-        return True
+        return True, "ok", probe
+    except asyncio.TimeoutError:
+        print(f"[PROXY TEST] Telethon check TIMEOUT ({rpc_timeout}s)")
+        return False, f"rpc: timeout {rpc_timeout:g}s", probe
     except Exception as e:
         print(f"[PROXY TEST] Telethon check FAILED: {e.__class__.__name__}: {e}")
         print(f"[PROXY TEST] traceback (short):\n{traceback.format_exc(limit=2)}")
-        return False
+        return False, f"rpc: {e.__class__.__name__}: {e}", probe
     finally:
         try:
             await client.disconnect()
@@ -95,18 +255,45 @@ async def is_proxy_working(proxy: dict) -> bool:
             pass
 
 
-async def check_proxies_concurrently(proxies: list[dict], concurrency: int = 20):
+async def is_proxy_working(proxy: dict) -> bool:
+    """
+    Проверка прокси: быстрый raw SOCKS5 CONNECT -> лёгкий RPC в Telegram.
+    API-ключ берём из БД через get_available_api_key().
+    """
+    ok, _ = await check_proxy(proxy)
+    return ok
+
+
+async def check_proxies_concurrently(proxies: list[dict],
+                                     concurrency: int = 20,
+                                     raw_timeout: float = 5.0,
+                                     rpc_timeout: float = 10.0,
+                                     on_result=None):
     """
     Запускает проверки параллельно, но не более `concurrency` одновременно.
     Возвращает список результатов такой же длины, как `proxies`.
-    Каждый элемент — (ok: bool, info: str | None, proxy: dict).
+    Каждый элемент — (ok: bool, info: str | None, proxy: dict, probe: Socks5ProbeResult | None).
+    on_result(done, total, ok, info, proxy) — необязательный async-колбэк,
+    вызывается по мере завершения (для прогресса).
     """
-    sem = asyncio.Semaphore(concurrency)
+    sem = asyncio.Semaphore(max(1, int(concurrency)))
+    api_key = await asyncio.to_thread(get_available_api_key)  # один раз на всю пачку
+    total = len(proxies)
+    done = 0
 
     async def bounded(px: dict):
+        nonlocal done
         async with sem:
-            ok = await is_proxy_working(px)
-            # можешь вернуть здесь дополнительную инфу, если is_proxy_working её отдаёт
-            return ok, None, px
+            try:
+                ok, info, probe = await check_proxy_detailed(px, api_key, raw_timeout, rpc_timeout)
+            except Exception as e:
+                ok, info, probe = False, f"{e.__class__.__name__}: {e}", None
+        done += 1
+        if on_result is not None:
+            try:
+                await on_result(done, total, ok, info, px)
+            except Exception as e:
+                print(f"[PROXY TEST] on_result callback failed: {e}")
+        return ok, info, px, probe
 
     return await asyncio.gather(*(bounded(px) for px in proxies), return_exceptions=False)
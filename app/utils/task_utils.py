@@ -28,6 +28,7 @@ async def claim_one_task():
                 WHERE id = (
                     SELECT id FROM tasks
                     WHERE status = 'pending' AND is_active = TRUE AND scheduled_at <= NOW() AND is_master = FALSE
+                      AND job_kind IS NULL  -- задачи durable-очереди забирает app/task_queue.py
                     ORDER BY scheduled_at ASC, created_at ASC
                     FOR UPDATE SKIP LOCKED
                     LIMIT 1
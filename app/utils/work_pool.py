@@ -0,0 +1,70 @@
+# app/utils/work_pool.py
+"""
+Общая очередь работы для нескольких аккаунтов одной задачи (work-stealing).
+
+Вместо нарезки списка по аккаунтам заранее каждый аккаунт-воркер берёт
+следующий элемент через take(worker). Элемент, который воркер не смог
+обработать (бан, заморозка, долгий FloodWait), возвращается give_back() —
+его заберёт другой аккаунт; с exclude=True этот же воркер его больше не получит.
+Лимит max_returns считает только возвраты из-за ошибок: с count=False (FloodWait —
+аккаунт просто отлёживается) элемент возвращается без траты попытки.
+
+take() ждёт, пока в работе есть элементы, которые ещё могут вернуться, и
+отдаёт None, когда брать нечего. То, что осталось в очереди после остановки
+всех воркеров, — leftover().
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import Hashable
+
+
+class WorkPool:
+    def __init__(self, items, max_returns: int = 3):
+        self._pending: deque = deque(items)
+        self._returns: dict[Hashable, int] = {}
+        self._excluded: dict[Hashable, set] = {}
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+        self.max_returns = max(0, int(max_returns))
+
+    def _pop_for(self, worker) -> tuple[bool, Hashable]:
+        for i, item in enumerate(self._pending):
+            if worker not in self._excluded.get(item, ()):
+                del self._pending[i]
+                return True, item
+        return False, None
+
+    async def take(self, worker=None):
+        async with self._cond:
+            while True:
+                found, item = self._pop_for(worker)
+                if found:
+                    self._in_flight += 1
+                    return item
+                if self._in_flight == 0:
+                    return None
+                await self._cond.wait()
+
+    async def done(self, item) -> None:
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    async def give_back(self, item, worker=None, exclude: bool = False, count: bool = True) -> bool:
+        """Вернуть элемент в очередь. False — его уже возвращали max_returns раз (элемент выбывает)."""
+        async with self._cond:
+            self._in_flight -= 1
+            returns = self._returns.get(item, 0) + (1 if count else 0)
+            self._returns[item] = returns
+            ok = returns <= self.max_returns
+            if ok:
+                if exclude and worker is not None:
+                    self._excluded.setdefault(item, set()).add(worker)
+                self._pending.append(item)
+            self._cond.notify_all()
+            return ok
+
+    def leftover(self) -> list:
+        return list(self._pending)
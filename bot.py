@@ -3,6 +3,7 @@
 import os
 import asyncio
 import logging
+import threading
 
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
@@ -10,8 +11,11 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.fsm.strategy import FSMStrategy
 from aiogram.types import BotCommand
 from handlers import register_all_handlers
-from config import BOT_TOKEN, ADMIN_IDS
-from app.db import DB_CONFIG  # проверяем, что конфиг БД подтянулся
+from config import BOT_TOKEN, ADMIN_IDS, WORKER_SHARDS
+from app.db import DB_CONFIG, init_db_pool, close_db_pool  # проверяем, что конфиг БД подтянулся
+from app import db_async, log_sink, task_queue
+from app.migrations import apply_migrations
+from app.telegram_client import close_client_pool
 
 # ── Логирование ────────────────────────────────────────────────────────────────
 logging.getLogger("asyncio").setLevel(logging.CRITICAL)
@@ -26,9 +30,31 @@ async def on_startup(bot: Bot):
         # Добавь сюда другие команды по мере необходимости
     ])
 
+def _build_indexes_in_background() -> None:
+    # CREATE INDEX CONCURRENTLY по большим логам идёт минутами — polling его не ждёт.
+    # Поток daemon: остановку бота он не держит, недостроенный индекс пересоздастся при следующем старте.
+    def run():
+        try:
+            for line in apply_migrations():
+                log.info("🗄 %s", line)
+        except Exception as e:
+            log.warning("🗄 index migrations failed: %s", e)
+    threading.Thread(target=run, name="migrations", daemon=True).start()
+
 # ── Основной async-вход ───────────────────────────────────────────────────────
 # ── Основной async-вход ───────────────────────────────────────────────────────
 async def main() -> None:
+    # 0) Пул соединений с БД — до любых хендлеров
+    pool = init_db_pool()
+    log.info("🗄 DB pool ready: %s", pool.stats())
+    await log_sink.start()
+    # схема (таблицы/колонки) нужна до старта очереди; индексы — в фоне, см. ниже
+    try:
+        for line in await db_async.run(apply_migrations, indexes=False):
+            log.info("🗄 %s", line)
+    except Exception as e:
+        log.warning("🗄 schema migrations failed: %s", e)
+
     # 1) Бот/диспетчер
     bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
     dp = Dispatcher(fsm_strategy=FSMStrategy.CHAT)
@@ -52,8 +78,26 @@ async def main() -> None:
     await bot.delete_webhook(drop_pending_updates=True)
     # >>> КОНЕЦ ВСТАВКИ <<<
 
+    # 2) Воркеры durable-очереди (handlers уже зарегистрировали свои job'ы).
+    #    При WORKER_SHARDS > 0 задачи очереди исполняют процессы worker.py; потоки
+    #    вне очереди (check_groups) бот по-прежнему крутит сам.
+    if WORKER_SHARDS > 0:
+        log.info("📥 Task queue: %d external worker shard(s), bot runs only non-queued flows", WORKER_SHARDS)
+    else:
+        queue = await task_queue.start(bot)
+        log.info("📥 Task queue started: %s", queue.stats())
+
+    _build_indexes_in_background()
+
     log.info("🤖 Bot is starting polling…")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await task_queue.stop()  # незавершённые job'ы вернутся в очередь
+        await close_client_pool()
+        await log_sink.stop()  # дописываем буферизованные логи задач
+        db_async.shutdown()
+        close_db_pool()
 
 
 # ── Точка старта ──────────────────────────────────────────────────────────────
@@ -96,3 +96,110 @@ except (json.JSONDecodeError, TypeError) as e:
             "app_version": "Neirotraf 1.0"
         }
     }
+
+def _get_first_float(env_var_name: str, default: float = 0.0) -> float:
+    """
+    Возвращает первое число (допускается дробное) из переменной окружения.
+    """
+    raw = _get_first_value(env_var_name, str(default))
+    try:
+        return float(raw)
+    except (ValueError, TypeError):
+        return default
+
+# --- Пул соединений с PostgreSQL (app/db_pool.py) ---
+DB_POOL_MIN = _get_first_int("DB_POOL_MIN", 2)              # сколько соединений открыть заранее
+DB_POOL_MAX = _get_first_int("DB_POOL_MAX", 20)             # потолок одновременно выданных соединений
+DB_POOL_TIMEOUT = _get_first_float("DB_POOL_TIMEOUT", 30.0)  # сколько ждать свободное соединение, сек
+DB_POOL_MAX_IDLE = _get_first_float("DB_POOL_MAX_IDLE", 300.0)  # через сколько сек простоя соединение закрывается
+DB_CONNECT_TIMEOUT = _get_first_int("DB_CONNECT_TIMEOUT", 10)   # таймаут TCP+auth при открытии, сек
+
+# --- Буферизованная запись логов задач (app/log_sink.py) ---
+LOG_SINK_BATCH_SIZE = _get_first_int("LOG_SINK_BATCH_SIZE", 500)  # строк в одном INSERT
+LOG_SINK_FLUSH_MS = _get_first_int("LOG_SINK_FLUSH_MS", 1000)      # не реже, чем раз в N мс
+
+# --- Пул Telethon-клиентов по аккаунтам (app/telegram_client.py) ---
+TG_POOL_MAX_CONNECTED = _get_first_int("TG_POOL_MAX_CONNECTED", 300)  # максимум одновременно подключённых клиентов
+TG_POOL_IDLE_TTL = _get_first_int("TG_POOL_IDLE_TTL", 900)            # через сколько сек простоя клиента отключаем
+TG_POOL_KEEPALIVE = _get_first_int("TG_POOL_KEEPALIVE", 60)           # период health-check (ping), сек
+TG_POOL_SLOT_WAIT = _get_first_int("TG_POOL_SLOT_WAIT", 120)           # сколько ждать места в заполненном пуле, сек
+TG_POOL_SESSION_WAIT = _get_first_int("TG_POOL_SESSION_WAIT", 120)     # сколько ждать аккаунт, подключённый в другом процессе, сек
+
+# --- Массовая проверка прокси (handlers/proxies.py::check_all_proxies) ---
+PROXY_CHECK_CONCURRENCY = _get_first_int("PROXY_CHECK_CONCURRENCY", 50)     # сколько прокси проверяем одновременно
+PROXY_RAW_TIMEOUT = _get_first_float("PROXY_RAW_TIMEOUT", 5.0)              # таймаут raw SOCKS5 CONNECT, сек
+PROXY_RPC_TIMEOUT = _get_first_float("PROXY_RPC_TIMEOUT", 10.0)             # таймаут connect + RPC через Telethon, сек
+PROXY_PROGRESS_INTERVAL = _get_first_float("PROXY_PROGRESS_INTERVAL", 3.0)  # как часто обновлять сообщение прогресса, сек
+
+# --- Оценка прокси по скорости и автопривязка аккаунтов (app/utils/proxy_assign.py) ---
+PROXY_ACCOUNTS_CAP = _get_first_int("PROXY_ACCOUNTS_CAP", 3)                  # максимум аккаунтов на один прокси
+PROXY_MIN_SUCCESS_RATIO = _get_first_float("PROXY_MIN_SUCCESS_RATIO", 0.8)    # доля успешных проверок для «здорового» прокси
+PROXY_LATENCY_ALPHA = _get_first_float("PROXY_LATENCY_ALPHA", 0.3)            # вес свежего замера в средней задержке (EWMA)
+
+# --- Импорт аккаунтов из ZIP (app/utils/import_accounts.py) ---
+IMPORT_PARSE_WORKERS = _get_first_int("IMPORT_PARSE_WORKERS", 4)              # потоков на разбор .session/.json
+IMPORT_CONNECT_CONCURRENCY = _get_first_int("IMPORT_CONNECT_CONCURRENCY", 10)  # одновременных проверок подключения
+IMPORT_WRITE_BATCH = _get_first_int("IMPORT_WRITE_BATCH", 50)                  # аккаунтов в одной транзакции записи
+IMPORT_PROGRESS_INTERVAL = _get_first_float("IMPORT_PROGRESS_INTERVAL", 3.0)   # как часто обновлять прогресс, сек
+
+# --- Очередь фоновых задач (app/task_queue.py) ---
+TASK_QUEUE_MAX_WORKERS = _get_first_int("TASK_QUEUE_MAX_WORKERS", 8)             # всего задач одновременно на процесс
+TASK_QUEUE_LEASE_SEC = _get_first_float("TASK_QUEUE_LEASE_SEC", 120.0)          # аренда задачи; heartbeat — каждую треть
+TASK_QUEUE_POLL_SEC = _get_first_float("TASK_QUEUE_POLL_SEC", 2.0)              # как часто опрашивать очередь, сек
+TASK_QUEUE_RETRY_DELAY_SEC = _get_first_float("TASK_QUEUE_RETRY_DELAY_SEC", 30.0)  # пауза перед повтором (× номер попытки)
+
+# Лимиты по типам: JSON вида {"join_groups": 2, "boost_views": 1}; не указанные — из job(concurrency=...)
+try:
+    TASK_TYPE_CONCURRENCY = {
+        str(k): int(v) for k, v in json.loads(os.getenv("TASK_TYPE_CONCURRENCY", "{}") or "{}").items()
+    }
+except (json.JSONDecodeError, TypeError, ValueError, AttributeError) as e:
+    print(f"[⚠️] Ошибка загрузки TASK_TYPE_CONCURRENCY из .env: {e}")
+    TASK_TYPE_CONCURRENCY = {}
+
+# Отдельные процессы-воркеры (worker.py): 0 — задачи исполняет сам бот,
+# N > 0 — задачи durable-очереди исполняют N процессов worker.py (процесс i берёт
+# job_shard % N == i, job_shard — наименьший account_id задачи). Наборы аккаунтов у
+# шардов пересекаются, эксклюзивность держит lock в пуле клиентов. Потоки вне очереди
+# (проверка групп на скомпилированном check_groups) по-прежнему идут в процессе бота
+WORKER_SHARDS = _get_first_int("WORKER_SHARDS", 0)
+
+# --- Прогресс задач (app/progress.py) ---
+TASK_PROGRESS_FLUSH_SEC = _get_first_float("TASK_PROGRESS_FLUSH_SEC", 5.0)  # не чаще раза в N секунд пишем счётчики карточки в БД
+
+# --- Массовый поиск групп (handlers/mass_search.py) ---
+MASS_SEARCH_KEY_RETRIES = _get_first_int("MASS_SEARCH_KEY_RETRIES", 2)  # сколько раз ключ передаётся другому аккаунту после ошибки
+MASS_SEARCH_CACHE_TTL_SEC = _get_first_int("MASS_SEARCH_CACHE_TTL_SEC", 24 * 3600)  # сколько результаты поиска по ключу берутся из кеша (0 — не брать)
+
+# --- Планировщик RPC с учётом FloodWait (app/flood_scheduler.py) ---
+FLOOD_ACCOUNT_RATE = _get_first_float("FLOOD_ACCOUNT_RATE", 5.0)        # запросов в секунду на аккаунт
+FLOOD_ACCOUNT_BURST = _get_first_float("FLOOD_ACCOUNT_BURST", 10.0)     # допустимый всплеск на аккаунт
+FLOOD_SLEEP_THRESHOLD = _get_first_float("FLOOD_SLEEP_THRESHOLD", 60.0)  # FloodWait короче — отлёживаем и повторяем сами
+
+# Лимиты по методам: JSON вида {"JoinChannelRequest": [0.05, 2]} — [запросов/сек, всплеск] на аккаунт
+try:
+    FLOOD_METHOD_RATES = {
+        str(k): (float(v[0]), float(v[1]))
+        for k, v in json.loads(os.getenv("FLOOD_METHOD_RATES", "{}") or "{}").items()
+    }
+except (json.JSONDecodeError, TypeError, ValueError, AttributeError, IndexError) as e:
+    print(f"[⚠️] Ошибка загрузки FLOOD_METHOD_RATES из .env: {e}")
+    FLOOD_METHOD_RATES = {}
+
+# --- Адаптивная параллельность массовых операций (app/adaptive_limiter.py) ---
+# JSON вида {"twofa": [5, 20]} — [стартовый лимит, максимум] для операции
+try:
+    ADAPTIVE_LIMITS = {
+        str(k): (int(v[0]), int(v[1]))
+        for k, v in json.loads(os.getenv("ADAPTIVE_LIMITS", "{}") or "{}").items()
+    }
+except (json.JSONDecodeError, TypeError, ValueError, AttributeError, IndexError) as e:
+    print(f"[⚠️] Ошибка загрузки ADAPTIVE_LIMITS из .env: {e}")
+    ADAPTIVE_LIMITS = {}
+
+# --- Кеш резолва username/t.me-ссылок (app/entity_cache.py) ---
+ENTITY_CACHE_TTL_SEC = _get_first_int("ENTITY_CACHE_TTL_SEC", 7 * 24 * 3600)  # сколько доверяем записи без повторного резолва
+ENTITY_CACHE_MEMORY_SIZE = _get_first_int("ENTITY_CACHE_MEMORY_SIZE", 10000)  # записей в in-memory LRU поверх БД
+
+# --- Метаданные групп (app/group_metadata.py) ---
+GROUP_METADATA_FRESH_HOURS = _get_first_float("GROUP_METADATA_FRESH_HOURS", 24.0)  # check-groups не перепроверяет группы, проверенные за это время
@@ -11,7 +11,11 @@ from utils.check_access import admin_only
 from states.import_accounts import ImportStates
 #from utils.import_accounts import import_accounts_from_zip
 from app.utils.import_accounts import import_accounts_from_zip
-from app.telegram_client import create_client_from_session, verify_account_status, get_client
+from contextlib import AsyncExitStack
+from app.telegram_client import create_client_from_session, verify_account_status, retire_account_client, lease_client
+from app.utils.proxy_assign import ProxyAssigner, format_latency
+from app.adaptive_limiter import get_limiter, is_overload_error, report_overload
+from config import PROXY_ACCOUNTS_CAP
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile, CallbackQuery
 from keyboards.account_actions import account_actions_keyboard
 from utils.account_helpers import build_account_card
@@ -41,7 +45,7 @@ from app.db import (
     delete_account_by_id,
 )
 import os, zipfile, asyncio, traceback, socks, re, dateparser, pytz, tempfile, uuid
-from keyboards.accounts_list import accounts_list_keyboard
+from keyboards.accounts_list import accounts_list_keyboard, load_accounts_page, parse_page_callback
 from keyboards.back_menu import back_to_accounts_menu
 from keyboards.accounts_menu import accounts_menu_keyboard
 from telethon import TelegramClient
@@ -70,19 +74,18 @@ def ok_delete_keyboard():
 
 @router.callback_query(F.data.startswith("accpg:"))
 async def switch_accounts_page(callback: types.CallbackQuery):
-    # Парсим номер страницы из callback_data
+    # Парсим номер страницы и keyset-курсор из callback_data
     try:
-        _, page_str = callback.data.split(":")
-        page = int(page_str)
+        page, mode, cursor = parse_page_callback(callback.data)
     except Exception:
         await callback.answer("Некорректная страница", show_alert=False)
         return
 
-    # Получаем список аккаунтов (или тут можно сделать DB limit/offset)
-    accounts = get_all_accounts()  # вернёт list[dict]
+    # Только нужная страница (WHERE id > / < курсор ORDER BY id LIMIT n) + COUNT(*)
+    accounts, page, total = load_accounts_page(page, mode, cursor)
 
     # Перерисовываем клавиатуру для нужной страницы
-    kb = accounts_list_keyboard(accounts, page=page)
+    kb = accounts_list_keyboard(accounts, page=page, total=total)
 
     try:
         # Обновляем только разметку (быстрее и чище)
@@ -177,19 +180,9 @@ async def check_spamblock(callback: types.CallbackQuery):
         await callback.answer("⚠️ Аккаунт не найден.", show_alert=True)
         return
 
-    proxy = None
-    if account.get("proxy_host"):
-        proxy = {
-            "proxy_host": account.get("proxy_host"),
-            "proxy_port": account.get("proxy_port"),
-            "proxy_username": account.get("proxy_username"),
-            "proxy_password": account.get("proxy_password"),
-        }
-
-    client = None
+    lease = AsyncExitStack()
     try:
-        client = await get_client(account["session_string"], proxy)
-        await client.connect()
+        client = await lease.enter_async_context(lease_client(account_id))
 
         # Удаляем переписку с SpamBot
         try:
@@ -276,11 +269,7 @@ async def check_spamblock(callback: types.CallbackQuery):
         await callback.answer(error_reason, show_alert=True)
 
     finally:
-        if client:
-            try:
-                await client.disconnect()
-            except Exception:
-                pass
+        await lease.aclose()  # клиент возвращается в пул
 
         # Отправляем обновлённую карточку аккаунта
         updated_account = get_account_by_id(account_id)
@@ -374,19 +363,9 @@ async def update_profile(callback: types.CallbackQuery):
     if status == "OK":
         update_account_status_to_active(account_id)
 
+        lease = AsyncExitStack()
         try:
-
-            proxy = None
-            if account.get("proxy_host"):
-                proxy = {
-                    "proxy_host": account.get("proxy_host"),
-                    "proxy_port": account.get("proxy_port"),
-                    "proxy_username": account.get("proxy_username"),
-                    "proxy_password": account.get("proxy_password"),
-                }
-
-            client = await get_client(account["session_string"], proxy)
-            await client.connect()
+            client = await lease.enter_async_context(lease_client(account_id))
 
             me = await client.get_me()
 
@@ -416,10 +395,7 @@ async def update_profile(callback: types.CallbackQuery):
             print(f"❗ Ошибка при обновлении данных профиля: {e}")
 
         finally:
-            try:
-                await client.disconnect()
-            except Exception as e:
-                print(f"⚠️ Ошибка при закрытии клиента: {e}")
+            await lease.aclose()
 
         # После обновления данных — показываем сообщение
         await message.edit_text("✅ Аккаунт активный.")  # показываем сообщение
@@ -560,7 +536,7 @@ async def delete_account(callback: types.CallbackQuery):
 @router.callback_query(F.data == "accounts_list")
 @admin_only
 async def show_accounts_list(callback: types.CallbackQuery):
-    accounts = get_all_accounts()
+    accounts, page, total = load_accounts_page()
 
     if not accounts:
         await callback.message.edit_text(
@@ -571,15 +547,15 @@ async def show_accounts_list(callback: types.CallbackQuery):
         return
 
     text = "📋 <b>Список аккаунтов:</b>\n\n"
-    text += f"Всего аккаунтов: {len(accounts)}\n\n"
+    text += f"Всего аккаунтов: {total}\n\n"
 
     for account in accounts:
-        status = "🟢" if not account.get("banned") else "🔴"
+        status = "🔴" if account.get("status") == "banned" else "🟢"
         text += f"{status} {account.get('username') or account.get('phone')}\n"
 
     await callback.message.edit_text(
         text,
-        reply_markup=accounts_list_keyboard(accounts),
+        reply_markup=accounts_list_keyboard(accounts, page=page, total=total),
         parse_mode="HTML"
     )
     await callback.answer()
@@ -655,7 +631,12 @@ async def rebind_proxy_menu(callback: types.CallbackQuery):
         await callback.answer("⚠️ Нет доступных прокси для выбора.", show_alert=True)
         return
 
-    keyboard = []
+    keyboard = [[
+        InlineKeyboardButton(
+            text=f"⚡ Авто: самый быстрый (до {PROXY_ACCOUNTS_CAP} акк.)",
+            callback_data=f"auto_proxy_{account_id}"
+        )
+    ]]
 
     for proxy in proxies:
         # Скрываем плохие прокси
@@ -675,7 +656,7 @@ async def rebind_proxy_menu(callback: types.CallbackQuery):
         else:
             status_emoji = "❔"  # unknown или нет статуса
 
-        button_text = f"{status_emoji} {proxy['host']}:{proxy['port']} ({accounts_count} акк.)"
+        button_text = f"{status_emoji} {proxy['host']}:{proxy['port']} · {format_latency(proxy)} ({accounts_count} акк.)"
 
         keyboard.append([
             InlineKeyboardButton(
@@ -684,8 +665,8 @@ async def rebind_proxy_menu(callback: types.CallbackQuery):
             )
         ])
 
-    # Если не осталось ни одного доступного прокси
-    if not keyboard:
+    # Если не осталось ни одного доступного прокси (кроме кнопки «Авто»)
+    if len(keyboard) == 1:
         await callback.message.edit_text(
             "⚠️ Нет доступных рабочих прокси для перепривязки.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
@@ -744,6 +725,9 @@ async def select_proxy_for_account(callback: types.CallbackQuery):
         proxy.get("password")
     )
 
+    # клиент из пула подключён через старый прокси — пересоздастся, как только его вернут
+    await retire_account_client(account_id)
+
     await callback.answer("✅ Прокси успешно перепривязан!", show_alert=True)
 
     # Возвращаем пользователя в карточку аккаунта
@@ -754,6 +738,42 @@ async def select_proxy_for_account(callback: types.CallbackQuery):
         reply_markup=account_actions_keyboard(account_id),
         parse_mode="HTML"
     )
+@router.callback_query(F.data.startswith("auto_proxy_"))
+@admin_only
+async def auto_select_proxy_for_account(callback: types.CallbackQuery):
+    account_id = int(callback.data.split("_")[2])
+
+    account = get_account_by_id(account_id)
+    if not account:
+        await callback.answer("⚠️ Аккаунт не найден.", show_alert=True)
+        return
+
+    assigner = await ProxyAssigner.create()
+    if not assigner.ranked:
+        await callback.answer("⚠️ Нет здоровых прокси с замерами. Запустите «Проверить все».", show_alert=True)
+        return
+
+    proxy = await assigner.assign(account)
+    if proxy is None:
+        best = assigner.pick(None)
+        if best is None:
+            await callback.answer(f"⚠️ Все здоровые прокси заняты (лимит {assigner.cap} акк.).", show_alert=True)
+        else:
+            await callback.answer("✅ Аккаунт уже на самом быстром доступном прокси.", show_alert=True)
+        return
+
+    await retire_account_client(account_id)
+    await callback.answer(
+        f"✅ Привязан {proxy['host']}:{proxy['port']} · {format_latency(proxy)}", show_alert=True
+    )
+
+    updated_account = get_account_by_id(account_id)
+    await callback.message.edit_text(
+        text=build_account_card(updated_account),
+        reply_markup=account_actions_keyboard(account_id),
+        parse_mode="HTML"
+    )
+
 @router.callback_query(F.data.startswith("back_to_account_"))
 @admin_only
 async def back_to_account(callback: types.CallbackQuery):
@@ -782,33 +802,22 @@ async def get_last_code(callback: types.CallbackQuery):
         await callback.answer("Аккаунт не найден.", show_alert=True)
         return
 
-    session_string = account.get("session_string")
-    proxy = {
-        "proxy_host": account.get("proxy_host"),
-        "proxy_port": account.get("proxy_port"),
-        "proxy_username": account.get("proxy_username"),
-        "proxy_password": account.get("proxy_password"),
-    } if account.get("proxy_host") else None
-
-    from app.telegram_client import get_client
-    client = await get_client(session_string, proxy)
-    await client.start()
-    # Получаем последнее сообщение от официального бота Telegram (user_id=777000)
-    async for msg in client.iter_messages(PeerUser(777000), limit=1):
-        text = msg.text or "<без текста>"
-        date = msg.date.strftime('%d.%m.%Y %H:%M')
-        await callback.answer()  # убрать крутилку
-        await callback.message.answer(
-            f"<b>Последнее служебное сообщение:</b>\n\n"
-            f"<b>Дата:</b> {date}\n"
-            f"<b>Текст:</b> <code>{text}</code>",
-            parse_mode="HTML",
-            reply_markup=ok_delete_keyboard()
-        )
-        break
-    else:
-        await callback.answer("Нет сообщений от Telegram (777000)", show_alert=True)
-    await client.disconnect()
+    async with lease_client(account_id) as client:
+        # Получаем последнее сообщение от официального бота Telegram (user_id=777000)
+        async for msg in client.iter_messages(PeerUser(777000), limit=1):
+            text = msg.text or "<без текста>"
+            date = msg.date.strftime('%d.%m.%Y %H:%M')
+            await callback.answer()  # убрать крутилку
+            await callback.message.answer(
+                f"<b>Последнее служебное сообщение:</b>\n\n"
+                f"<b>Дата:</b> {date}\n"
+                f"<b>Текст:</b> <code>{text}</code>",
+                parse_mode="HTML",
+                reply_markup=ok_delete_keyboard()
+            )
+            break
+        else:
+            await callback.answer("Нет сообщений от Telegram (777000)", show_alert=True)
 
 @router.callback_query(F.data == "delete_code_msg")
 async def delete_code_msg(callback: types.CallbackQuery):
@@ -849,16 +858,8 @@ async def spambot_menu(callback: types.CallbackQuery, state: FSMContext):
     await state.update_data(account_id=account_id)
     await state.set_state(SpamBotDialog.waiting_for_message)
 
-    session_string = account.get("session_string")
-    proxy = {
-        "proxy_host": account.get("proxy_host"),
-        "proxy_port": account.get("proxy_port"),
-        "proxy_username": account.get("proxy_username"),
-        "proxy_password": account.get("proxy_password"),
-    } if account.get("proxy_host") else None
-
-    client = await get_client(session_string, proxy)
-    await client.start()
+    lease = AsyncExitStack()
+    client = await lease.enter_async_context(lease_client(account_id))
     try:
         # Очищаем диалог (если возможно)
         try:
@@ -888,7 +889,7 @@ async def spambot_menu(callback: types.CallbackQuery, state: FSMContext):
 
         await callback.message.answer(f"📬 Сообщение от @spambot:\n\n{text}", reply_markup=markup)
     finally:
-        await client.disconnect()
+        await lease.aclose()
     await callback.answer()
 
 
@@ -903,16 +904,8 @@ async def spambot_sendtext(callback: types.CallbackQuery):
     if not account or not account.get("session_string"):
         await callback.answer("Сессия не найдена!", show_alert=True)
         return
-    session_string = account.get("session_string")
-    proxy = {
-        "proxy_host": account.get("proxy_host"),
-        "proxy_port": account.get("proxy_port"),
-        "proxy_username": account.get("proxy_username"),
-        "proxy_password": account.get("proxy_password"),
-    } if account.get("proxy_host") else None
-
-    client = await get_client(session_string, proxy)
-    await client.start()
+    lease = AsyncExitStack()
+    client = await lease.enter_async_context(lease_client(account_id))
     try:
         spambot = await client.get_entity("spambot")
         msg = (await client.get_messages(spambot, limit=1))[0]
@@ -942,7 +935,7 @@ async def spambot_sendtext(callback: types.CallbackQuery):
         else:
             await callback.answer("Кнопка не найдена!", show_alert=True)
     finally:
-        await client.disconnect()
+        await lease.aclose()
 
 
 # --- Обновить диалог с ботом ---
@@ -953,16 +946,8 @@ async def spambot_refresh(callback: types.CallbackQuery):
     if not account or not account.get("session_string"):
         await callback.answer("Сессия не найдена!", show_alert=True)
         return
-    session_string = account.get("session_string")
-    proxy = {
-        "proxy_host": account.get("proxy_host"),
-        "proxy_port": account.get("proxy_port"),
-        "proxy_username": account.get("proxy_username"),
-        "proxy_password": account.get("proxy_password"),
-    } if account.get("proxy_host") else None
-
-    client = await get_client(session_string, proxy)
-    await client.start()
+    lease = AsyncExitStack()
+    client = await lease.enter_async_context(lease_client(account_id))
     try:
         spambot = await client.get_entity("spambot")
         msg = (await client.get_messages(spambot, limit=1))[0]
@@ -976,7 +961,7 @@ async def spambot_refresh(callback: types.CallbackQuery):
         markup = spambot_action_keyboard(account_id, button_texts)
         await callback.message.answer(f"📬 Сообщение от @spambot:\n\n{text}", reply_markup=markup)
     finally:
-        await client.disconnect()
+        await lease.aclose()
     await callback.answer()
 
 
@@ -999,18 +984,8 @@ async def send_text_to_spambot(message: types.Message, state: FSMContext):
         print("[DEBUG] Нет сессии у аккаунта")
         await message.answer("❗ Не найдена сессия для аккаунта.")
         return
-    session_string = account.get("session_string")
-    proxy = {
-        "proxy_host": account.get("proxy_host"),
-        "proxy_port": account.get("proxy_port"),
-        "proxy_username": account.get("proxy_username"),
-        "proxy_password": account.get("proxy_password"),
-    } if account.get("proxy_host") else None
-
-    from app.telegram_client import get_client
-    import asyncio
-    client = await get_client(session_string, proxy)
-    await client.start()
+    lease = AsyncExitStack()
+    client = await lease.enter_async_context(lease_client(account_id))
     try:
         print(f"[DEBUG] Клиент запущен, отправляем текст: {user_text!r} в @spambot")
         # Отправляем текст
@@ -1053,7 +1028,7 @@ async def send_text_to_spambot(message: types.Message, state: FSMContext):
         traceback.print_exc()
         await message.answer(f"❗ Ошибка при отправке: {ex}")
     finally:
-        await client.disconnect()
+        await lease.aclose()
 
 
 def ok_delete_keyboard():
@@ -1218,26 +1193,15 @@ async def check_all_accounts(callback: CallbackQuery):
     async def process_account(account):
         acc_id = account["id"]
         phone = account.get("phone")
-        session_string = account.get("session_string") or ""
         dbg = []
 
-        proxy = None
-        if account.get("proxy_host"):
-            proxy = {
-                "proxy_host": account.get("proxy_host"),
-                "proxy_port": account.get("proxy_port"),
-                "proxy_username": account.get("proxy_username"),
-                "proxy_password": account.get("proxy_password"),
-            }
-
         status = "UNKNOWN"
         detail = ""
 
+        lease = AsyncExitStack()
         try:
-            client = await get_client(session_string, proxy)
-
-            # connect + auth
-            await _safe_wait(client.connect(), 12, "connect", dbg)
+            # клиент из пула (connect + аренда)
+            client = await _safe_wait(lease.enter_async_context(lease_client(acc_id)), 12, "connect", dbg)
             authed = await _safe_wait(client.is_user_authorized(), 8, "is_user_authorized", dbg)
             if not authed:
                 update_account_status_to_needs_login(acc_id)
@@ -1269,30 +1233,32 @@ async def check_all_accounts(callback: CallbackQuery):
             return status, detail
 
         except Exception as e:
+            if is_overload_error(e):
+                report_overload(e)  # таймаут/прокси — лимитер снизит параллельность
             update_account_status_to_unknown(acc_id)
             status, detail = "UNKNOWN", f"{e.__class__.__name__}: {e}"
             return status, detail
 
         finally:
             try:
-                if "client" in locals():
-                    await _safe_wait(client.disconnect(), 5, "disconnect", dbg)
+                await _safe_wait(lease.aclose(), 5, "release", dbg)
             except Exception:
                 pass
             dbg_tail = (" | " + " ; ".join(dbg)) if dbg else ""
             per_account_lines.append(f"{acc_id}/{phone}: {status} ({detail}){dbg_tail}")
 
 
-    # ограничим параллелизм
-    sem = asyncio.Semaphore(6)
+    # параллельность подстраивается под таймауты/прокси-ошибки/FloodWait (стартуем с 6)
+    limiter = get_limiter("check_accounts", initial=6, max_limit=24, latency_target_sec=30)
 
     async def wrapped(acc):
-        async with sem:
+        async with limiter.slot():
             s, d = await asyncio.wait_for(process_account(acc), timeout=120)
             stats[s] += 1
             return s, d
 
     results = await asyncio.gather(*[wrapped(a) for a in accounts], return_exceptions=True)
+    print(f"[CHECK_ACCOUNTS] limiter: {limiter.stats()}", flush=True)
 
     # формируем отчёт
     ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -6,16 +6,33 @@ from aiogram.filters import Command
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from app.db import get_all_accounts, get_account_groups_with_count  # + get_account_groups_with_count
+from app.db import get_accounts_for_picker, get_account_groups_with_count  # + get_account_groups_with_count
 
 from utils.check_access import admin_only
-from app.db import get_all_accounts
+from app.db import get_accounts_for_picker  # id/phone/username/status/group_id — без session_string
 from utils.boost_views import BoostViewsExecutor  # остаётся как у тебя
+from app.db import create_task_entry
+from app import task_queue
 import asyncio
 import traceback
 
 router = Router()
 
+@task_queue.job("boost_views", concurrency=1)
+async def _run_boost_views_job(ctx: task_queue.JobContext):
+    task = {
+        "id": ctx.task_id,
+        "account_id": None,
+        "payload": ctx.task.get("payload") or {},
+    }
+    try:
+        executor = BoostViewsExecutor(task=task, account=None)
+        await executor.run()
+    except Exception as e:
+        print(f"[CRITICAL] BoostViews failed: {e}")
+        traceback.print_exc()
+        raise
+
 # ───────────────────────── helpers ─────────────────────────
 
 STATUS_ICONS = {
@@ -183,7 +200,7 @@ async def boost_ui_close_cb(cb: types.CallbackQuery, state: FSMContext):
 async def cmd_boost(message: types.Message, state: FSMContext):
     await state.set_state(BoostViewsStates.selecting_accounts)
     await state.update_data(selected=[], page=0)
-    accs = get_all_accounts()
+    accs = get_accounts_for_picker()
     groups = get_account_groups_with_count()
     await _send_host(
         message, state,
@@ -201,7 +218,7 @@ async def cmd_boost(message: types.Message, state: FSMContext):
 async def boost_start(cb: types.CallbackQuery, state: FSMContext):
     await state.set_state(BoostViewsStates.selecting_accounts)
     await state.update_data(selected=[], page=0)
-    accs = get_all_accounts()
+    accs = get_accounts_for_picker()
     groups = get_account_groups_with_count()
     await _edit_host(cb, state, "👥 Выберите аккаунты (страница 1):",
                      boost_accounts_keyboard(accs, [], page=0, groups=groups))
@@ -213,7 +230,7 @@ async def boost_start(cb: types.CallbackQuery, state: FSMContext):
 async def boost_page(cb: types.CallbackQuery, state: FSMContext):
     page = int(cb.data.split(":")[1])
     data = await state.get_data()
-    accs = get_all_accounts()
+    accs = get_accounts_for_picker()
     groups = get_account_groups_with_count()
     await state.update_data(page=page)
     await _edit_host(cb, state,
@@ -232,7 +249,7 @@ async def boost_toggle(cb: types.CallbackQuery, state: FSMContext):
     else: sel.add(acc_id)
     await state.update_data(selected=list(sel))
 
-    accs = get_all_accounts()
+    accs = get_accounts_for_picker()
     groups = get_account_groups_with_count()
     page = int(data.get("page", 0))
     await _edit_host(cb, state,
@@ -244,7 +261,7 @@ async def boost_toggle(cb: types.CallbackQuery, state: FSMContext):
 @router.callback_query(F.data == "boost_select_all", BoostViewsStates.selecting_accounts)
 @admin_only
 async def boost_select_all(cb: types.CallbackQuery, state: FSMContext):
-    accs = get_all_accounts()
+    accs = get_accounts_for_picker()
     all_ids = [a["id"] for a in accs]
     await state.update_data(selected=all_ids)
     page = (await state.get_data()).get("page", 0)
@@ -258,7 +275,7 @@ async def boost_select_all(cb: types.CallbackQuery, state: FSMContext):
 @router.callback_query(F.data == "boost_clear_all", BoostViewsStates.selecting_accounts)
 @admin_only
 async def boost_clear_all(cb: types.CallbackQuery, state: FSMContext):
-    accs = get_all_accounts()
+    accs = get_accounts_for_picker()
     await state.update_data(selected=[])
     page = (await state.get_data()).get("page", 0)
     groups = get_account_groups_with_count()
@@ -273,7 +290,7 @@ async def boost_clear_all(cb: types.CallbackQuery, state: FSMContext):
 async def boost_group_pick(cb: types.CallbackQuery, state: FSMContext):
     group_id = int(cb.data.split(":")[1])
     data = await state.get_data()
-    accs = get_all_accounts()
+    accs = get_accounts_for_picker()
     # выберем все id из этой группы
     ids_in_group = [a["id"] for a in accs if a.get("group_id") == group_id]
     if not ids_in_group:
@@ -388,23 +405,9 @@ async def boost_got_delays(msg: types.Message, state: FSMContext):
         "max_parallel": max_parallel,
     }
 
-    # запускаем как у тебя — напрямую executor в фоне (без лишних сообщений в чат)
-    fake_task = {
-        "id": 0,
-        "account_id": None,
-        "payload": payload
-    }
-
-    async def run_boost():
-        try:
-            executor = BoostViewsExecutor(task=fake_task, account=None)
-            await executor.run()
-        except Exception as e:
-            print(f"[CRITICAL] BoostViews failed: {e}")
-            traceback.print_exc()
-
-    # ✅ запускаем задачу в фоне
-    asyncio.create_task(run_boost())
+    # ✅ задача в БД + очередь воркеров (executor тот же, без лишних сообщений в чат)
+    task_id = create_task_entry(task_type="boost_views", created_by=msg.from_user.id, payload=payload)
+    await task_queue.submit(task_id, "boost_views", shard_key=task_queue.shard_key_for(data["selected"]))
 
     # сначала удаляем старый «хост»
     await _delete_host(msg, state)
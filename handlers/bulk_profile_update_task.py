@@ -6,9 +6,11 @@ from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command
 from states.bulk_profile_update_states import BulkProfileUpdateFSM
 from utils.check_access import admin_only
-from app.db import get_all_accounts, get_account_by_id, get_connection
+from app.db import get_accounts_for_picker, get_account_by_id, get_connection
 from aiogram.types import FSInputFile
-from app.telegram_client import get_client
+from contextlib import AsyncExitStack
+from app.telegram_client import lease_client
+from app.adaptive_limiter import get_limiter, is_overload_error, report_overload
 from telethon.tl.functions.account import UpdateProfileRequest, UpdateUsernameRequest
 from telethon.tl.functions.photos import UploadProfilePhotoRequest
 from app.memory_storage import bulk_profile_tasks_storage
@@ -159,7 +161,7 @@ def bulk_accounts_keyboard(
 @router.callback_query(F.data == "start_bulk_profile_update")
 @admin_only
 async def start_bulk_update(callback: types.CallbackQuery, state: FSMContext):
-    accounts = get_all_accounts()
+    accounts = get_accounts_for_picker()
     if not accounts:
         await callback.message.edit_text("⚠️ Нет доступных аккаунтов.")
         await callback.answer()
@@ -787,19 +789,10 @@ async def confirm_bulk_profile_update(callback: types.CallbackQuery, state: FSMC
         task_log_id=None
     ):
         account_log = []
+        lease = AsyncExitStack()
         try:
             account = get_account_by_id(account_id)
-            proxy = None
-            if account.get("proxy_host"):
-                proxy = {
-                    "proxy_host": account.get("proxy_host"),
-                    "proxy_port": account.get("proxy_port"),
-                    "proxy_username": account.get("proxy_username"),
-                    "proxy_password": account.get("proxy_password"),
-                }
-
-            client = await get_client(account["session_string"], proxy)
-            await client.connect()
+            client = await lease.enter_async_context(lease_client(account_id))
 
             account_log.append(f"Аккаунт ID: {account_id}, Username: @{account.get('username', '-')}")
             print(f"[DEBUG] Внутри update_single_account: task_log_id = {task_log_id}")
@@ -872,10 +865,12 @@ async def confirm_bulk_profile_update(callback: types.CallbackQuery, state: FSMC
                 except Exception as e:
                     account_log.append(f"❌ Ошибка при обновлении профиля: {e}")
 
-            await client.disconnect()
-
         except Exception as e:
+            if is_overload_error(e):
+                report_overload(e)
             account_log.append(f"❌ Общая ошибка обработки аккаунта ID {account_id}: {e}")
+        finally:
+            await lease.aclose()  # клиент возвращается в пул
 
         if logs is not None:
             logs.append("\n".join(account_log))
@@ -956,7 +951,13 @@ async def confirm_bulk_profile_update(callback: types.CallbackQuery, state: FSMC
     logs.append(f"👥 Всего аккаунтов: {len(selected_accounts)}\n")
 
 
-    await asyncio.gather(*tasks)
+    limiter = get_limiter("bulk_profile_update", initial=4, max_limit=16)
+
+    async def _limited(coro):
+        async with limiter.slot():
+            return await coro
+
+    await asyncio.gather(*[_limited(t) for t in tasks])
     
     # ✅ ОБНОВЛЕНИЕ СТАТУСА ЗАДАЧИ В БД
     try:
@@ -1167,7 +1168,7 @@ async def clear_bio(callback: types.CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data == "task_pick_accounts")
 async def bulk_pick_accounts_start(callback: types.CallbackQuery, state: FSMContext):
-    accounts = get_all_accounts()  # [{'id','username','phone','group_id', ...}]
+    accounts = get_accounts_for_picker()  # [{'id','username','phone','status','group_id'}]
     groups   = get_account_groups_with_count()
 
     await state.update_data(**{
@@ -7,7 +7,11 @@ from aiogram.fsm.state import State, StatesGroup
 from config import BOT_TOKEN
 from utils.check_access import admin_only
 from app.db import get_all_accounts, create_task_entry, insert_task_create_log, get_connection, update_task_status, update_task_accounts_count
-from app.telegram_client import get_client
+from app import log_sink
+from contextlib import AsyncExitStack
+from app.telegram_client import lease_client
+from app.entity_cache import resolve_entity
+from app.adaptive_limiter import get_limiter, is_overload_error, report_overload
 from utils.username_generator import generate_valid_username
 from telethon.tl.functions.channels import CreateChannelRequest, EditPhotoRequest, UpdateUsernameRequest
 from telethon.tl.types import InputChatUploadedPhoto, MessageMediaWebPage
@@ -647,18 +651,13 @@ async def create_channels_process(message: Message, state: FSMContext, data: dic
                 return f"⚠️ Аккаунт {acc_username} уже использован, пропущен\n"
             used_accounts.add(account_key)
 
-        proxy = {
-            "proxy_host": account["proxy_host"],
-            "proxy_port": account["proxy_port"],
-            "proxy_username": account["proxy_username"],
-            "proxy_password": account["proxy_password"],
-        }
-
+        lease = AsyncExitStack()
         try:
-            client = await get_client(account["session_string"], proxy)
             try:
-                await client.connect()
+                client = await lease.enter_async_context(lease_client(account_id))
             except Exception as e:
+                if is_overload_error(e):
+                    report_overload(e)
                 log += f"❌ Ошибка подключения @{acc_username}: {e}\n"
                 return log
 
@@ -682,7 +681,6 @@ async def create_channels_process(message: Message, state: FSMContext, data: dic
                     ch_username = generate_valid_username()
             if not success:
                 log += f"❌ Не удалось установить username для @{acc_username}\n"
-                await client.disconnect()
                 insert_task_create_log(task_id, account_id, log)
                 return log
 
@@ -812,14 +810,12 @@ async def create_channels_process(message: Message, state: FSMContext, data: dic
             clean_donor = extract_username_or_id(donor)
             if not clean_donor:
                 log += f"⚠️ Неверный формат донора: {donor}\n"
-                await client.disconnect()
                 insert_task_create_log(task_id, account_id, log)
                 return log
             try:
-                from_channel = await client.get_entity(clean_donor)
+                from_channel = await resolve_entity(client, clean_donor, account_id)
             except Exception as e:
                 log += f"⚠️ Не удалось найти канал @{clean_donor}: {e}\n"
-                await client.disconnect()
                 insert_task_create_log(task_id, account_id, log)
                 return log
 
@@ -868,22 +864,28 @@ async def create_channels_process(message: Message, state: FSMContext, data: dic
                         
             log += f"📎 Скопировано {post_count} постов из {clean_donor}\n"
 
-            await client.disconnect()
             insert_task_create_log(task_id, account_id, log)
             return log
 
         except Exception as e:
+            if is_overload_error(e):
+                report_overload(e)
             log += f"❌ Общая ошибка обработки @{acc_username}: {e}\n"
             insert_task_create_log(task_id, account_id, log)
             return log
+        finally:
+            await lease.aclose()  # клиент возвращается в пул
 
-    # Параллельный запуск
+    # Параллельный запуск: лимит параллельности подстраивается под FloodWait/таймауты/прокси
+    limiter = get_limiter("create_channels", initial=4, max_limit=16)
     results = await asyncio.gather(
-        *[process_account(i, acc) for i, acc in enumerate(filtered_accounts)],
+        *[limiter.run(process_account, i, acc) for i, acc in enumerate(filtered_accounts)],
         return_exceptions=True
     )
+    print(f"[CREATE_CHANNELS] task#{task_id} limiter: {limiter.stats()}", flush=True)
 
     # Сводка
+    await log_sink.flush()  # insert_task_create_log буферизуется — дописываем до чтения лога
     accounts_count = len(filtered_accounts)
     update_task_accounts_count(task_id, accounts_count)
     update_task_status(task_id, "completed")
@@ -1,6 +1,6 @@
 from aiogram import Router, types, F
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile
-from app.db import get_connection
+from app.db import get_connection, get_task_counters
 from aiogram.exceptions import TelegramBadRequest
 
 router = Router()
@@ -37,24 +37,15 @@ async def show_check_groups_task(callback: types.CallbackQuery):
     created_at = task[6]
     status = task[4]
 
-    # Общая статистика
-    cur.execute("""
-        SELECT
-            COUNT(*) AS total_checked,
-            SUM(CASE WHEN result = 'ok' THEN 1 ELSE 0 END) AS passed_filter,
-            SUM(CASE WHEN result = 'small' THEN 1 ELSE 0 END) AS less_than_filter,
-            SUM(CASE WHEN result = 'bad' THEN 1 ELSE 0 END) AS errors
-        FROM check_groups_log
-        WHERE task_id = %s;
-    """, (task_id,))
-    stats = cur.fetchone()
-    X, Z, B, T = stats[0] or 0, stats[1] or 0, stats[2] or 0, stats[3] or 0
-
-    cur.execute("SELECT DISTINCT account_id, account_username FROM check_groups_log WHERE task_id=%s", (task_id,))
-    accounts_list = cur.fetchall()
-
     cur.close()
     conn.close()
+
+    # Общая статистика (task_counters ведут триггеры на check_groups_log)
+    counters = get_task_counters(task_id, "check")
+    C = counters.pop("cached", 0)
+    X = sum(counters.values())
+    Z, B, T = counters.get("ok", 0), counters.get("small", 0), counters.get("bad", 0)
+    accounts_list = payload.get("accounts", []) if payload else []
     
     
     # --- Красивые статусы для пользователя ---
@@ -79,6 +70,7 @@ async def show_check_groups_task(callback: types.CallbackQuery):
 
 Всего групп в задаче: <b>{total_groups}</b>
 Проверено на данный момент: <b>{X}</b>
+♻️ Из них взято из кеша: <b>{C}</b>
 
 👥Сколько минимум подписчиков должно быть: <b>{min_members}</b>
 💎Подходящие группы: <b>{Z}</b>
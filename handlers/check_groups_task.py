@@ -10,9 +10,12 @@ from utils.check_access import admin_only
 from utils.check_groups import check_groups_members_filter
 from app.db import (
     get_all_accounts, get_account_by_id, create_task_entry,
-    get_ok_channels_for_task, get_connection
+    get_ok_channels_for_task, get_connection, log_check_group
 )
 from app.db import get_account_groups_with_count  # ← чипсы групп
+from app import log_sink
+from app.group_metadata import split_fresh, record_check_results
+from config import GROUP_METADATA_FRESH_HOURS
 
 router = Router()
 
@@ -24,6 +27,7 @@ class CheckGroupsTaskStates(StatesGroup):
     waiting_for_delay_accounts = State()
     waiting_for_delay_requests = State()
     waiting_for_floodwait_padding = State()
+    waiting_for_freshness = State()
 
 # ===== Sticky UI helpers (как в лайкере) =====
 async def ui_get_ids(state) -> tuple[int | None, int | None]:
@@ -338,12 +342,31 @@ async def gc_delay_requests(msg: types.Message, state: FSMContext):
     chat_id, message_id = await ui_get_ids(state)
     await ui_edit(msg.bot, chat_id, message_id, "⏱ Введи задержку после FloodWait (например: 5-15):")
 
-# ===== финал: создание задачи и запуск =====
+# ===== задержка после FloodWait =====
 @router.message(CheckGroupsTaskStates.waiting_for_floodwait_padding)
 @admin_only
+async def gc_floodwait_padding(msg: types.Message, state: FSMContext):
+    await state.update_data(floodwait_padding=(msg.text or "").strip())
+    await delete_user_message(msg)
+    await state.set_state(CheckGroupsTaskStates.waiting_for_freshness)
+    chat_id, message_id = await ui_get_ids(state)
+    await ui_edit(
+        msg.bot, chat_id, message_id,
+        f"♻️ Использовать результаты проверок не старше N часов (0 — проверить всё заново).\n"
+        f"Например: {GROUP_METADATA_FRESH_HOURS:g}"
+    )
+
+# ===== финал: создание задачи и запуск =====
+@router.message(CheckGroupsTaskStates.waiting_for_freshness)
+@admin_only
 async def gc_finalize(msg: types.Message, state: FSMContext):
-    floodwait = (msg.text or "").strip()
+    raw = (msg.text or "").strip().replace(",", ".")
+    try:
+        freshness_hours = max(0.0, float(raw))
+    except ValueError:
+        freshness_hours = GROUP_METADATA_FRESH_HOURS
     data = await state.get_data()
+    floodwait = data["floodwait_padding"]
 
     selected_ids: list[int] = data.get("selected_accounts", [])
     accounts = [get_account_by_id(i) for i in selected_ids if get_account_by_id(i)]
@@ -362,6 +385,7 @@ async def gc_finalize(msg: types.Message, state: FSMContext):
         "min_members": data["min_members"],
         "accounts": selected_ids,
         "delays": delays,
+        "freshness_hours": freshness_hours,
     }
     task_id = create_task_entry("check_groups", created_by=msg.from_user.id, payload=payload)
 
@@ -376,15 +400,32 @@ async def gc_finalize(msg: types.Message, state: FSMContext):
     )
     await delete_user_message(msg)
 
+    # свежие результаты прошлых проверок берём из group_metadata, аккаунты проверяют только остальное
+    min_members = data["min_members"]
+    fresh, stale = await split_fresh(data["links"], freshness_hours)
+    cached_good, cached_small = [], []
+    for link, row in fresh.items():
+        members = row["participants_count"]
+        result = "ok" if members >= min_members else "small"
+        (cached_good if result == "ok" else cached_small).append(link)
+        log_check_group(task_id, {"id": None, "username": "кеш"}, link, result, members, "cached")
+
     # запуск проверки (не спамим промежуточными сообщениями)
-    good, small, bad, errors = await check_groups_members_filter(
-        links=data["links"],
-        message=None,
-        min_members=data["min_members"],
-        accounts=accounts,
-        task_id=task_id,
-        delays=delays
-    )
+    good, small, bad, errors = [], [], [], []
+    if stale:
+        good, small, bad, errors = await check_groups_members_filter(
+            links=stale,
+            message=None,
+            min_members=min_members,
+            accounts=accounts,
+            task_id=task_id,
+            delays=delays
+        )
+    await log_sink.flush()  # log_check_group буферизуется — фиксируем до показа карточки
+    try:
+        await record_check_results(task_id)
+    except Exception as e:
+        print(f"[CHECK_GROUPS] group_metadata update failed for task {task_id}: {e}", flush=True)
 
     # лог файлом
     parts = []
@@ -392,6 +433,11 @@ async def gc_finalize(msg: types.Message, state: FSMContext):
     if small:  parts.append("⚠️ Мало участников:\n" + "\n".join(small))
     if bad:    parts.append("❌ Не удалось проверить:\n" + "\n".join(bad))
     if errors: parts.append("Ошибки:\n" + "\n".join(errors))
+    if fresh:
+        parts.append(
+            f"♻️ Из кеша (проверены за последние {freshness_hours:g} ч):\n"
+            + "\n".join([f"✅ {l}" for l in cached_good] + [f"⚠️ {l}" for l in cached_small])
+        )
     text = "\n\n".join(parts) if parts else "Проверка завершена. Нет подходящих групп."
 
     with tempfile.NamedTemporaryFile("w+", encoding="utf-8", delete=False) as tmp:
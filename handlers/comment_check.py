@@ -17,6 +17,7 @@ from app.db import (
     get_comment_check_logs,
 )
 from keyboards.comment_check_accounts_keyboard import cchk_accounts_keyboard
+from app import log_sink, task_queue
 from aiogram.exceptions import TelegramBadRequest
 
 router = Router()
@@ -402,8 +403,20 @@ async def cchk_channels_input(message: types.Message, state: FSMContext):
 
 
 
-# реестр задач (чтобы GC не прибил и чтобы можно было отменять при желании)
-_CCHK_WORKERS: dict[int, asyncio.Task] = {}
+@task_queue.job("comment_check", concurrency=2)
+async def _run_comment_check_job(ctx: task_queue.JobContext):
+    chat_id = ctx.args["chat_id"]
+    message_id = ctx.args["message_id"]
+
+    # кастомное notify: не шлём «✅», а перерисовываем карточку и можем отдать лог
+    async def _notify(_: str):
+        try:
+            await log_sink.flush()  # insert_comment_check_log буферизуется
+            await render_cchk_task(ctx.bot, chat_id, message_id, ctx.task_id)
+        except Exception:
+            pass
+
+    await safe_run_comment_check(ctx.task_id, notify=_notify)
 
 @router.callback_query(CChkStates.confirming, F.data == "cchk_start")
 @admin_only
@@ -444,19 +457,9 @@ async def cchk_start(callback: types.CallbackQuery, state: FSMContext):
             pass
     asyncio.create_task(_swap_to_card())
 
-    # кастомное notify: не шлём «✅», а перерисовываем карточку и можем отдать лог
-    async def _notify(_: str):
-        try:
-            await render_cchk_task(callback.message.bot, chat_id, message_id, task_id)
-            # опционально — сразу прислать файл со списком каналов «с обсуждениями»
-            # await cchk_send_yes_export(callback.message, task_id)
-        except Exception:
-            pass
-
-    # запускаем воркер
-    t = asyncio.create_task(safe_run_comment_check(task_id, notify=_notify))
-    _CCHK_WORKERS[task_id] = t
-    t.add_done_callback(lambda fut: _CCHK_WORKERS.pop(task_id, None))
+    # ставим в очередь воркеров; карточку перерисует notify из _run_comment_check_job
+    await task_queue.submit(task_id, "comment_check", {"chat_id": chat_id, "message_id": message_id},
+                            shard_key=task_queue.shard_key_for(selected_ids))
 
     await callback.answer("Стартануло ✅")
 
@@ -1,14 +1,11 @@
 # handlers/comment_check_task_view.py
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from app.db import get_task_by_id, get_comment_check_logs
+from app.db import get_task_by_id, get_task_counters
 import json
 
 def _stats(task_id: int):
-    rows = get_comment_check_logs(task_id)
-    yes = sum(1 for r in rows if r[2] is True)
-    no  = sum(1 for r in rows if r[2] is False)
-    unk = sum(1 for r in rows if r[2] is None)
-    return yes, no, unk
+    c = get_task_counters(task_id, "cchk")
+    return c.get("yes", 0), c.get("no", 0), c.get("unknown", 0)
 
 def _kb(task_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
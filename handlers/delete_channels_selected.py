@@ -6,6 +6,7 @@ from aiogram import Router, types, F, Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message, FSInputFile
 from utils.check_access import admin_only
 from app.db import get_all_accounts, create_task_entry, get_task_del_logs, get_account_groups_with_count
+from app.adaptive_limiter import get_limiter
 from handlers.delete_old_channels import delete_old_channels_handler
 from keyboards.main_menu import start_menu_keyboard
 from aiogram.exceptions import TelegramBadRequest  # ДОБАВЬ
@@ -222,7 +223,8 @@ async def run_deletion_del(callback: types.CallbackQuery, bot: Bot):
         )
         await delete_old_channels_handler(fake_message, bot, only_account_id=acc_id, task_id=task_id)
 
-    await asyncio.gather(*[run_one(acc_id) for acc_id in selected_ids])
+    limiter = get_limiter("delete_channels", initial=4, max_limit=16)
+    await asyncio.gather(*[limiter.run(run_one, acc_id) for acc_id in selected_ids])
 
     # 5. Получаем логи из task_del
     task_logs = get_task_del_logs(task_id)  # List[str]
@@ -3,7 +3,7 @@
 from aiogram import Router, types
 from aiogram.filters import Command
 from utils.check_access import admin_only
-from app.telegram_client import get_client
+from app.telegram_client import lease_client
 from app.db import get_all_accounts
 from telethon.tl.functions.messages import DeleteChatUserRequest
 from telethon.tl.functions.channels import DeleteChannelRequest
@@ -11,6 +11,7 @@ from telethon.tl.functions.messages import GetDialogsRequest
 from telethon.tl.types import InputPeerEmpty
 from aiogram import Bot
 from app.db import insert_task_del_log
+from app.adaptive_limiter import is_overload_error, report_overload
 from datetime import datetime
 import asyncio
 
@@ -33,40 +34,37 @@ async def delete_old_channels_handler(message: types.Message, bot: Bot, only_acc
 
     for acc in accounts:
         acc_log = []
-        session = acc.get("session_string")
         account_id = acc["id"]
         username = acc.get("username") or acc.get("label") or f"ID {account_id}"
         acc_log.append(f"🔸 Аккаунт @{username}")
 
         try:
-            client = await get_client(session)
-            await client.connect()
-
-            result = await client(
-                GetDialogsRequest(
-                    offset_date=None,
-                    offset_id=0,
-                    offset_peer=InputPeerEmpty(),
-                    limit=100,
-                    hash=0
+            async with lease_client(account_id) as client:
+                result = await client(
+                    GetDialogsRequest(
+                        offset_date=None,
+                        offset_id=0,
+                        offset_peer=InputPeerEmpty(),
+                        limit=100,
+                        hash=0
+                    )
                 )
-            )
-
-            count_deleted = 0
-            for chat in result.chats:
-                if getattr(chat, "creator", False):
-                    try:
-                        await client(DeleteChannelRequest(channel=chat))
-                        acc_log.append(f"✅ Удалён канал: {chat.title}")
-                        count_deleted += 1
-                    except Exception as e:
-                        acc_log.append(f"⚠️ Не удалось удалить {chat.title}: {e}")
+
+                count_deleted = 0
+                for chat in result.chats:
+                    if getattr(chat, "creator", False):
+                        try:
+                            await client(DeleteChannelRequest(channel=chat))
+                            acc_log.append(f"✅ Удалён канал: {chat.title}")
+                            count_deleted += 1
+                        except Exception as e:
+                            acc_log.append(f"⚠️ Не удалось удалить {chat.title}: {e}")
 
             if count_deleted == 0:
                 acc_log.append("ℹ️ Нет каналов для удаления.")
-
-            await client.disconnect()
         except Exception as e:
+            if is_overload_error(e):
+                report_overload(e)  # для адаптивного лимита в run_deletion_del
             acc_log.append(f"❌ Ошибка @{username}: {e}")
 
         acc_log_text = "\n".join(acc_log)
@@ -1,6 +1,7 @@
 # handlers/join_groups_task.py
 
 import asyncio, os, time, random
+from contextlib import AsyncExitStack
 from aiogram import Router, types, F
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
@@ -8,13 +9,18 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, BufferedIn
 from aiogram.exceptions import TelegramBadRequest
 
 from app.db import (
-    get_all_accounts, get_account_by_id, create_task_entry,
-    insert_join_groups_log, update_task_payload, get_account_groups_with_count,
-    get_task_by_id,
+    get_all_accounts, create_task_entry, get_account_groups_with_count,
+    get_task_by_id, insert_join_groups_log,
 )
-from app.telegram_client import get_client
+from app import db_async as adb, log_sink, task_queue
+from app.telegram_client import lease_client
+from app.utils.work_pool import WorkPool
+from app.flood_scheduler import get_flood_scheduler
+from app.entity_cache import get_entity_cache
+from app.progress import ProgressTracker
 from telethon.tl.functions.channels import JoinChannelRequest
-from telethon.errors import FloodWaitError
+from telethon.errors import FloodWaitError, ChannelInvalidError, PeerIdInvalidError
+from telethon.utils import get_peer_id
 from telethon import events
 from .join_groups_task_view import create_join_groups_task_card
 
@@ -329,8 +335,15 @@ async def join_receive_delay(msg: types.Message, state: FSMContext):
     await ui_edit(msg.bot, chat_id, message_id, card_text, card_markup)
     await state.update_data(progress_message_id=message_id)
 
-    await state.set_state(JoinGroupsFSM.processing)
-    asyncio.create_task(process_join_groups(state, msg))
+    # всё, что нужно исполнителю, уходит в очередь — переживёт рестарт бота
+    await task_queue.submit(task_id, "join_groups", {
+        "chat_id": msg.chat.id,
+        "selected_accounts": list(data["selected_accounts"]),
+        "links": list(data["links"]),
+        "delay": delay,
+        "progress_message_id": message_id,
+    }, shard_key=task_queue.shard_key_for(data["selected_accounts"]))
+    await state.clear()
 
 # ===== Кнопка удаления лога =====
 def join_groups_log_keyboard():
@@ -358,68 +371,132 @@ async def has_inline_captcha(client, entity):
     except Exception:
         return False
 
-async def wait_for_captcha_robust(client, entity, timeout=20):
-    import asyncio
-    if await has_inline_captcha(client, entity):
-        return True
-
-    future = asyncio.get_event_loop().create_future()
+class _CaptchaWatcher:
+    """
+    Фоновое распознавание капчи для одного клиента (вне критического пути вступления).
+
+    После вступления ссылка сразу считается «без капчи», а watch() ставит чат на
+    наблюдение: общий NewMessage-хендлер клиента ловит сообщение с кнопками в этом
+    чате, а если за timeout ничего не пришло — один раз проверяем последние сообщения
+    (капча могла прийти раньше, чем мы подписались). Найденная капча → on_captcha(link).
+    """
+    def __init__(self, client, on_captcha, timeout: float = 20):
+        self.client = client
+        self.on_captcha = on_captcha
+        self.timeout = timeout
+        self._pending: dict[int, tuple[str, object]] = {}   # chat_id -> (link, entity)
+        self._tasks: set[asyncio.Task] = set()
+        self._started = False
+
+    def start(self):
+        if not self._started:
+            self.client.add_event_handler(self._on_message, events.NewMessage)
+            self._started = True
+
+    def watch(self, entity, link: str):
+        chat_id = get_peer_id(entity)  # помеченный id, как event.chat_id (для Channel и InputPeer)
+        self._pending[chat_id] = (link, entity)
+        t = asyncio.create_task(self._fallback(chat_id))
+        self._tasks.add(t)
+        t.add_done_callback(self._tasks.discard)
+
+    async def _found(self, chat_id: int):
+        item = self._pending.pop(chat_id, None)
+        if item is None:
+            return
+        try:
+            await self.on_captcha(item[0])
+        except Exception as e:
+            print(f"[JOIN] captcha reclassify failed for {item[0]}: {e}")
 
-    async def on_new_message(event):
-        if event.chat_id == entity.id and event.message.reply_markup:
-            try:
-                await event.message.click(0)
-                if not future.done():
-                    future.set_result(True)
-            except Exception:
-                if not future.done():
-                    future.set_result(False)
-
-    client.add_event_handler(on_new_message, events.NewMessage)
-    result = False
-    try:
+    async def _on_message(self, event):
+        if event.chat_id not in self._pending or not event.message.reply_markup:
+            return
         try:
-            await asyncio.wait_for(future, timeout=timeout-2)
-            if future.done():
-                result = future.result()
-        except asyncio.TimeoutError:
-            await asyncio.sleep(2)
-            result = await has_inline_captcha(client, entity)
-    finally:
-        client.remove_event_handler(on_new_message, events.NewMessage)
-        if not future.done():
-            future.set_result(False)
-    return result
-
-async def process_join_groups(state: FSMContext, message: types.Message):
-    data = await state.get_data()
+            await event.message.click(0)
+        except Exception:
+            return
+        await self._found(event.chat_id)
+
+    async def _fallback(self, chat_id: int):
+        await asyncio.sleep(self.timeout)
+        item = self._pending.get(chat_id)
+        if item is None:
+            return
+        if await has_inline_captcha(self.client, item[1]):
+            await self._found(chat_id)
+        else:
+            self._pending.pop(chat_id, None)
+
+    async def close(self):
+        """Дождаться окон наблюдения (не дольше timeout) и снять хендлер — до возврата клиента в пул."""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=self.timeout + 10)
+        for t in list(self._tasks):
+            t.cancel()
+        if self._started:
+            self.client.remove_event_handler(self._on_message, events.NewMessage)
+            self._started = False
+        self._pending.clear()
+
+
+async def _give_back_or_fail(link_pool: WorkPool, link: str, acc_id: int, log_blocks: dict, task_id: int, err: str):
+    if not await link_pool.give_back(link):
+        insert_join_groups_log(task_id, acc_id, link, "fail", f"Ссылку не смогли обработать аккаунты. {err}")
+        log_blocks["fail"].append((link, f"Ссылку не смогли обработать аккаунты. {err}"))
+
+
+def _new_log_blocks() -> dict:
+    return {"no_captcha": [], "with_captcha": [], "requested": [], "fail": [], "account_error": None}
+
+
+# повтор продолжает с сохранённого прогресса (см. process_join_groups), поэтому задачу
+# после рестарта/падения процесса можно вернуть в очередь
+@task_queue.job("join_groups", concurrency=2, max_attempts=3)
+async def _run_join_groups_job(ctx: task_queue.JobContext):
+    await process_join_groups(ctx.bot, ctx.task_id, ctx.args)
+
+
+async def process_join_groups(bot, task_id: int, data: dict):
     selected_accounts = data["selected_accounts"]
     links  = data["links"]
     delay  = data["delay"]
-    task_id = data["task_id"]
 
     progress_message_id = data.get("progress_message_id")
-    chat_id = message.chat.id
-
-    accounts = [get_account_by_id(acc_id) for acc_id in selected_accounts if get_account_by_id(acc_id)]
-    n_acc = len(accounts)
-    n_grp = len(links)
-    per_account = n_grp // n_acc if n_acc else 0
-    extra = n_grp % n_acc if n_acc else 0
+    chat_id = data["chat_id"]
 
-    account_groups = []
-    idx = 0
-    for i, acc in enumerate(accounts):
-        count = per_account + (1 if i < extra else 0)
-        account_groups.append((acc, links[idx:idx+count]))
-        idx += count
+    accounts = [acc for acc in [await adb.get_account_by_id(acc_id) for acc_id in selected_accounts] if acc]
 
+    # повторный запуск (рестарт/падение процесса) продолжает с того же места: ссылки,
+    # по которым уже есть строка join_groups_log, не берём, а их итог кладём в отчёт
     summary = []
+    prior_blocks: dict[int, dict] = {}
+    done_links = set()
+    for acc_id, link, status, message in await adb.get_join_groups_progress(task_id):
+        blocks = prior_blocks.get(acc_id)
+        if blocks is None:
+            blocks = prior_blocks[acc_id] = _new_log_blocks()
+            summary.append((acc_id, blocks))
+        if status == "fail":
+            blocks["fail"].append((link, message))
+        elif status in blocks:
+            blocks[status].append(link)
+        done_links.add(link)
+
+    # общая очередь ссылок: свободный аккаунт берёт следующую, ссылки выбывших
+    # (заморожен/бан/долгий FloodWait) возвращаются в очередь остальным
+    link_pool = WorkPool([link for link in links if link not in done_links])
+    flood = get_flood_scheduler()
+    entities = get_entity_cache()
+
     remaining_groups = []
     start_time = time.time()
     frozen_account_ids = set()
     banned_account_ids = set()
 
+    # счётчики карточки — в памяти, в payload сбрасываются раз в TASK_PROGRESS_FLUSH_SEC и в конце
+    progress = ProgressTracker(task_id, column="payload")
+
     async def update_progress_card(running=True):
         success_joins = sum(len(blocks["no_captcha"]) for _, blocks in summary)
         captcha_joins = sum(len(blocks["with_captcha"]) for _, blocks in summary)
@@ -428,123 +505,134 @@ async def process_join_groups(state: FSMContext, message: types.Message):
         total_time = int(time.time() - start_time) // 60
         status = "🟡 В процессе" if running else "✅ Завершена"
 
-        payload = {
-            "total_accounts": len(accounts),
-            "total_groups": len(links),
-            "success_joins": success_joins,
-            "captcha_joins": captcha_joins,
-            "pending_joins": pending_joins,
-            "failed_joins": failed_joins,
-            "frozen_accounts": len(frozen_account_ids | banned_account_ids),
-            "avg_delay": delay,
-            "total_time": f"{total_time} мин",
-            "status": status,
-            "task_id": task_id
-        }
-        update_task_payload(task_id, payload)
+        await progress.update(
+            force=not running,
+            total_accounts=len(accounts),
+            total_groups=len(links),
+            success_joins=success_joins,
+            captcha_joins=captcha_joins,
+            pending_joins=pending_joins,
+            failed_joins=failed_joins,
+            frozen_accounts=len(frozen_account_ids | banned_account_ids),
+            avg_delay=delay,
+            total_time=f"{total_time} мин",
+            status=status,
+            task_id=task_id,
+        )
      
 
-    async def join_groups_for_account(curr_account, curr_links):
-        log_blocks = {"no_captcha": [], "with_captcha": [], "requested": [], "fail": []}
-        if not curr_account or not curr_links:
-            return (curr_account["id"] if curr_account else "-", log_blocks, curr_links)
+    async def join_groups_for_account(curr_account):
+        acc_id = curr_account["id"]
+        log_blocks = prior_blocks.get(acc_id)
+        if log_blocks is None:
+            log_blocks = _new_log_blocks()
+            summary.append((acc_id, log_blocks))
 
-        # запуск клиента
+        # аренда клиента из пула (другие задачи на этом аккаунте подождут)
+        lease = AsyncExitStack()
         try:
-            proxy = {
-                "proxy_host": curr_account.get("proxy_host"),
-                "proxy_port": curr_account.get("proxy_port"),
-                "proxy_username": curr_account.get("proxy_username"),
-                "proxy_password": curr_account.get("proxy_password"),
-            } if curr_account.get("proxy_host") else None
-            client = await get_client(curr_account["session_string"], proxy)
-            await client.start()
+            client = await lease.enter_async_context(lease_client(acc_id))
         except Exception as e:
-            for link in curr_links:
-                insert_join_groups_log(task_id, curr_account["id"], link, "fail", f"Ошибка запуска клиента/прокси: {e}")
-                log_blocks["fail"].append((link, f"Ошибка запуска клиента/прокси: {e}"))
-            return (curr_account["id"], log_blocks, curr_links)
+            # ссылок не брали — их разберут остальные аккаунты
+            log_blocks["account_error"] = f"Ошибка запуска клиента/прокси: {e}"
+            return
 
         # отметим бан из БД (если есть)
         if curr_account.get("status") in ("ban", "banned"):
-            banned_account_ids.add(curr_account["id"])
+            banned_account_ids.add(acc_id)
+
+        async def _on_captcha(link):
+            # вступление уже записано «без капчи» — переклассифицируем строку лога и счётчики
+            if link in log_blocks["no_captcha"]:
+                log_blocks["no_captcha"].remove(link)
+            log_blocks["with_captcha"].append(link)
+            # строка может ещё лежать в буфере sink'а (в т.ч. после неудачного flush) — правим там,
+            # иначе она уже в БД
+            where = {"task_id": task_id, "account_id": acc_id, "group_link": link, "status": "no_captcha"}
+            if await log_sink.amend("join_groups_log", where, status="with_captcha", message="Вступление с капчей"):
+                return
+            if not await adb.update_join_groups_log_status(task_id, acc_id, link, "no_captcha", "with_captcha", "Вступление с капчей"):
+                print(f"[JOIN] ⚠️ task {task_id}: строка лога для {link} не найдена, капча не записана", flush=True)
+
+        captcha = _CaptchaWatcher(client, _on_captcha, timeout=20)
+        captcha.start()
 
-        groups_left = list(curr_links)
         try:
-            skip_account = False
-            for link in curr_links:
-                max_attempts = 5
-                attempts = 0
-                while attempts < max_attempts:
-                    attempts += 1
-                    try:
-                        entity = await client.get_entity(link)
-                        await client(JoinChannelRequest(entity))
-                        # ждём возможную капчу
-                        if await wait_for_captcha_robust(client, entity, timeout=20):
-                            insert_join_groups_log(task_id, curr_account["id"], link, "with_captcha", "Вступление с капчей")
-                            log_blocks["with_captcha"].append(link)
-                        else:
-                            insert_join_groups_log(task_id, curr_account["id"], link, "no_captcha", "Вступление без капчи")
-                            log_blocks["no_captcha"].append(link)
-                        groups_left.remove(link)
-                        break
-                    except FloodWaitError as e:
-                        await asyncio.sleep(e.seconds + delay)
-                    except Exception as e:
-                        err = str(e).lower()
-                        if (
-                            "no user has" in err
-                            or "the user is deleted" in err
-                            or "the user has been deleted" in err
-                            or "user deactivated" in err
-                            or "user not found" in err
-                            or ("not found" in err and "username" in err)
-                        ):
-                            frozen_account_ids.add(curr_account["id"])
-                            for l in groups_left:
-                                insert_join_groups_log(task_id, curr_account["id"], l, "fail", f"Аккаунт заморожен/удалён. {err}")
-                                log_blocks["fail"].append((l, f"Аккаунт заморожен/удалён. {err}"))
-                            skip_account = True
-                            break
-                        elif "banned" in err or "ban" in err:
-                            banned_account_ids.add(curr_account["id"])
-                            for l in groups_left:
-                                insert_join_groups_log(task_id, curr_account["id"], l, "fail", f"Аккаунт забанен. {err}")
-                                log_blocks["fail"].append((l, f"Аккаунт забанен. {err}"))
-                            skip_account = True
-                            break
-                        if "successfully requested to join this chat" in err:
-                            insert_join_groups_log(
-                                task_id, curr_account["id"], link, "requested",
-                                "Заявка на вступление подана, требуется одобрение администратора."
-                            )
-                            log_blocks["requested"].append(link)
-                        else:
-                            insert_join_groups_log(task_id, curr_account["id"], link, "fail", f"Ошибка вступления: {e}")
-                            log_blocks["fail"].append((link, f"Ошибка вступления: {e}"))
-                        groups_left.remove(link)
-                        break
-                else:
-                    insert_join_groups_log(task_id, curr_account["id"], link, "fail", "Превышено число попыток (FloodWait)")
-                    log_blocks["fail"].append((link, "Превышено число попыток (FloodWait)"))
+            while True:
+                link = await link_pool.take(acc_id)
+                if link is None:
+                    return
+
+                entity = None
+                try:
+                    entity = await entities.resolve(client, link, acc_id)
+                    await client(JoinChannelRequest(entity))
+                    # капчу ловит фоновый watcher — следующую ссылку не ждём
+                    insert_join_groups_log(task_id, acc_id, link, "no_captcha", "Вступление без капчи")
+                    log_blocks["no_captcha"].append(link)
+                    captcha.watch(entity, link)
+                    await link_pool.done(link)
+                except FloodWaitError as e:
+                    # короткие FloodWait планировщик отлежал сам. Ссылка не виновата — попытку
+                    # не считаем; под долгим FloodWait аккаунт выходит, остальное разберут другие
+                    stays = flood.remaining(acc_id) <= flood.sleep_threshold
+                    await link_pool.give_back(link, acc_id, exclude=stays, count=False)
+                    if not stays:
+                        log_blocks["account_error"] = f"FloodWait {e.seconds}s — аккаунт остановлен, ссылки переданы другим"
+                        return
+                    continue
+                except (ChannelInvalidError, PeerIdInvalidError) as e:
+                    # закешированный access_hash протух — сбросим, ссылку перерезолвят заново
+                    if entity is not None:
+                        await entities.forget(acc_id, entity)
+                    if not await link_pool.give_back(link):
+                        insert_join_groups_log(task_id, acc_id, link, "fail", f"Ошибка вступления: {e}")
+                        log_blocks["fail"].append((link, f"Ошибка вступления: {e}"))
+                    continue
+                except Exception as e:
+                    err = str(e).lower()
+                    if (
+                        "no user has" in err
+                        or "the user is deleted" in err
+                        or "the user has been deleted" in err
+                        or "user deactivated" in err
+                        or "user not found" in err
+                        or ("not found" in err and "username" in err)
+                    ):
+                        frozen_account_ids.add(acc_id)
+                        log_blocks["account_error"] = f"Аккаунт заморожен/удалён. {err}"
+                        await _give_back_or_fail(link_pool, link, acc_id, log_blocks, task_id, err)
+                        return
+                    elif "banned" in err or "ban" in err:
+                        banned_account_ids.add(acc_id)
+                        log_blocks["account_error"] = f"Аккаунт забанен. {err}"
+                        await _give_back_or_fail(link_pool, link, acc_id, log_blocks, task_id, err)
+                        return
+                    if "successfully requested to join this chat" in err:
+                        insert_join_groups_log(
+                            task_id, acc_id, link, "requested",
+                            "Заявка на вступление подана, требуется одобрение администратора."
+                        )
+                        log_blocks["requested"].append(link)
+                    else:
+                        insert_join_groups_log(task_id, acc_id, link, "fail", f"Ошибка вступления: {e}")
+                        log_blocks["fail"].append((link, f"Ошибка вступления: {e}"))
+                    await link_pool.done(link)
 
                 await update_progress_card(running=True)
                 await asyncio.sleep(delay)
-
-            return (curr_account["id"], log_blocks, groups_left)
         finally:
-            try: await client.disconnect()
-            except Exception: pass
+            try:
+                await captcha.close()
+            finally:
+                await lease.aclose()
 
-    tasks = [join_groups_for_account(acc, grps) for acc, grps in account_groups if acc and grps]
-    results = await asyncio.gather(*tasks)
-    for acc_id, blocks, not_done in results:
-        summary.append((acc_id, blocks))
-        if not_done:
-            remaining_groups.extend(not_done)
+    await asyncio.gather(*(join_groups_for_account(acc) for acc in accounts))
+    # что осталось в очереди — не хватило живых аккаунтов
+    remaining_groups.extend(link_pool.leftover())
 
     await update_progress_card(running=False)
+    await log_sink.flush()
 
     # Итоговый лог
     lines = []
@@ -560,6 +648,8 @@ async def process_join_groups(state: FSMContext, message: types.Message):
         lines.append(f"Забанены: {', '.join(map(str, sorted(banned_account_ids)))}")
     for acc_id, blocks in summary:
         lines.append(f"\n<b>Аккаунт ID {acc_id}</b>:\n")
+        if blocks["account_error"]:
+            lines.append(f"⚠️ {blocks['account_error']}")
         if blocks["no_captcha"]:
             lines.append("✅ Без капчи:\n" + "\n".join(blocks["no_captcha"]))
         if blocks["with_captcha"]:
@@ -573,8 +663,7 @@ async def process_join_groups(state: FSMContext, message: types.Message):
         lines += remaining_groups
 
     buf = BufferedInputFile("\n".join(lines).encode("utf-8"), filename="join_groups_log.txt")
-    await message.answer_document(buf, caption="Лог задачи", reply_markup=join_groups_log_keyboard())
-    await state.clear()
+    await bot.send_document(chat_id, buf, caption="Лог задачи", reply_markup=join_groups_log_keyboard())
 
 
 @router.callback_query(F.data.startswith("join_refresh_"))
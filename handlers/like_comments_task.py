@@ -1,6 +1,8 @@
 from aiogram import Router, types, F
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile
 from app.db import (
     insert_like_log,
@@ -14,8 +16,9 @@ import asyncio, json, time, random, os, re
 from utils.like_worker import start_carousel_worker, stop_carousel_worker
 from utils.comment_reactor import run_like_job  # исполнитель
 from .tasks_view import render_like_task
+from app import task_queue
 from typing import List, Dict, Any
-from app.db import get_account_groups_with_count
+from app.db import get_account_groups_with_count, forget_like_index
 
 
 
@@ -760,6 +763,47 @@ async def _create_like_task_and_show_card(msg_or_cb: types.Message | types.Callb
 
 
 
+# task_id -> наблюдатель карусели: ждёт её цикл и выгружает индекс «уже лайкнуто»
+_LIKE_LOOPS: dict[int, asyncio.Task] = {}
+
+
+def _start_like_loop(task_id: int, state: FSMContext, interval: int) -> None:
+    """
+    Старт карусели. start_carousel_worker создаёт цикл синхронно — его task берём
+    по разнице asyncio.all_tasks() и держим наблюдателя, который по завершении цикла
+    выгружает индекс (db.forget_like_index) в процессе, где карусель крутилась.
+    """
+    before = asyncio.all_tasks()
+    start_carousel_worker(task_id, state, interval)
+    started = asyncio.all_tasks() - before
+    if not started:
+        return  # карусель уже крутится — наблюдатель у неё есть
+    _LIKE_LOOPS[task_id] = asyncio.create_task(_watch_like_loop(task_id, started))
+
+
+async def _watch_like_loop(task_id: int, loop_tasks: set[asyncio.Task]) -> None:
+    try:
+        await asyncio.wait(loop_tasks)
+    finally:
+        if _LIKE_LOOPS.get(task_id) is asyncio.current_task():
+            del _LIKE_LOOPS[task_id]
+        forget_like_index(task_id)
+
+
+@task_queue.job("like_comments", concurrency=2)
+async def _run_like_once_job(ctx: task_queue.JobContext):
+    # run_like_job читает настройки из FSMContext — восстанавливаем его из снимка
+    storage = MemoryStorage()
+    key = StorageKey(bot_id=ctx.bot.id, chat_id=ctx.args["chat_id"], user_id=ctx.args["user_id"])
+    fsm = FSMContext(storage=storage, key=key)
+    await fsm.set_data(ctx.args.get("state") or {})
+    try:
+        await run_like_job(fsm, mode="once")
+    finally:
+        await storage.close()
+        forget_like_index(ctx.task_id)  # индекс «уже лайкнуто» задачи больше не нужен
+
+
 @router.callback_query(F.data.startswith("like_start_"))
 async def like_start(cb: types.CallbackQuery, state: FSMContext):
     task_id = int(cb.data.split("_")[-1])
@@ -776,10 +820,14 @@ async def like_start(cb: types.CallbackQuery, state: FSMContext):
 
     if mode == "loop":
         # стартуем карусель через воркер (он сам не допустит дубликатов)
-        start_carousel_worker(task_id, state, poll_interval_sec or 300)
+        _start_like_loop(task_id, state, poll_interval_sec or 300)
     else:
-        # разовый прогон — как и раньше
-        asyncio.create_task(run_like_job(state, mode="once"))
+        # разовый прогон — через очередь воркеров, со снимком FSM-данных
+        await task_queue.submit(task_id, "like_comments", {
+            "chat_id": cb.message.chat.id,
+            "user_id": cb.from_user.id,
+            "state": json.loads(json.dumps(data, default=str)),
+        }, shard_key=task_queue.shard_key_for(data.get("selected_accounts")))
 
     # подчистить тост и перерисовать карточку
     async def _after():
@@ -806,7 +854,7 @@ async def like_loop_start(cb: types.CallbackQuery, state: FSMContext):
     interval = int(settings.get("watch", {}).get("poll_interval_sec", 300))
 
     # стартуем воркер
-    start_carousel_worker(task_id, state, interval)
+    _start_like_loop(task_id, state, interval)
     await cb.answer("🔁 Карусель запущена.")
     # тут можешь обновить карточку / статус
     # await render_like_task(cb.message, task_id)
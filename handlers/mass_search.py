@@ -1,13 +1,21 @@
 import os, time, asyncio, random
 import random as _random
+from contextlib import AsyncExitStack
 from .mass_search_view import send_task_card
-from app.telegram_client import get_client
+from app.telegram_client import lease_client
+from app.utils.work_pool import WorkPool
+from app.flood_scheduler import get_flood_scheduler
+from app.group_metadata import record_search_results
+from app.db_async import run as run_db
+from app.progress import ProgressTracker
+from telethon.errors import FloodWaitError
+from config import MASS_SEARCH_KEY_RETRIES, MASS_SEARCH_CACHE_TTL_SEC
 from collections import defaultdict
 from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
-from app.db import get_all_accounts, save_group_result, get_group_results_by_task
-from app.telegram_client import get_client
+from app.db import get_accounts_for_picker, get_accounts_connect_view, save_group_result, get_group_results_by_task
+from app.telegram_client import lease_client
 from utils.search_groups import search_public_groups
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
@@ -22,10 +30,11 @@ from app.db import (
     log_task_event,
     create_task_entry,
     save_task_result,
-    update_task_progress,
     update_task_status,
     get_account_groups_with_count,
     get_account_by_id,
+    get_cached_searches,
+    save_search_cache,
 )
 
 
@@ -40,6 +49,19 @@ PER_PAGE   = 10
 
 TEMP_DIR = os.getenv("TMPDIR", "/tmp")
 
+
+def _keyword_key(keyword: str) -> str:
+    """Ключ кеша поиска: регистр и лишние пробелы не важны."""
+    return " ".join(keyword.lower().split())
+
+
+def _search_cache_kb(use_cache: bool) -> InlineKeyboardMarkup:
+    text = "♻️ Кеш поиска: вкл" if use_cache else "🔄 Кеш поиска: выкл (искать заново)"
+    return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=text, callback_data="ms_toggle_cache")]])
+
+
+_DELAY_ACCOUNTS_PROMPT = "⏱️ Пришли задержку между аккаунтами (например, 2-5 секунд):"
+
 async def _read_txt_lines(path: str) -> list[str]:
     def _read():
         out = []
@@ -112,7 +134,7 @@ def mass_accounts_keyboard(
 
 @router.callback_query(F.data == "mass_search")
 async def start_mass_search_task_callback(callback: types.CallbackQuery, state: FSMContext):
-    accounts = get_all_accounts() or []
+    accounts = get_accounts_for_picker() or []   # для клавиатуры хватает лёгкой проекции
     groups   = get_account_groups_with_count() or []
 
     # чистим и готовим FSM
@@ -352,22 +374,35 @@ async def mass_search_receive_min_members(message: types.Message, state: FSMCont
     # Получаем id сообщения бота и обновляем его
     data = await state.get_data()
     bot_msg_id = data.get("bot_msg_id")
+    use_cache = data.get("use_search_cache", True)
     if bot_msg_id:
         try:
             await message.bot.edit_message_text(
                 chat_id=message.chat.id,
                 message_id=bot_msg_id,
-                text="⏱️ Пришли задержку между аккаунтами (например, 2-5 секунд):"
+                text=_DELAY_ACCOUNTS_PROMPT,
+                reply_markup=_search_cache_kb(use_cache),
             )
         except Exception as e:
             print(f"[WARN] Не удалось отредактировать сообщение бота: {e}")
     else:
-        new_msg = await message.answer("⏱️ Пришли задержку между аккаунтами (например, 2-5 секунд):")
+        new_msg = await message.answer(_DELAY_ACCOUNTS_PROMPT, reply_markup=_search_cache_kb(use_cache))
         await state.update_data(bot_msg_id=new_msg.message_id)
 
     await state.set_state(MassSearchStates.waiting_for_delay_between_accounts)
 
 
+# Кеш поиска: вкл — ключи, которые искали за последние MASS_SEARCH_CACHE_TTL_SEC, берутся из кеша;
+# выкл — все ключи ищутся заново (результаты обновят кеш)
+@router.callback_query(F.data == "ms_toggle_cache", MassSearchStates.waiting_for_delay_between_accounts)
+async def ms_toggle_cache(callback: types.CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    use_cache = not data.get("use_search_cache", True)
+    await state.update_data(use_search_cache=use_cache)
+    await _safe_edit_markup(callback.message, _search_cache_kb(use_cache))
+    await callback.answer("Кеш поиска включён" if use_cache else "Все ключи будут найдены заново")
+
+
 # 3. Задержка между аккаунтами
 @router.message(MassSearchStates.waiting_for_delay_between_accounts)
 async def mass_search_receive_delay_accounts(message: types.Message, state: FSMContext):
@@ -427,6 +462,7 @@ async def mass_search_receive_delay_queries(message: types.Message, state: FSMCo
     min_members = data.get("min_members", 100_000)
     delay_between_accounts = data.get("delay_between_accounts", (2, 5))
     delay_between_queries = data.get("delay_between_queries", (5, 10))
+    use_cache = data.get("use_search_cache", True)
 
     user_id = message.from_user.id
     params = {
@@ -434,6 +470,7 @@ async def mass_search_receive_delay_queries(message: types.Message, state: FSMCo
         "min_members": min_members,
         "delay_between_accounts": delay_between_accounts,
         "delay_between_queries": delay_between_queries,
+        "use_search_cache": use_cache,
     }
     task_id = create_task_entry(
         task_type="mass_group_search",
@@ -484,10 +521,8 @@ async def mass_search_receive_delay_queries(message: types.Message, state: FSMCo
         await message.answer("⚠️ Не выбраны аккаунты для поиска.")
         return
 
-    # возьмём полные записи аккаунтов
-    all_accounts = data2.get("ms_accounts") or data2.get("crch_accounts") or get_all_accounts()
-    acc_by_id = {int(a["id"]): a for a in all_accounts}
-    accounts = [acc_by_id[i] for i in map(int, selected_ids) if i in acc_by_id]
+    # для запуска нужны session + прокси — берём только выбранные аккаунты
+    accounts = get_accounts_connect_view(list(map(int, selected_ids)))
 
     if not accounts:
         update_task_status(task_id, "error", "Не удалось собрать аккаунты")
@@ -499,39 +534,65 @@ async def mass_search_receive_delay_queries(message: types.Message, state: FSMCo
 
     _random.shuffle(accounts)
 
-    acc_count = len(accounts)
-    key_map = {a["id"]: [] for a in accounts}
-    for idx, kw in enumerate(keywords):
-        a = accounts[idx % acc_count]
-        key_map[a["id"]].append(kw)
-
-    account_dict = {a["id"]: a for a in accounts}
-    
     # ----------- Прогресс ----------
     counters = {"processed": 0, "found": 0}
     total_keywords = len(keywords)
+    progress = ProgressTracker(task_id, column="progress")
+
+    async def report_progress(force=False):
+        # tasks.progress пишется не на каждый ключ, а раз в TASK_PROGRESS_FLUSH_SEC
+        await progress.update(
+            force=force,
+            processed_keywords=counters["processed"],
+            total_keywords=total_keywords,
+            groups_found=counters["found"],
+        )
+
+    # ключи, которые уже искали недавно, берём из кеша — аккаунты на них запросы не тратят
+    cached = {}
+    if use_cache:
+        try:
+            cached = await run_db(get_cached_searches, list({_keyword_key(k) for k in keywords}), MASS_SEARCH_CACHE_TTL_SEC)
+        except Exception as e:
+            print(f"[MASS_SEARCH] search cache lookup failed: {e}", flush=True)
+    to_search = []
+    for key in keywords:
+        groups = cached.get(_keyword_key(key))
+        if groups is None:
+            to_search.append(key)
+            continue
+        for group in groups:
+            save_group_result(task_id, user_id, None, key, group)
+        counters["processed"] += 1
+        counters["found"] += len(groups)
+    if cached:
+        log_task_event(task_id, f"Из кеша поиска: {total_keywords - len(to_search)} ключей, аккаунтами: {len(to_search)}", status="info")
+        await report_progress()
+
+    # общая очередь ключей: каждый аккаунт берёт следующий; ключ, на котором аккаунт
+    # упал, уходит другому аккаунту (этому — уже нет), а не теряется вместе с ним
+    key_pool = WorkPool(to_search, max_returns=MASS_SEARCH_KEY_RETRIES)
+    flood = get_flood_scheduler()
+    failed_keys = []
 
     async def run_account_search(acc):
-        
         acc_id = acc["id"]
-        if not key_map[acc_id]:
+        acc_name = acc.get("username") or acc.get("phone")
+
+        lease = AsyncExitStack()
+        try:
+            client = await lease.enter_async_context(lease_client(acc_id))
+        except Exception as e:
+            # ключей ещё не брали — их разберут остальные аккаунты
+            log_task_event(task_id, f"Акт. {acc_name} не подключился: {e}", status="warning", account_id=acc_id)
             return
-        log_task_event(task_id, f"Акт. {acc['username'] or acc['phone']} ищет: {', '.join(key_map[acc_id])}", status="info", account_id=acc_id)
-        
-        
-        proxy = None
-        if acc.get("proxy_host"):
-            proxy = {
-                "proxy_host": acc.get("proxy_host"),
-                "proxy_port": acc.get("proxy_port"),
-                "proxy_username": acc.get("proxy_username"),
-                "proxy_password": acc.get("proxy_password"),
-            }
-        client = await get_client(acc["session_string"], proxy)
-                
+        log_task_event(task_id, f"Акт. {acc_name} подключён к поиску", status="info", account_id=acc_id)
+
         try:
-            await client.connect()
-            for key in key_map[acc_id]:
+            while True:
+                key = await key_pool.take(acc_id)
+                if key is None:
+                    return
                 delay = random.uniform(*delay_between_queries)
                 await asyncio.sleep(delay)
                 try:
@@ -548,30 +609,60 @@ async def mass_search_receive_delay_queries(message: types.Message, state: FSMCo
                     ]
                     for group in found:
                         save_group_result(task_id, user_id, acc_id, key, group)
+                    try:
+                        await run_db(save_search_cache, _keyword_key(key), key, found)
+                        await record_search_results(found)  # → group_metadata для check-groups
+                    except Exception as e:
+                        print(f"[MASS_SEARCH] search cache update failed: {e}", flush=True)
                     log_task_event(task_id, f"Ключ '{key}': найдено {len(found)} групп", status="info", account_id=acc_id)
                     counters["found"] += len(found)
 
+                except FloodWaitError as e:
+                    # FloodWait — не ошибка ключа: возврат не тратит MASS_SEARCH_KEY_RETRIES.
+                    # Под долгим дедлайном аккаунт выходит из поиска, ключи разбирают остальные
+                    log_task_event(task_id, f"Акт. {acc_name}: FloodWait {e.seconds}s, ключ '{key}' возвращён в очередь", status="warning", account_id=acc_id)
+                    stays = flood.remaining(acc_id) <= flood.sleep_threshold
+                    await key_pool.give_back(key, acc_id, exclude=stays, count=False)
+                    if not stays:
+                        log_task_event(task_id, f"Акт. {acc_name} остановлен до конца FloodWait", status="warning", account_id=acc_id)
+                        return
+                    continue
+
                 except Exception as e:
                     error_text = str(e)
-                    log_task_event(task_id, f"Ошибка поиска по '{key}' у {acc.get('username') or acc.get('phone')}: {error_text}", status="error", account_id=acc_id)
-                    await message.answer(f"❌ Ошибка поиска по '{key}' у {acc.get('username') or acc.get('phone')}: {error_text}")
+                    log_task_event(task_id, f"Ошибка поиска по '{key}' у {acc_name}: {error_text}", status="error", account_id=acc_id)
+                    await message.answer(f"❌ Ошибка поиска по '{key}' у {acc_name}: {error_text}")
                     update_account_status(acc_id, "Ошибка")
-                    log_task_event(task_id, f"Акт. {acc.get('username') or acc.get('phone')} исключён из-за ошибки", status="warning", account_id=acc_id)
-                    counters["processed"] += 1
-                    update_task_progress(task_id, counters["processed"], total_keywords, counters["found"])
-                    update_task_status(task_id, "error", error_text)
+                    log_task_event(task_id, f"Акт. {acc_name} исключён из-за ошибки", status="warning", account_id=acc_id)
+                    if await key_pool.give_back(key, acc_id, exclude=True):
+                        log_task_event(task_id, f"Ключ '{key}' передан другому аккаунту", status="info")
+                    else:
+                        failed_keys.append(key)
+                        counters["processed"] += 1
+                        await report_progress()
                     return
 
-                
+                await key_pool.done(key)
                 counters["processed"] += 1
-                update_task_progress(task_id, counters["processed"], total_keywords, counters["found"])
+                await report_progress()
 
         finally:
-            await client.disconnect()
+            await lease.aclose()  # клиент возвращается в пул
 
-    # Собираем все задачи и ждём их завершения
-    tasks = [run_account_search(acc) for acc in accounts if key_map[acc["id"]]]
-    await asyncio.gather(*tasks)
+    # Пул воркеров-аккаунтов разбирает очередь ключей (если всё нашлось в кеше — не подключаемся вовсе)
+    if to_search:
+        await asyncio.gather(*(run_account_search(acc) for acc in accounts))
+
+    await report_progress(force=True)
+
+    # ключи, которые некому было доделать (все аккаунты выбыли)
+    failed_keys.extend(key_pool.leftover())
+    if failed_keys:
+        log_task_event(task_id, f"Не обработаны ключи: {', '.join(failed_keys)}", status="warning")
+        if len(failed_keys) == total_keywords:
+            update_task_status(task_id, "error", "Ни один ключ не обработан")
+            await message.answer("❌ Ни один ключ не обработан: все аккаунты выбыли с ошибками.")
+            return
 
     log_task_event(task_id, "Поиск завершён, формирую файл...", status="success")
 
@@ -1,5 +1,6 @@
 # handlers/proxies.py
 import os
+import time
 from aiogram.types import FSInputFile,InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.exceptions import TelegramBadRequest
 from aiogram import Router, types, F
@@ -12,6 +13,7 @@ from app.db import (
     save_proxy,
     get_all_proxies,
     update_proxy_status_by_id,
+    record_proxy_checks_bulk,
     delete_proxy_by_id,
     delete_bad_proxies,
     get_proxy_by_id,
@@ -19,7 +21,13 @@ from app.db import (
     get_all_accounts,
     get_proxy_by_id,
 )
-from app.utils.proxy_checker import is_proxy_working
+from app.utils.proxy_checker import is_proxy_working, check_proxy_detailed, check_proxies_concurrently
+from app.utils.proxy_assign import ProxyAssigner, format_latency
+from app.telegram_client import retire_account_client
+from config import (
+    PROXY_CHECK_CONCURRENCY, PROXY_RAW_TIMEOUT, PROXY_RPC_TIMEOUT, PROXY_PROGRESS_INTERVAL,
+    PROXY_LATENCY_ALPHA,
+)
 from keyboards.back_to_proxies_menu import back_to_proxies_menu_keyboard
 
 
@@ -221,13 +229,15 @@ async def check_single_proxy(callback: types.CallbackQuery):
         "password": proxy.get("password")
     }
 
-    is_ok = await is_proxy_working(proxy_conf)
+    is_ok, _, probe = await check_proxy_detailed(proxy_conf, None, PROXY_RAW_TIMEOUT, PROXY_RPC_TIMEOUT)
+    record_proxy_checks_bulk(
+        [(proxy_id, is_ok, probe and probe.connect_ms, probe and probe.handshake_ms)],
+        alpha=PROXY_LATENCY_ALPHA,
+    )
 
     if is_ok:
-        update_proxy_status_by_id(proxy_id, "working")
         await callback.answer("✅ Прокси рабочий!", show_alert=True)
     else:
-        update_proxy_status_by_id(proxy_id, "bad")
         await callback.answer("❌ Прокси не работает!", show_alert=True)
 
     await view_proxies(callback)
@@ -265,34 +275,53 @@ async def check_all_proxies(callback: types.CallbackQuery):
     checked = 0
     working = 0
     bad = 0
+    last_edit = time.monotonic()
+
+    # прогресс: правим сообщение не чаще раза в PROXY_PROGRESS_INTERVAL сек
+    async def _on_result(done, total, ok, info, proxy):
+        nonlocal last_edit
+        now = time.monotonic()
+        if done < total and now - last_edit < PROXY_PROGRESS_INTERVAL:
+            return
+        last_edit = now
+        try:
+            await callback.message.edit_text(
+                f"🔄 Идёт проверка всех прокси...\n\nПроверено: {done}/{total}",
+                reply_markup=None
+            )
+        except TelegramBadRequest:
+            pass
+
+    results = await check_proxies_concurrently(
+        proxies,
+        concurrency=PROXY_CHECK_CONCURRENCY,
+        raw_timeout=PROXY_RAW_TIMEOUT,
+        rpc_timeout=PROXY_RPC_TIMEOUT,
+        on_result=_on_result,
+    )
 
-    for proxy in proxies:
-        proxy_conf = {
-            "type": "socks5",
-            "host": proxy["host"],
-            "port": proxy["port"],
-            "username": proxy.get("username"),
-            "password": proxy.get("password")
-        }
-
-        is_ok = await is_proxy_working(proxy_conf)
-
+    checks = []
+    for is_ok, info, proxy, probe in results:
+        connect_ms = probe.connect_ms if probe else None
+        handshake_ms = probe.handshake_ms if probe else None
+        checks.append((proxy["id"], is_ok, connect_ms, handshake_ms))
         if is_ok:
-            update_proxy_status_by_id(proxy["id"], "working")
             working += 1
             status_emoji = "✅"
-            status_text = "Рабочий"
+            status_text = f"Рабочий ({(connect_ms or 0) + (handshake_ms or 0):.0f}ms)"
         else:
-            update_proxy_status_by_id(proxy["id"], "bad")
             bad += 1
             status_emoji = "❌"
-            status_text = "Нерабочий"
+            status_text = f"Нерабочий ({info})" if info else "Нерабочий"
 
         checked += 1
 
         proxy_label = f"{proxy['host']}:{proxy['port']}"
         log_lines.append(f"{status_emoji} {proxy_label} - {status_text}")
 
+    # один UPDATE на все прокси: статус + задержки + счётчики успехов
+    record_proxy_checks_bulk(checks, alpha=PROXY_LATENCY_ALPHA)
+
     # Добавляем итог в лог
     log_lines.append("")
     log_lines.append(f"Итог:\n✅ Рабочих: {working}\n❌ Плохих: {bad}\nВсего проверено: {checked}")
@@ -397,16 +426,52 @@ async def check_single_proxy(callback: types.CallbackQuery):
         "password": proxy.get("password"),
     }
 
-    is_working = await is_proxy_working(proxy_conf)
+    is_working, _, probe = await check_proxy_detailed(proxy_conf, None, PROXY_RAW_TIMEOUT, PROXY_RPC_TIMEOUT)
 
-    # 👉 Здесь обновляем статус в базе!
+    # 👉 Здесь обновляем статус и статистику задержек в базе!
+    record_proxy_checks_bulk(
+        [(proxy_id, is_working, probe and probe.connect_ms, probe and probe.handshake_ms)],
+        alpha=PROXY_LATENCY_ALPHA,
+    )
     if is_working:
-        update_proxy_status_by_id(proxy_id, "working")
         await callback.answer("✅ Прокси работает!", show_alert=True)
     else:
-        update_proxy_status_by_id(proxy_id, "bad")
         await callback.answer("❌ Прокси не работает!", show_alert=True)
 
+@router.callback_query(F.data == "auto_rebind_proxies")
+@admin_only
+async def auto_rebind_proxies(callback: types.CallbackQuery):
+    """
+    Проходит по всем аккаунтам и переносит каждый на самый быстрый здоровый
+    прокси, на котором меньше PROXY_ACCOUNTS_CAP аккаунтов.
+    """
+    assigner = await ProxyAssigner.create()
+    if not assigner.ranked:
+        await callback.answer("⚠️ Нет здоровых прокси с замерами. Сначала «Проверить все».", show_alert=True)
+        return
+
+    await callback.message.edit_text("⚡ Перепривязываем аккаунты к быстрым прокси...", reply_markup=None)
+
+    moved = []
+    accounts = get_all_accounts()
+    for account in sorted(accounts, key=lambda a: a["id"]):
+        if account.get("status") in ("banned", "deleted"):
+            continue
+        proxy = await assigner.assign(account)
+        if proxy is None:
+            continue
+        moved.append(f"#{account['id']} → {proxy['host']}:{proxy['port']} · {format_latency(proxy)}")
+        # клиент в аренде у задачи доработает на старом прокси и пересоздастся, когда его вернут
+        await retire_account_client(account["id"])
+
+    summary = [f"⚡ Перепривязано аккаунтов: {len(moved)} (лимит {assigner.cap} акк. на прокси)"]
+    summary.extend(moved[:30])
+    if len(moved) > 30:
+        summary.append(f"… и ещё {len(moved) - 30}")
+
+    await callback.message.edit_text("\n".join(summary), reply_markup=proxy_list_keyboard(get_all_proxies()))
+    await callback.answer()
+
 @router.callback_query(F.data == "delete_log_message")
 @admin_only
 async def delete_log_message(callback: types.CallbackQuery):
@@ -15,10 +15,24 @@ from utils.check_access import admin_only
 from app.db import get_all_accounts, get_connection, get_account_groups_with_count
 from utils.reauthorize_accounts import run_reauth_task
 from app.db import get_available_api_key, increment_api_key_usage
+from app import db_async as adb
+from app import task_queue
 
 router = Router()
 log = logging.getLogger("reauth_handlers")
 
+
+@task_queue.job("reauthorize_accounts", concurrency=1)
+async def _run_reauth_job(ctx: task_queue.JobContext):
+    payload = dict(ctx.task.get("payload") or {})
+    payload["task_id"] = ctx.task_id
+    # в job_args — только id ключа: api_hash не должен лежать в tasks открытым текстом
+    api_key_id = ctx.args.get("api_key_id")
+    api_key = await adb.get_api_key_by_id(api_key_id) if api_key_id else None
+    if not api_key:
+        raise RuntimeError(f"API-ключ #{api_key_id} не найден — запустите задачу заново")
+    await run_reauth_task(api_key["api_id"], api_key["api_hash"], payload, logger=log, task_id=ctx.task_id)
+
 # ==========================
 # FSM
 # ==========================
@@ -376,10 +390,9 @@ async def reauth_start(call: types.CallbackQuery, state: FSMContext):
     task_id = _create_task_in_db(payload)
     payload["task_id"] = task_id
 
-    # Запускаем асинхронно выполнение
-    asyncio.create_task(
-        run_reauth_task(api_key["api_id"], api_key["api_hash"], payload, logger=log, task_id=task_id)
-    )
+    # Ставим выполнение в очередь воркеров (payload уже лежит в tasks)
+    await task_queue.submit(task_id, "reauthorize_accounts", {"api_key_id": api_key["id"]},
+                            shard_key=task_queue.shard_key_for(acc_ids))
 
     # Карточка-уведомление
     txt = (
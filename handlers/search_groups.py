@@ -1,6 +1,6 @@
 from aiogram import Router, types
 from aiogram.filters import Command
-from app.telegram_client import get_client  # твой способ получения Telethon-клиента
+from app.telegram_client import lease_client  # клиент аккаунта из общего пула
 from utils.search_groups import search_public_groups
 
 router = Router()
@@ -21,14 +21,9 @@ async def cmd_search_groups(message: types.Message):
         return
     account = accounts[0]
 
-    # Подключаемся через Telethon
-    client = await get_client(account["session_string"])
-
-    await client.connect()
-    try:
+    # Арендуем клиент аккаунта из пула
+    async with lease_client(account["id"]) as client:
         results = await search_public_groups(client, args, limit=20)
-    finally:
-        await client.disconnect()
 
     if not results:
         await message.answer("❌ Ничего не найдено.")
@@ -131,10 +131,10 @@ async def open_accounts(callback: types.CallbackQuery):
 @router.callback_query(F.data == "accounts_list")
 @admin_only
 async def show_accounts_list(callback: types.CallbackQuery):
-    from app.db import get_all_accounts  # функция получения всех аккаунтов
-    from keyboards.accounts_list import accounts_list_keyboard
+    from keyboards.accounts_list import accounts_list_keyboard, load_accounts_page
 
-    accounts = get_all_accounts()
+    # первая страница (keyset по id) + общее количество
+    accounts, page, total = load_accounts_page()
 
     if not accounts:
         await callback.message.edit_text(
@@ -145,12 +145,12 @@ async def show_accounts_list(callback: types.CallbackQuery):
         return
 
     text = "📋 Список аккаунтов:\n\n"
-    text += f"Всего аккаунтов: {len(accounts)}\n\n"
+    text += f"Всего аккаунтов: {total}\n\n"
     text += "Нажмите на аккаунт для подробностей."
 
     await callback.message.edit_text(
         text,
-        reply_markup=accounts_list_keyboard(accounts)
+        reply_markup=accounts_list_keyboard(accounts, page=page, total=total)
     )
     await callback.answer()
 
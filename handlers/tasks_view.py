@@ -20,6 +20,7 @@ from app.db import (
     get_join_group_task_by_id,
     get_task_summary,
     get_join_groups_logs,
+    get_task_counters,
     delete_task_from_db,
     get_twofa_tasks,
     read_twofa_task,
@@ -110,19 +111,9 @@ async def render_like_task(message: types.Message, task_id: int):
     task_data = {**task, **payload}
     
 
-    # агрегаты из логов
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT
-            COALESCE(SUM(CASE WHEN status='ok'   THEN 1 END), 0) AS likes_done,
-            COALESCE(SUM(CASE WHEN status='skip' THEN 1 END), 0) AS skipped,
-            COALESCE(SUM(CASE WHEN status='fail' THEN 1 END), 0) AS errors
-        FROM like_comments_log
-        WHERE task_id = %s
-    """, (task_id,))
-    likes_done, skipped, errors = cur.fetchone() or (0, 0, 0)
-    cur.close(); conn.close()
+    # агрегаты из логов (task_counters ведут триггеры — без прохода по like_comments_log)
+    counters = get_task_counters(task_id, "like")
+    likes_done, skipped, errors = counters.get("ok", 0), counters.get("skip", 0), counters.get("fail", 0)
 
     # подмешиваем
     task_data["likes_done"] = task_data.get("likes_done") or likes_done
@@ -843,18 +834,8 @@ async def show_like_task(callback: types.CallbackQuery):
     task_data.update(payload)
 
     # === NEW: агрегаты из логов, если в payload пусто/нули ===
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT
-            COALESCE(SUM(CASE WHEN status='ok'   THEN 1 ELSE 0 END), 0) AS likes_done,
-            COALESCE(SUM(CASE WHEN status='skip' THEN 1 ELSE 0 END), 0) AS skipped,
-            COALESCE(SUM(CASE WHEN status='fail' THEN 1 ELSE 0 END), 0) AS errors
-        FROM like_comments_log
-        WHERE task_id = %s
-    """, (task_id,))
-    agg = cur.fetchone() or (0, 0, 0)
-    cur.close(); conn.close()
+    counters = get_task_counters(task_id, "like")
+    agg = (counters.get("ok", 0), counters.get("skip", 0), counters.get("fail", 0))
 
     # если в payload этих полей нет или они 0 — подставим агрегацию
     task_data["likes_done"] = task_data.get("likes_done") or agg[0] or 0
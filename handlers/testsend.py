@@ -3,7 +3,8 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
 from app.db import get_account_by_id
-from app.telegram_client import get_client
+from app.telegram_client import lease_client
+from app.entity_cache import resolve_entity
 
 from telethon.errors import FloodWaitError, RPCError
 
@@ -62,25 +63,17 @@ async def test_send_message_to_group(account_id, group_username_or_link, text):
         if not acc:
             return "❗️ Аккаунт не найден."
 
-        proxy = {
-            "proxy_host": acc.get("proxy_host"),
-            "proxy_port": acc.get("proxy_port"),
-            "proxy_username": acc.get("proxy_username"),
-            "proxy_password": acc.get("proxy_password"),
-        } if acc.get("proxy_host") else None
-        client = await get_client(acc["session_string"], proxy)
-        await client.start()
-        try:
-            entity = await client.get_entity(group_username_or_link)
-            await client.send_message(entity, text)
-            result = "✅ Сообщение в группу отправлено успешно!"
-        except FloodWaitError as e:
-            result = f"❗️ FloodWait: попробуй через {e.seconds} секунд"
-        except RPCError as e:
-            result = f"❗️ Ошибка RPC: {e}"
-        except Exception as e:
-            result = f"❗️ Не удалось отправить: {e}"
-        await client.disconnect()
+        async with lease_client(account_id) as client:
+            try:
+                entity = await resolve_entity(client, group_username_or_link)
+                await client.send_message(entity, text)
+                result = "✅ Сообщение в группу отправлено успешно!"
+            except FloodWaitError as e:
+                result = f"❗️ FloodWait: попробуй через {e.seconds} секунд"
+            except RPCError as e:
+                result = f"❗️ Ошибка RPC: {e}"
+            except Exception as e:
+                result = f"❗️ Не удалось отправить: {e}"
     except Exception as e:
         result = f"❗️ Ошибка на этапе инициализации клиента: {e}"
     return result
@@ -1,16 +1,20 @@
 # handlers/twofa.py
 import asyncio
+import re
+from contextlib import AsyncExitStack
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from telethon.tl import functions
 from app.fsm.twofa_states import TwoFAStates
-from app.db import get_all_accounts, get_account_by_id, read_twofa_task, read_twofa_logs, create_twofa_task, count_twofa_logs
+from app.db import get_accounts_for_picker, get_accounts_connect_view, get_account_by_id, read_twofa_task, read_twofa_logs, create_twofa_task, count_twofa_logs
 from telethon import errors as tl_errors
+from app.telegram_client import lease_client
+from app.adaptive_limiter import get_limiter, is_overload_error, report_overload
 from .twofa_task_view import create_twofa_task_card
 from typing import List, Dict, Any, Set
 from aiogram.exceptions import TelegramBadRequest
-from app.db import get_account_groups_with_count   # добавь рядом с get_all_accounts
+from app.db import get_account_groups_with_count   # добавь рядом с get_accounts_for_picker
 
 # Исполнитель и создание записи задачи в БД подключим внутри хендлеров, чтобы избежать циклических импортов
 
@@ -122,7 +126,7 @@ def kb_confirm():
 async def twofa_from_tasks_menu(cb: CallbackQuery, state: FSMContext):
     await state.clear()
     await state.set_state(TwoFAStates.SELECT_ACCOUNTS)
-    accounts = get_all_accounts()
+    accounts = get_accounts_for_picker()
     groups = get_account_groups_with_count()   # ← НОВОЕ
     await state.update_data(accounts=accounts, selected_accounts=[], page=0)
     kb = accounts_picker_keyboard(accounts, set(), page=0, groups=groups)  # ← НОВОЕ
@@ -212,7 +216,7 @@ async def twofa_repeat(cb: CallbackQuery, state: FSMContext):
 async def twofa_entry(message: Message, state: FSMContext):
     await state.clear()
     await state.set_state(TwoFAStates.SELECT_ACCOUNTS)
-    accounts = get_all_accounts()
+    accounts = get_accounts_for_picker()
     groups = get_account_groups_with_count()   # ← НОВОЕ
     await state.update_data(accounts=accounts, selected_accounts=[], page=0)
     kb = accounts_picker_keyboard(accounts, set(), page=0, groups=groups)   # ← НОВОЕ
@@ -511,10 +515,9 @@ async def twofa_start(cb: CallbackQuery, state: FSMContext):
     # 2) Для исполнения: полный набор (session + proxy)
     accounts_runtime = []
 
-    for acc_id in selected_ids:
-        acc = get_account_by_id(acc_id)
-        if not acc:
-            continue
+    # один запрос на все выбранные аккаунты (session + прокси), а не get_account_by_id на каждый
+    for acc in get_accounts_connect_view(selected_ids):
+        acc_id = acc["id"]
 
         # в БД
         accounts_meta.append({
@@ -602,43 +605,9 @@ async def _run_twofa_inline(task_id: int,
 
     await _set_status("running", started=True)
 
-    # --- помощник: получить Telethon-клиент, работая с разными сигнатурами get_client ---
-    async def _get_client_for_account(acc: dict):
-        from app.telegram_client import get_client as _gc
-
-        session_string = acc.get("session_string")
-        if not session_string:
-            raise RuntimeError("session_string is empty for account")
-
-        proxy = None
-        if acc.get("proxy_host"):
-            proxy = {
-                "proxy_host": acc.get("proxy_host"),
-                "proxy_port": acc.get("proxy_port"),
-                "proxy_username": acc.get("proxy_username"),
-                "proxy_password": acc.get("proxy_password"),
-            }
-
-        # Предполагаем сигнатуру get_client(session_string, proxy)
-        client = _gc(session_string, proxy)
-        if asyncio.iscoroutine(client):
-            client = await client
-
-        try:
-            await client.start()
-        except Exception:
-            try:
-                await client.connect()
-            except Exception:
-                pass
-
-        return client
-
-
     ok_count = 0
     total = len(accounts)
-    per_batch = 5
-    processed = 0
+    limiter = get_limiter("twofa", initial=5, max_limit=20, latency_target_sec=20)
 
     # Для итогового локального лога на случай, если в БД логов нет
     local_lines = []
@@ -654,8 +623,9 @@ async def _run_twofa_inline(task_id: int,
             await _log_row(acc_id, username, False, removed, msg)
             return False
         
+        lease = AsyncExitStack()
         try:
-            client = await _get_client_for_account(acc)
+            client = await lease.enter_async_context(lease_client(acc_id))
             print(f"[2FA] [{username}] client ready")
 
             # 👇 только если режим не "none" — трогаем 2FA
@@ -674,11 +644,6 @@ async def _run_twofa_inline(task_id: int,
                 removed = True
                 print(f"[2FA] [{username}] other sessions RESET")
 
-            try:
-                await client.disconnect()
-            except Exception:
-                pass
-
             await _log_row(acc_id, username, True, removed, "ok")
             local_lines.append(f"{username}: OK removed={removed}")
             return True
@@ -718,22 +683,22 @@ async def _run_twofa_inline(task_id: int,
                 else:
                     user_friendly = "Слишком частые изменения 2FA. Подождите и повторите попытку."
 
-            # 3) Парсим текст ошибки, если user_friendly всё ещё None
+            # 3) FloodWait, обёрнутый в другую ошибку: секунды берём из текста пойманной ошибки
             if user_friendly is None:
                 err_text = str(e)
-                # Парсим "A wait of X seconds is required..."
-                if "A wait of" in err_text and "seconds is required" in err_text and "UpdatePasswordSettingsRequest" in err_text:
-                    import re
-                    match = re.search(r"A wait of (\d+) seconds is required", err_text)
-                    if match:
-                        secs = int(match.group(1))
-                        mins = round(secs / 60)
-                        user_friendly = f"Слишком много попыток, повторите попытку смены пароля через {secs} секунд(ы). (~{mins} мин.)"
+                match = re.search(r"A wait of (\d+) seconds is required", err_text)
+                if match and "UpdatePasswordSettingsRequest" in err_text:
+                    secs = int(match.group(1))
+                    mins = round(secs / 60)
+                    user_friendly = f"Слишком много попыток, повторите попытку смены пароля через {secs} секунд(ы). (~{mins} мин.)"
 
                 # Парсим "The password ... you entered is invalid..."
                 elif "The password (and thus its hash value) you entered is invalid" in err_text and "UpdatePasswordSettingsRequest" in err_text:
                     user_friendly = "Введён неверный старый пароль, уточните пароль у Вашего продавца и попробуйте снова."
 
+            if is_overload_error(e):
+                report_overload(e)
+
             # Если не распознали — оставим оригинальный текст
             msg = user_friendly or str(e)
 
@@ -741,24 +706,18 @@ async def _run_twofa_inline(task_id: int,
             await _log_row(acc_id, username, False, removed, msg)
             local_lines.append(f"{username}: ERR removed={removed} | {msg}")
             return False
+        finally:
+            await lease.aclose()  # клиент возвращается в пул
 
-    # --- батч-параллель ---
-    for i in range(0, total, per_batch):
-        batch = accounts[i:i+per_batch]
-        results = await asyncio.gather(*[_handle_one(a) for a in batch], return_exceptions=False)
-        ok_count += sum(1 for r in results if r)
-        processed = min(i + per_batch, total)
-        #try:
-            #await progress_msg.edit_text(
-                #f"🔐 Задача 2FA #{task_id}\n"
-                #f"Прогресс: {processed}/{total}\n"
-                #f"Успешно: {ok_count}, Ошибок: {processed - ok_count}"
-            #)
-        #except Exception:
-            #pass
+    # --- параллель: лимит подстраивается под FloodWait/таймауты ---
+    results = await asyncio.gather(*[limiter.run(_handle_one, a) for a in accounts], return_exceptions=False)
+    ok_count = sum(1 for r in results if r)
+    print(f"[2FA] task#{task_id} limiter: {limiter.stats()}")
 
     status = "done" if ok_count == total else ("error" if ok_count == 0 else "done")
     await _set_status(status, finished=True)
+    from app import log_sink
+    await log_sink.flush()  # add_twofa_log буферизуется — дописываем перед чтением логов
     print(f"[2FA] DONE task#{task_id} ok={ok_count}/{total} status={status}")
 
     # Попробуем вытащить логи/шапку из БД; если нет – пошлём локальный лог
@@ -28,15 +28,59 @@ def _safe_int(v, default=0):
     except Exception:
         return default
 
-def accounts_list_keyboard(accounts, page: int = 1, page_size: int = PAGE_SIZE) -> InlineKeyboardMarkup:
+def load_accounts_page(page: int = 1, mode: str | None = None, cursor: int | None = None,
+                       page_size: int = PAGE_SIZE):
     """
-    Рисует клавиатуру со списком аккаунтов и пагинацией.
-    accounts: list[dict] (поля id, phone, username, status)
+    Одна страница списка через keyset-пагинацию + COUNT(*).
+    mode: None — первая страница, "a" — после cursor, "b" — до cursor, "l" — последняя.
+    Возвращает (accounts, page, total).
     """
-    # 🔽 ключевая строка — сортируем по id по возрастанию
-    accounts_sorted = sorted(accounts, key=lambda a: _safe_int(a.get("id"), 0))
+    from app.db import count_accounts, get_accounts_page
+
+    total = count_accounts()
+    pages = max(1, ceil(total / page_size)) if total else 1
+    page = max(1, min(page, pages))
+
+    if mode == "a" and cursor is not None:
+        items = get_accounts_page(page_size, after_id=cursor)
+    elif mode == "b" and cursor is not None:
+        items = get_accounts_page(page_size, before_id=cursor)
+    elif mode == "l":
+        items = get_accounts_page(total - (pages - 1) * page_size or page_size, last=True)
+    else:
+        items, page = None, 1
+
+    if not items:
+        # первая страница или курсор «уехал» (аккаунты удалили) — начинаем сначала
+        items, page = get_accounts_page(page_size), 1
+    return items, page, total
+
 
-    page_items, page, pages, total = _slice_page(accounts_sorted, page, page_size)
+def parse_page_callback(data: str):
+    """accpg:<page>[:a|b:<id> | :l] -> (page, mode, cursor)."""
+    parts = data.split(":")
+    page = int(parts[1])
+    mode = parts[2] if len(parts) > 2 else None
+    cursor = int(parts[3]) if len(parts) > 3 else None
+    return page, mode, cursor
+
+
+def accounts_list_keyboard(accounts, page: int = 1, page_size: int = PAGE_SIZE,
+                           total: int | None = None) -> InlineKeyboardMarkup:
+    """
+    Рисует клавиатуру со списком аккаунтов и пагинацией.
+    accounts: list[dict] (поля id, phone, username, status) — уже выбранная
+    страница (load_accounts_page), тогда передаётся total; без total
+    считается, что пришёл весь список, и страница режется в Python.
+    """
+    if total is None:
+        # 🔽 ключевая строка — сортируем по id по возрастанию
+        accounts_sorted = sorted(accounts, key=lambda a: _safe_int(a.get("id"), 0))
+        page_items, page, pages, total = _slice_page(accounts_sorted, page, page_size)
+    else:
+        page_items = list(accounts)
+        pages = max(1, ceil(total / page_size)) if total else 1
+        page = max(1, min(page, pages))
     kb = []
 
     for acc in page_items:
@@ -53,12 +97,14 @@ def accounts_list_keyboard(accounts, page: int = 1, page_size: int = PAGE_SIZE)
 
         kb.append([InlineKeyboardButton(text=label, callback_data=f"account_{acc_id}")])
 
-    if pages > 1:
+    if pages > 1 and page_items:
+        first_id = page_items[0].get("id")
+        last_id = page_items[-1].get("id")
         nav_row = []
         if page > 1:
             nav_row += [
                 InlineKeyboardButton(text="⏮️", callback_data="accpg:1"),
-                InlineKeyboardButton(text="⬅️", callback_data=f"accpg:{page-1}")
+                InlineKeyboardButton(text="⬅️", callback_data=f"accpg:{page-1}:b:{first_id}")
             ]
         else:
             nav_row += [
@@ -68,8 +114,8 @@ def accounts_list_keyboard(accounts, page: int = 1, page_size: int = PAGE_SIZE)
         nav_row.append(InlineKeyboardButton(text=f"{page}/{pages}", callback_data="noop"))
         if page < pages:
             nav_row += [
-                InlineKeyboardButton(text="➡️", callback_data=f"accpg:{page+1}"),
-                InlineKeyboardButton(text="⏭️", callback_data=f"accpg:{pages}")
+                InlineKeyboardButton(text="➡️", callback_data=f"accpg:{page+1}:a:{last_id}"),
+                InlineKeyboardButton(text="⏭️", callback_data=f"accpg:{pages}:l")
             ]
         else:
             nav_row += [
@@ -22,6 +22,8 @@ def proxy_list_keyboard(proxies):
             status_emoji = "❔"
 
         label = f"{host}:{port} ({accounts_count} акк) {status_emoji}"
+        if proxy.get("avg_connect_ms") is not None:
+            label += f" {(proxy['avg_connect_ms'] or 0) + (proxy.get('avg_handshake_ms') or 0):.0f}ms"
 
         keyboard.append([
             InlineKeyboardButton(
@@ -39,6 +41,9 @@ def proxy_list_keyboard(proxies):
             InlineKeyboardButton(text="✅ Проверить все", callback_data="check_all_proxies"),
             InlineKeyboardButton(text="🗑 Удалить плохие", callback_data="confirm_delete_bad_proxies"),
         ])
+        keyboard.append([
+            InlineKeyboardButton(text="⚡ Перепривязать аккаунты к быстрым", callback_data="auto_rebind_proxies"),
+        ])
 
     keyboard.append([
         InlineKeyboardButton(text="⬅️ Назад", callback_data="menu_proxies")
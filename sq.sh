@@ -47,4 +47,10 @@ EXCEPTION
 END$$;
 SQL
 
+# 3) Остальную схему (колонки статистики прокси и очереди задач, кеши entity/group_metadata/поиска,
+#    task_counters с триггерами на логах, индексы горячих путей) накатывает app/migrations.py,
+#    версии — в schema_migrations.
+#    Таблицы и колонки — при старте bot.py/worker.py, индексы (CREATE INDEX CONCURRENTLY) — в фоне.
+#    Шагом деплоя: python -m app.migrations; проверка планов без Seq Scan: python -m app.migrations --check
+
 echo "✅ Migration applied."
\ No newline at end of file
@@ -0,0 +1,148 @@
+# 🛠 Процессы-исполнители задач (без polling'а Bot API)
+#
+#   python worker.py                 — поднимает WORKER_SHARDS процессов (шарды 0..N-1) и следит за ними
+#   python worker.py --shard 2       — один процесс шарда 2 из WORKER_SHARDS (для отдельных контейнеров)
+#
+# Каждый процесс держит свой event loop, пул БД и пул Telethon-клиентов и берёт из
+# очереди только задачи своего шарда (job_shard % N == i) — MTProto-шифрование делится
+# по ядрам. Задача на несколько аккаунтов может задеть аккаунты «чужих» шардов, поэтому
+# эксклюзивность держит не шардирование, а пул клиентов: подключённый аккаунт закреплён
+# за процессом advisory lock'ом в БД (app/telegram_client.py), в том числе против бота.
+
+import os
+import sys
+import signal
+import asyncio
+import logging
+import argparse
+import time
+import multiprocessing as mp
+from multiprocessing.connection import wait
+
+from aiogram import Bot
+from aiogram.enums import ParseMode
+from aiogram.client.default import DefaultBotProperties
+
+from config import BOT_TOKEN, WORKER_SHARDS
+
+logging.getLogger("asyncio").setLevel(logging.CRITICAL)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+log = logging.getLogger("worker")
+
+RESTART_DELAY_SEC = 5
+
+
+async def run_shard(shard_index: int, shard_count: int) -> None:
+    # импортируем здесь: в процессе-супервизоре пулы и хендлеры не нужны
+    import handlers  # noqa: F401 — регистрирует job'ы в app.task_queue
+    from app.db import init_db_pool, close_db_pool
+    from app import db_async, log_sink, task_queue
+    from app.migrations import apply_migrations
+    from app.telegram_client import close_client_pool
+
+    pool = init_db_pool()
+    log.info("🗄 [shard %d/%d] DB pool ready: %s", shard_index, shard_count, pool.stats())
+    await log_sink.start()
+    # схема нужна очереди сразу; индексы строит bot.py (или деплой: python -m app.migrations)
+    for line in await db_async.run(apply_migrations, indexes=False):
+        log.info("🗄 [shard %d/%d] %s", shard_index, shard_count, line)
+
+    # Bot нужен job'ам только для отправки/правки сообщений — polling делает bot.py
+    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    try:
+        queue = await task_queue.start(bot, shard_index=shard_index, shard_count=shard_count)
+        log.info("📥 [shard %d/%d] task queue started: %s", shard_index, shard_count, queue.stats())
+        await stop_event.wait()
+    finally:
+        await task_queue.stop()  # незавершённые job'ы вернутся в очередь
+        await close_client_pool()
+        await log_sink.stop()
+        await bot.session.close()
+        db_async.shutdown()
+        close_db_pool()
+        log.info("👋 [shard %d/%d] stopped", shard_index, shard_count)
+
+
+def _shard_main(shard_index: int, shard_count: int) -> None:
+    asyncio.run(run_shard(shard_index, shard_count))
+
+
+def supervise(shard_count: int) -> None:
+    """Запускает по процессу на шард и перезапускает упавшие, пока не придёт SIGTERM/SIGINT."""
+    ctx = mp.get_context("spawn")
+    procs: dict[int, mp.Process] = {}
+    stopping = False
+
+    def _stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+
+    def _spawn(i: int) -> None:
+        p = ctx.Process(target=_shard_main, args=(i, shard_count), name=f"worker-{i}", daemon=False)
+        p.start()
+        procs[i] = p
+        log.info("🚀 shard %d/%d started (pid=%s)", i, shard_count, p.pid)
+
+    for i in range(shard_count):
+        _spawn(i)
+
+    restart_at: dict[int, float] = {}
+    while not stopping:
+        now = time.monotonic()
+        for i, p in list(procs.items()):
+            if p.is_alive():
+                continue
+            if i not in restart_at:
+                log.warning("⚠️ shard %d exited with code %s — restart in %ds", i, p.exitcode, RESTART_DELAY_SEC)
+                restart_at[i] = now + RESTART_DELAY_SEC
+            elif now >= restart_at[i]:
+                del restart_at[i]
+                _spawn(i)
+        alive = [p.sentinel for p in procs.values() if p.is_alive()]
+        if alive:
+            wait(alive, timeout=1.0)
+        else:
+            time.sleep(1.0)
+
+    log.info("⏹ stopping %d shard(s)…", len(procs))
+    for p in procs.values():
+        if p.is_alive():
+            p.terminate()  # SIGTERM → shard отпускает аренды и закрывает клиентов
+    for p in procs.values():
+        p.join(timeout=30)
+        if p.is_alive():
+            p.kill()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Task queue worker processes")
+    parser.add_argument("--shard", type=int, default=os.getenv("WORKER_INDEX"),
+                        help="номер шарда (0..N-1); без него поднимаются все N процессов")
+    parser.add_argument("--shards", type=int, default=WORKER_SHARDS or 1,
+                        help="всего шардов (по умолчанию WORKER_SHARDS)")
+    args = parser.parse_args(argv)
+
+    shard_count = max(1, int(args.shards))
+    if args.shard is not None:
+        shard_index = int(args.shard)
+        if not 0 <= shard_index < shard_count:
+            sys.exit(f"--shard must be in 0..{shard_count - 1}")
+        _shard_main(shard_index, shard_count)
+    else:
+        supervise(shard_count)
+
+
+if __name__ == "__main__":
+    main()